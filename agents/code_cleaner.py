@@ -1,18 +1,30 @@
-from langchain.chat_models import ChatOpenAI
 from langchain.schema import SystemMessage, HumanMessage
+from agents.llm_backend import get_llm
+from agents.llm_cache import cached_invoke, response_key
+from agents.local_cleaner import CleaningFailed, local_clean
 import os
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Access the API key
-api_key = os.getenv("OPENAI_API_KEY")
+# hosted model or local llama.cpp model, per LLM_BACKEND
+llm = get_llm(temperature=0.2)
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, openai_api_key=api_key)
+def clean_code(code: str, syntax_error: str = None) -> dict:
+    # most generated scripts only need fences stripped and imports added, which the
+    # local pass does in milliseconds; the LLM cleaner handles the rest, including
+    # scripts whose syntax error the codegen stream check already found
+    if syntax_error:
+        print(f"Syntax error found during generation ({syntax_error}), cleaning with LLM")
+    else:
+        try:
+            cleaned = local_clean(code)
+            print("Code cleaned locally")
+            return {"clean_code": cleaned}
+        except CleaningFailed as e:
+            print(f"Local cleaning failed ({e}), cleaning with LLM")
 
-def clean_code(code: str) -> dict:
-    
     messages = [
         SystemMessage(content="You are a Python code formatter. " \
         "Clean and organize the following code, add any missing imports like: from ta.trend import SMAIndicator" \
@@ -26,9 +38,37 @@ def clean_code(code: str) -> dict:
         "- Always ensure the variables being subtracted are datetime objects, not integers or strings"\
         "- If the dates come from a DataFrame index, confirm the index is a DatetimeIndex. If needed, convert using: df.index = pd.to_datetime(df.index)"\
         "- If this is not taken care of then we get error: AttributeError: 'numpy.int64' object has no attribute 'days'"),
-        HumanMessage(content=code)
+        HumanMessage(content=f"Syntax error at {syntax_error}\n\n{code}" if syntax_error else code)
     ]
     
-    response = llm.invoke(messages)
+    response = cached_invoke(llm, messages, stage="cleaner")
     print("Code cleaned using LLM:", response.content)
-    return {"clean_code": response.content}
\ No newline at end of file
+    keys = [response_key(llm, messages)]
+    try:
+        # strip any fences or prose the LLM added back in
+        return {"clean_code": local_clean(response.content), "cache_keys": keys}
+    except CleaningFailed:
+        return {"clean_code": response.content, "cache_keys": keys}
+
+def repair_code(code: str, error: str) -> dict:
+    """
+    Ask the LLM to fix a script that failed pre-execution validation.
+    """
+    messages = [
+        SystemMessage(content="You are a Python code fixer. " \
+        "The following trading script failed validation before it was run. Fix the reported problem and anything else that would break in the same way, "
+        "keeping the strategy logic, output files and printed output unchanged. "
+        "Only use pandas, numpy, ta, plotly and the marketdata/backtest/tasks helpers the script already imports. "
+        "Replace Series.append()/DataFrame.append() with pd.concat. Make sure date differences are taken between datetime values. "
+        "Make sure every list assigned to a DataFrame column has exactly len(DataFrame) elements. "
+        "Return only executable python code: no comments, no markdown and no code fences."),
+        HumanMessage(content=f"Validation error:\n{error}\n\nScript:\n{code}")
+    ]
+
+    response = cached_invoke(llm, messages, stage="repair")
+    print("Code repaired using LLM:", response.content)
+    keys = [response_key(llm, messages)]
+    try:
+        return {"clean_code": local_clean(response.content), "cache_keys": keys}
+    except CleaningFailed:
+        return {"clean_code": response.content, "cache_keys": keys}
@@ -0,0 +1,157 @@
+import ast
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from marketdata.columnar import load_prices, write_columnar
+from marketdata.snapshot import SNAPSHOT_PRICES, snapshot_env
+from tasks.script_output import EVENT_PREFIX
+from tasks.worker_pool import WARM_POOL_ENABLED, get_pool
+from tracing import span
+
+# Fast checks of a cleaned script before it is queued for execution: static AST
+# checks for the mistakes generated scripts keep making, then a dry run against the
+# last DRY_RUN_ROWS bars of each ticker in the run's snapshot. A script that fails
+# costs a few seconds here and is sent back to the LLM for repair, instead of
+# failing (or timing out) on a Celery worker after a full run.
+VALIDATE_DRY_RUN = os.getenv("VALIDATE_DRY_RUN", "1") == "1"
+DRY_RUN_ROWS = int(os.getenv("DRY_RUN_ROWS", "300"))
+DRY_RUN_TIMEOUT = int(os.getenv("DRY_RUN_TIMEOUT", "20"))  # seconds
+DRY_RUN_OUTPUT_LINES = 30  # tail of the output kept as the error for the repair prompt
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# top-level modules a generated script may import
+ALLOWED_IMPORTS = {
+    "pandas", "numpy", "ta", "plotly", "math", "datetime", "warnings", "json", "os",
+    "time", "collections", "itertools", "functools", "statistics", "typing",
+    "marketdata", "backtest", "tasks",
+}
+# attribute calls that are known to break: name -> why
+BANNED_CALLS = {
+    "add_all_ta_features": "ta.add_all_ta_features is not needed and raises on this data",
+    "read_sql": "prices must be loaded with marketdata.columnar.load_prices, not read_sql",
+    "download": "no data may be downloaded; use marketdata.columnar.load_prices",
+}
+# calls whose result is a pandas object (no .append() since pandas 2.0)
+PANDAS_FACTORIES = {"Series", "DataFrame", "concat", "dropna", "rolling", "shift", "pct_change"}
+
+# -----------------------------
+# Static checks
+# -----------------------------
+def _call_name(node) -> str:
+    func = node.func if isinstance(node, ast.Call) else None
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    if isinstance(func, ast.Name):
+        return func.id
+    return None
+
+def _root_name(node) -> str:
+    while isinstance(node, (ast.Subscript, ast.Attribute)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+def _pandas_names(tree: ast.AST) -> set:
+    # names assigned the result of a call that returns a pandas object
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and _call_name(node.value) in PANDAS_FACTORIES:
+            names.update(t.id for t in node.targets if isinstance(t, ast.Name))
+    return names
+
+def static_errors(code: str) -> list:
+    """
+    Problems found without running the script; empty if none.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [f"SyntaxError at line {e.lineno}: {e.msg}"]
+
+    errors = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""] if not node.level else []
+        else:
+            modules = []
+        for module in modules:
+            if module.split(".")[0] not in ALLOWED_IMPORTS:
+                errors.append(f"Line {node.lineno}: import of {module} is not allowed")
+
+    pandas_names = _pandas_names(tree)
+    for node in ast.walk(tree):
+        name = _call_name(node)
+        if name in BANNED_CALLS:
+            errors.append(f"Line {node.lineno}: {BANNED_CALLS[name]}")
+        elif name == "append" and isinstance(node.func, ast.Attribute):
+            if _root_name(node.func.value) in pandas_names:
+                errors.append(f"Line {node.lineno}: Series/DataFrame.append() was removed in pandas 2.0; use pd.concat")
+
+    if not any(_call_name(node) == "load_prices" for node in ast.walk(tree)):
+        errors.append("The script never calls marketdata.columnar.load_prices(), so it reads no data")
+    return errors
+
+# -----------------------------
+# Dry run
+# -----------------------------
+def _slice_prices(data_snapshot: str, root: str) -> str:
+    # the last DRY_RUN_ROWS bars of every ticker, as a columnar cache under root
+    prices = load_prices(path=os.path.join(data_snapshot, SNAPSHOT_PRICES), mmap=False)
+    frames = [df.tail(DRY_RUN_ROWS).reset_index().assign(Ticker=ticker) for ticker, df in prices.items()]
+    return write_columnar(pd.concat(frames, ignore_index=True), os.path.join(root, SNAPSHOT_PRICES))
+
+def _tail(output: bytes) -> str:
+    # the traceback and what the script printed before it, without structured events
+    lines = [l for l in output.decode(errors="replace").rstrip().splitlines() if not l.startswith(EVENT_PREFIX)]
+    return "\n".join(lines[-DRY_RUN_OUTPUT_LINES:])
+
+def dry_run(code: str, data_snapshot: str):
+    """
+    Run the script on a slice of the snapshot in a scratch directory; returns the
+    tail of its output if it fails or times out, else None.
+    """
+    root = tempfile.mkdtemp(prefix="dry_run_")
+    try:
+        env = dict(snapshot_env(os.path.abspath(data_snapshot)), MARKET_DATA_DIR=_slice_prices(data_snapshot, root))
+        filename = os.path.join(root, "script.py")
+        with open(filename, "w") as f:
+            f.write(code)
+        out_dir = os.path.join(root, "out")
+        os.makedirs(out_dir)
+
+        if WARM_POOL_ENABLED:
+            get_pool().run(filename, env, timeout=DRY_RUN_TIMEOUT, cwd=out_dir)
+        else:
+            run_env = os.environ.copy()
+            run_env["PYTHONPATH"] = os.pathsep.join(p for p in [REPO_ROOT, run_env.get("PYTHONPATH")] if p)
+            run_env.update(env)
+            subprocess.run([sys.executable, filename], env=run_env, cwd=out_dir, timeout=DRY_RUN_TIMEOUT,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+        return None
+    except subprocess.CalledProcessError as e:
+        return _tail(e.output or b"")
+    except subprocess.TimeoutExpired:
+        return f"The script did not finish within {DRY_RUN_TIMEOUT}s on {DRY_RUN_ROWS} bars per ticker"
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def validate_code(code: str, data_snapshot: str = None):
+    """
+    Static checks, then (with a snapshot and VALIDATE_DRY_RUN) a dry run.
+    Returns a description of what is wrong, or None if the script looks runnable.
+    """
+    with span("validate.static"):
+        errors = static_errors(code)
+    if errors:
+        return "\n".join(errors)
+    if data_snapshot and VALIDATE_DRY_RUN:
+        with span("validate.dry_run", rows=DRY_RUN_ROWS):
+            return dry_run(code, data_snapshot)
+    return None
@@ -1,5 +1,6 @@
-from langchain.chat_models import ChatOpenAI
 from langchain.schema import SystemMessage, HumanMessage
+from agents.llm_backend import get_llm
+from agents.llm_cache import cached_invoke
 import datetime
 from dotenv import load_dotenv
 import os
@@ -7,15 +8,10 @@ import os
 # Load environment variables from .env file
 load_dotenv()
 
-# Access the API key
-api_key = os.getenv("OPENAI_API_KEY")
+# hosted model or local llama.cpp model, per LLM_BACKEND
+llm = get_llm(temperature=0.2)
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2, openai_api_key=api_key)
-
-def interpret_query(query: str) -> dict:
-    today = datetime.date.today().isoformat()
-
-    prompt = f"""
+INTERPRETER_RULES = """
 You are a trading query interpreter. Parse the user's query into structured JSON. 
 
 Always extract buy and sell conditions as logical groups with 'and' / 'or' logic.
@@ -30,22 +26,22 @@ Use the following schema for each condition:
 Example:
 Input: "Buy when MACD is positive and RSI between 40 and 60, sell when MACD is negative or 15% profit"
 Output:
-{{
-  "buy_condition": {{
+{
+  "buy_condition": {
     "logic": "and",
     "conditions": [
-      {{"indicator": "MACD", "operator": ">", "value": 0}},
-      {{"indicator": "RSI", "operator": "between", "min": 40, "max": 60}}
+      {"indicator": "MACD", "operator": ">", "value": 0},
+      {"indicator": "RSI", "operator": "between", "min": 40, "max": 60}
     ]
-  }},
-  "sell_condition": {{
+  },
+  "sell_condition": {
     "logic": "or",
     "conditions": [
-      {{"indicator": "MACD", "operator": "<", "value": 0}},
-      {{"indicator": "Price", "operator": ">", "value": 15, "value_type": "percent"}}
+      {"indicator": "MACD", "operator": "<", "value": 0},
+      {"indicator": "Price", "operator": ">", "value": 15, "value_type": "percent"}
     ]
-  }}
-}}
+  }
+}
 
 Please return a JSON object containing the following:
 - "ticker": Identify the Company names given in the query. Do not return ticker symbols. Just return the company names as mentioned in the query. 
@@ -68,8 +64,15 @@ Default rule mapping:
   - Bollinger Bands → Buy: Price < Lower Band, Sell: Price > Upper Band
 If strategy is unknown and no rules are given, leave both conditions empty but do NOT invent unrelated indicators.
 
-- "start_date": Use today's date={today} for reference for date calculations. This should be a date value. Interpret and calculate based on query what is the start date of range for which data is needed.
-- "end_date": Use today's date={today} for reference for date calculations. This should be a date value. Interpret and calculate based on query what is the end date of range for which data is needed.
+- "portfolio": Only when the user asks to backtest the companies together as one portfolio
+  (shared capital, allocation across stocks, rebalancing). Otherwise omit this key.
+  An object with:
+  + "sizing": "equal" (split equity across open positions, default) or "fixed"
+  + "position_size": percent of equity per position (only for "fixed")
+  + "rebalance": "signal" (default), "daily", "weekly" or "monthly"
+
+- "start_date": Use today's date (given at the end) for reference for date calculations. This should be a date value. Interpret and calculate based on query what is the start date of range for which data is needed.
+- "end_date": Use today's date (given at the end) for reference for date calculations. This should be a date value. Interpret and calculate based on query what is the end date of range for which data is needed.
 
 - IMP: Calculation and setting of start_date and end_date is very important. Do not just output the string explained above. Calculate the dates. 
   For example, if query contains "past 2 years" then get start_date=(today - 2 years), end_date=(today). 
@@ -96,6 +99,14 @@ To summarize:
 - If strategy is unknown and no rules are given, leave conditions empty (do NOT hallucinate).
 - When user specifies returns or stop-loss in percentage terms (e.g., "15% profit", "10% stop-loss"), include a "value_type": "percent" field in the condition JSON. 
   Default to absolute price (no value_type) if no percentage is mentioned.
+"""
+
+def interpret_query(query: str) -> dict:
+    today = datetime.date.today().isoformat()
+
+    # static rules first (a cacheable prefix), then the per-query part
+    prompt = f"""{INTERPRETER_RULES}
+Today's date: {today}
 
 The user has provided the following backtest query:
 
@@ -112,5 +123,5 @@ The user has provided the following backtest query:
         ),
         HumanMessage(content=prompt)
     ]
-    response = llm.invoke(messages)
+    response = cached_invoke(llm, messages, stage="interpreter")
     return {"intent": response.content}
\ No newline at end of file
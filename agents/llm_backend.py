@@ -0,0 +1,184 @@
+import os
+import queue
+import threading
+
+from dotenv import load_dotenv
+from langchain.schema import AIMessage, AIMessageChunk
+
+# Pluggable LLM backend for the agents. LLM_BACKEND=openai (the default) uses the
+# hosted chat model; LLM_BACKEND=llama runs the GGUF model described by
+# models/mistral.yaml on CPU through llama-cpp-python, with no network calls or
+# provider rate limits. Both return objects with invoke()/stream(), which is all
+# agents.llm_cache needs.
+load_dotenv()
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+LLAMA_MODEL_CONFIG = os.getenv("LLAMA_MODEL_CONFIG", os.path.join("models", "mistral.yaml"))
+LLAMA_MODEL_PATH = os.getenv("LLAMA_MODEL_PATH")  # overrides parameters.model from the config
+LLAMA_N_CTX = int(os.getenv("LLAMA_N_CTX", "0"))  # 0: context_size from the config, else 4096
+LLAMA_N_THREADS = int(os.getenv("LLAMA_N_THREADS", "0"))  # 0: threads from the config, else all cores
+LLAMA_MAX_TOKENS = int(os.getenv("LLAMA_MAX_TOKENS", "2048"))
+LLAMA_CACHE_BYTES = int(os.getenv("LLAMA_CACHE_BYTES", str(2 << 30)))  # KV states kept for prefix reuse
+LLAMA_QUEUE_GROUP = int(os.getenv("LLAMA_QUEUE_GROUP", "8"))  # queued requests reordered together
+LLAMA_QUEUE_WAIT = float(os.getenv("LLAMA_QUEUE_WAIT", "0.005"))  # seconds to wait for more requests
+
+# Mistral instruct format; the tokenizer adds the <s> BOS token itself
+PROMPT_TEMPLATE = "[INST] {prompt} [/INST]"
+STOP = ["</s>", "[INST]"]
+
+def load_model_config(path: str = LLAMA_MODEL_CONFIG) -> dict:
+    """
+    Model settings from a LocalAI-style YAML config (name, parameters.model, context_size, threads).
+    """
+    # PyYAML is only needed by the local backend, like llama-cpp-python
+    import yaml
+
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    parameters = config.get("parameters") or {}
+    model = LLAMA_MODEL_PATH or parameters.get("model")
+    if not model:
+        raise ValueError(f"{path} does not name a model file")
+    if not os.path.isabs(model):
+        model = os.path.join(os.path.dirname(path), model)
+    return {
+        "name": config.get("name") or os.path.splitext(os.path.basename(model))[0],
+        "model_path": model,
+        "n_ctx": LLAMA_N_CTX or int(config.get("context_size") or 4096),
+        "n_threads": LLAMA_N_THREADS or int(config.get("threads") or os.cpu_count() or 1),
+    }
+
+# -----------------------------
+# Local llama.cpp engine
+# -----------------------------
+class _Request:
+    def __init__(self, prompt: str, temperature: float, max_tokens: int):
+        self.prompt = prompt
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.chunks = queue.Queue()  # text pieces, then None (or the exception raised)
+
+class LlamaEngine:
+    """
+    One llama.cpp model shared by every agent in the process, behind a request
+    queue served by a single thread. This is not batched inference: the model
+    decodes one sequence at a time, and requests run one after another. Requests
+    that arrive together (e.g. a batch's concurrent interpreter calls) are taken
+    off the queue as a group and run in prompt order, so prompts sharing a static
+    prefix run back to back and each reuses the previous one's KV state for that
+    prefix. A RAM cache of KV states keeps the prefixes of the other stages
+    (interpreter vs codegen) warm between groups.
+    """
+    def __init__(self, config: dict):
+        from llama_cpp import Llama, LlamaRAMCache
+
+        self.config = config
+        self.model = Llama(
+            model_path=config["model_path"],
+            n_ctx=config["n_ctx"],
+            n_threads=config["n_threads"],
+            verbose=False,
+        )
+        self.model.set_cache(LlamaRAMCache(capacity_bytes=LLAMA_CACHE_BYTES))
+        self.requests = queue.Queue()
+        threading.Thread(target=self._serve, name="llama-engine", daemon=True).start()
+
+    def submit(self, prompt: str, temperature: float, max_tokens: int = LLAMA_MAX_TOKENS) -> _Request:
+        request = _Request(prompt, temperature, max_tokens)
+        self.requests.put(request)
+        return request
+
+    def _next_group(self) -> list:
+        group = [self.requests.get()]
+        while len(group) < LLAMA_QUEUE_GROUP:
+            try:
+                group.append(self.requests.get(timeout=LLAMA_QUEUE_WAIT))
+            except queue.Empty:
+                break
+        return group
+
+    def _serve(self):
+        while True:
+            # sorting puts prompts with the longest common prefixes next to each other
+            for request in sorted(self._next_group(), key=lambda r: r.prompt):
+                self._generate(request)
+
+    def _generate(self, request: _Request):
+        try:
+            for chunk in self.model.create_completion(
+                request.prompt,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                stop=STOP,
+                stream=True,
+            ):
+                request.chunks.put(chunk["choices"][0]["text"])
+            request.chunks.put(None)
+        except Exception as e:
+            request.chunks.put(e)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> LlamaEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LlamaEngine(load_model_config())
+        return _engine
+
+class LocalChatModel:
+    """
+    Chat-model interface (invoke/stream over langchain messages) on the shared LlamaEngine.
+    Neither the config nor the model is read before the first use, so agent
+    modules can be imported without them.
+    """
+    def __init__(self, temperature: float = 0.2, max_tokens: int = LLAMA_MAX_TOKENS):
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self._model_name = None
+
+    @property
+    def model_name(self) -> str:
+        if self._model_name is None:
+            self._model_name = f"llama:{load_model_config()['name']}"
+        return self._model_name
+
+    @staticmethod
+    def render(messages) -> str:
+        # Mistral has no system role: system and user text go into one instruction,
+        # static system text first so it is part of the reusable prefix
+        return PROMPT_TEMPLATE.format(prompt="\n\n".join(m.content for m in messages))
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(get_engine().model.tokenize(text.encode(), add_bos=False))
+
+    def stream(self, messages):
+        request = get_engine().submit(self.render(messages), self.temperature, self.max_tokens)
+        while True:
+            piece = request.chunks.get()
+            if piece is None:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield AIMessageChunk(content=piece)
+
+    def invoke(self, messages) -> AIMessage:
+        return AIMessage(content="".join(chunk.content for chunk in self.stream(messages)))
+
+# -----------------------------
+# Backend selection
+# -----------------------------
+def get_llm(temperature: float = 0.2):
+    """
+    The chat model for an agent, from the configured LLM_BACKEND.
+    """
+    if LLM_BACKEND == "llama":
+        return LocalChatModel(temperature=temperature)
+    if LLM_BACKEND != "openai":
+        raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+    from langchain.chat_models import ChatOpenAI
+
+    return ChatOpenAI(model=OPENAI_MODEL, temperature=temperature, openai_api_key=os.getenv("OPENAI_API_KEY"))
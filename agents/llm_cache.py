@@ -0,0 +1,232 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from langchain.schema import AIMessage
+
+from tracing import count, span
+
+# Persistent response cache for the agents' LLM calls. Keys are a hash of the
+# model, temperature and whitespace-normalized message contents, so a repeated or
+# templated query skips the round-trip entirely.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"  # stream completions to on_text consumers
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    stage TEXT,
+    model TEXT,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access);
+CREATE TABLE IF NOT EXISTS llm_cache_stats (
+    stage TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip()
+
+def model_id(llm) -> tuple:
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    return str(model), getattr(llm, "temperature", None)
+
+def cache_key(messages, model: str, temperature) -> str:
+    """
+    Hash of model, temperature and the whitespace-normalized messages.
+    """
+    body = [[type(m).__name__, normalize(m.content)] for m in messages]
+    payload = json.dumps([model, temperature, body], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class LLMCache:
+    def __init__(self, db_name: str = LLM_CACHE_DB, ttl: int = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.db_name = db_name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn, stage: str, outcome: str):
+        # hit/miss counts live in the database, shared by the API and every Celery worker
+        conn.execute(
+            f"INSERT INTO llm_cache_stats (stage, {outcome}) VALUES (?, 1) "
+            f"ON CONFLICT (stage) DO UPDATE SET {outcome} = {outcome} + 1",
+            (stage,),
+        )
+
+    def get(self, key: str, stage: str = "default"):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT content, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self._count(conn, stage, "misses")
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count(conn, stage, "hits")
+        return row[0]
+
+    def put(self, key: str, content: str, stage: str = "default", model: str = None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, stage, model, content, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, stage, model, content, now, now),
+            )
+            self._evict(conn, now)
+
+    def delete(self, keys):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(key,) for key in keys])
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            (entries,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            stages = {stage: {"hits": hits, "misses": misses}
+                      for stage, hits, misses in conn.execute("SELECT stage, hits, misses FROM llm_cache_stats")}
+        hits = sum(c["hits"] for c in stages.values())
+        misses = sum(c["misses"] for c in stages.values())
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "stages": stages,
+        }
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+def _call(llm, messages, on_text=None):
+    # stream when a consumer wants the text as it arrives and the LLM can stream
+    if on_text is None or not LLM_STREAMING or not hasattr(llm, "stream"):
+        response = llm.invoke(messages)
+        if on_text is not None:
+            on_text(response.content)
+        return response
+    parts = []
+    for chunk in llm.stream(messages):
+        parts.append(chunk.content)
+        on_text(chunk.content)
+    return AIMessage(content="".join(parts))
+
+def _num_tokens(llm, text: str) -> int:
+    # the model's own tokenizer when it has one (tiktoken for OpenAI), else ~4 characters a token
+    try:
+        return llm.get_num_tokens(text)
+    except Exception:
+        return len(text) // 4
+
+def token_usage(llm, messages, response) -> dict:
+    """
+    Input, cached input and output tokens of one call: as reported by the provider
+    when the response carries usage, else counted from the prompt and completion.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return {"input": usage["input_tokens"], "cached_input": details.get("cache_read") or 0,
+                "output": usage["output_tokens"]}
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage")
+    if usage:
+        details = usage.get("prompt_tokens_details") or {}
+        return {"input": usage.get("prompt_tokens", 0), "cached_input": details.get("cached_tokens") or 0,
+                "output": usage.get("completion_tokens", 0)}
+    return {"input": sum(_num_tokens(llm, m.content) for m in messages), "cached_input": 0,
+            "output": _num_tokens(llm, response.content)}
+
+def _account(llm, messages, response, stage: str, attrs: dict):
+    # llm_tokens_total{stage,kind} counters, plus the counts on the call's span
+    usage = token_usage(llm, messages, response)
+    for kind, tokens in usage.items():
+        count("llm_tokens_total", tokens, stage=stage, kind=kind)
+        attrs[f"{kind}_tokens"] = tokens
+
+def response_key(llm, messages) -> str:
+    """
+    Cache key of llm's response to messages, for forget().
+    """
+    return cache_key(messages, *model_id(llm))
+
+def forget(keys):
+    """
+    Drop cached responses that turned out to be unusable (e.g. generated code that
+    failed validation), so the next identical call asks the model again.
+    """
+    if LLM_CACHE_ENABLED and keys:
+        get_cache().delete(keys)
+
+def cached_invoke(llm, messages, stage: str, on_text=None):
+    """
+    llm.invoke(messages) through the response cache. Works with any object whose
+    invoke() returns something with a .content string, so a stub LLM can be used.
+    Calls that reach the model are counted into llm_tokens_total per stage.
+    If on_text is given it receives the completion piece by piece: streamed tokens
+    on a miss (LLM_STREAMING), the whole cached text on a hit.
+    """
+    if not LLM_CACHE_ENABLED:
+        with span(f"llm.{stage}", cache="off") as attrs:
+            response = _call(llm, messages, on_text)
+            _account(llm, messages, response, stage, attrs)
+            return response
+
+    with span(f"llm.{stage}", cache="miss") as attrs:
+        cache = get_cache()
+        model, _ = model_id(llm)
+        key = response_key(llm, messages)
+        content = cache.get(key, stage)
+        if content is not None:
+            print(f"LLM cache hit ({stage})")
+            attrs["cache"] = "hit"
+            if on_text is not None:
+                on_text(content)
+            return AIMessage(content=content)
+
+        response = _call(llm, messages, on_text)
+        _account(llm, messages, response, stage, attrs)
+        cache.put(key, response.content, stage, model)
+        return response
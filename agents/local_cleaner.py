@@ -0,0 +1,211 @@
+# local_cleaner.py
+import ast
+import builtins
+import re
+
+# Local cleaning pass for generated scripts: strip markdown fences and prose, drop
+# comments (ast.unparse does not keep them), add imports for well-known names the
+# script uses without importing, and make sure ta warnings are silenced. It runs in
+# milliseconds; the LLM cleaner is only needed when this fails (a syntax error or a
+# name nothing here can resolve).
+KNOWN_IMPORTS = {
+    "pd": "import pandas as pd",
+    "np": "import numpy as np",
+    "ta": "import ta",
+    "go": "import plotly.graph_objects as go",
+    "px": "import plotly.express as px",
+    "make_subplots": "from plotly.subplots import make_subplots",
+    "RSIIndicator": "from ta.momentum import RSIIndicator",
+    "StochasticOscillator": "from ta.momentum import StochasticOscillator",
+    "MACD": "from ta.trend import MACD",
+    "SMAIndicator": "from ta.trend import SMAIndicator",
+    "EMAIndicator": "from ta.trend import EMAIndicator",
+    "ADXIndicator": "from ta.trend import ADXIndicator",
+    "BollingerBands": "from ta.volatility import BollingerBands",
+    "AverageTrueRange": "from ta.volatility import AverageTrueRange",
+    "load_prices": "from marketdata.columnar import load_prices",
+    "write_figure": "from backtest.plotting import write_figure",
+    "emit": "from tasks.script_output import emit",
+    "warnings": "import warnings",
+    "math": "import math",
+    "sqrt": "from math import sqrt",
+    "datetime": "import datetime",
+    "timedelta": "from datetime import timedelta",
+    "os": "import os",
+    "json": "import json",
+}
+BUILTINS = set(dir(builtins))
+
+FENCE = re.compile(r"^\s*```")
+# SyntaxError messages that only mean "the code is not finished yet"
+INCOMPLETE = ("unexpected EOF", "was never closed", "unterminated triple-quoted",
+              "expected an indented block", "EOF while scanning")
+# lines at column 0 that continue the previous statement rather than start one
+CONTINUATIONS = ("else", "elif", "except", "finally", "@", ")", "]", "}")
+
+class CleaningFailed(ValueError):
+    """
+    Raised when the local pass cannot produce a runnable script; callers fall back to the LLM cleaner.
+    """
+
+def strip_fences(text: str) -> str:
+    """
+    The code inside the first markdown code block, or the text without fence lines.
+    """
+    lines = text.strip().splitlines()
+    fences = [i for i, line in enumerate(lines) if FENCE.match(line)]
+    if not fences:
+        return "\n".join(lines)
+    start = fences[0] + 1
+    end = fences[1] if len(fences) > 1 else len(lines)
+    # a lone closing fence at the very end (no opening one) just ends the code
+    if len(fences) == 1 and fences[0] == len(lines) - 1:
+        start, end = 0, fences[0]
+    return "\n".join(lines[start:end])
+
+def _bound_names(tree: ast.AST) -> set:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.Import):
+            names.update((a.asname or a.name).split(".")[0] for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names.update(a.asname or a.name for a in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+    return names
+
+def _guarded_names(tree: ast.AST) -> set:
+    # names read inside `try: ... except NameError:` are allowed to be undefined
+    # (the prompt's optional `context` variable)
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try):
+            continue
+        caught = set()
+        for handler in node.handlers:
+            types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+            caught.update(t.id for t in types if isinstance(t, ast.Name))
+        if "NameError" in caught:
+            for stmt in node.body:
+                names.update(n.id for n in ast.walk(stmt) if isinstance(n, ast.Name))
+    return names
+
+def undefined_names(tree: ast.AST) -> set:
+    used = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+    return used - _bound_names(tree) - _guarded_names(tree) - BUILTINS
+
+def _silences_warnings(tree: ast.AST) -> bool:
+    return any(isinstance(n, ast.Attribute) and n.attr in ("filterwarnings", "simplefilter") for n in ast.walk(tree))
+
+def local_clean(code: str) -> str:
+    """
+    Clean a generated script without an LLM. Raises CleaningFailed if it cannot.
+    """
+    source = strip_fences(code)
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise CleaningFailed(f"Syntax error at line {e.lineno}: {e.msg}") from e
+
+    missing = undefined_names(tree)
+    unknown = sorted(missing - set(KNOWN_IMPORTS))
+    if unknown:
+        raise CleaningFailed(f"Undefined names: {', '.join(unknown)}")
+
+    header = [KNOWN_IMPORTS[name] for name in sorted(missing)]
+    if not _silences_warnings(tree):
+        if "warnings" not in _bound_names(tree) and "warnings" not in missing:
+            header.append("import warnings")
+        header.append('warnings.filterwarnings("ignore")')
+
+    # new imports go after a leading docstring and __future__ imports
+    body = tree.body
+    position = 1 if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) else 0
+    while position < len(body) and isinstance(body[position], ast.ImportFrom) and body[position].module == "__future__":
+        position += 1
+    tree.body = body[:position] + ast.parse("\n".join(header)).body + body[position:]
+
+    cleaned = ast.unparse(tree)
+    compile(cleaned, "<generated>", "exec")
+    return cleaned + "\n"
+
+class SyntaxStream:
+    """
+    Incremental syntax check of a script arriving in chunks (streamed LLM tokens).
+    Whenever a new top-level statement starts, the statements completed since the
+    last check are compiled, so by the time the stream ends only the last one is left
+    and a broken script is known as soon as the bad statement is complete. Only the
+    check is incremental: cleaning (local_clean) still runs on the whole response.
+
+    Like strip_fences, the code is what follows the first fence (or, if that fence
+    closes an unfenced script, what precedes it). Without a fence, lines before the
+    first statement that compiles are taken for prose and skipped.
+    """
+    def __init__(self):
+        self.partial = ""
+        self.lines = []
+        self.checked = 0  # self.lines[:checked] are complete, valid statements
+        self.error = None  # (line number, message) of the first definite syntax error
+        self.fenced = False  # inside a markdown code block
+        self.ended = False  # past the closing fence; the rest is prose
+        self.before_fence = None  # (lines, checked, error) before the first fence
+
+    def feed(self, text: str):
+        self.partial += text
+        *complete, self.partial = self.partial.split("\n")
+        for line in complete:
+            self._line(line)
+
+    def _line(self, line: str):
+        if self.ended:
+            return
+        if FENCE.match(line):
+            if self.fenced:
+                self.ended = True
+            else:
+                self.fenced = True
+                self.before_fence = (self.lines, self.checked, self.error)
+                self.lines, self.checked, self.error = [], 0, None
+            return
+        starts_statement = line[:1] not in ("", " ", "\t", "#") and not line.startswith(CONTINUATIONS)
+        if starts_statement and self.error is None:
+            self._check(len(self.lines))
+        self.lines.append(line)
+
+    def _check(self, end: int, final: bool = False):
+        segment = "\n".join(self.lines[self.checked:end])
+        if segment.strip():
+            try:
+                compile(segment, "<stream>", "exec")
+            except SyntaxError as e:
+                if not final and any(m in str(e.msg) for m in INCOMPLETE):
+                    return  # e.g. a multi-line string with lines at column 0
+                if not final and not self.fenced and self.checked == 0:
+                    del self.lines[:end]  # prose before the code
+                    return
+                self.error = (self.checked + (e.lineno or 1), e.msg)
+                return
+        self.checked = end
+
+    def close(self):
+        """
+        Check what is left once the stream has ended; returns the first error or None.
+        """
+        if self.partial:
+            self._line(self.partial)
+            self.partial = ""
+        if self.fenced and not self.ended and not any(line.strip() for line in self.lines):
+            # the only fence closed the script that came before it
+            self.lines, self.checked, self.error = self.before_fence
+            self.fenced = False
+        if self.error is None:
+            self._check(len(self.lines), final=True)
+        return self.error
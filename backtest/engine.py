@@ -0,0 +1,514 @@
+# engine.py
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from backtest.indicators import indicator_cache, resolve_params
+
+# Deterministic, vectorized backtester for the buy_condition / sell_condition JSON
+# emitted by agents.interpreter. It follows the same rules the codegen prompt gives
+# the LLM: signals fire on the bar a condition turns true, positions alternate
+# buy -> sell, all-in/all-out integer shares from 100000 capital, unmatched final
+# buys are dropped, and metrics are computed on the normalized equity curve.
+INITIAL_CAPITAL = 100000
+
+OSCILLATORS = {"rsi", "macd", "macd_signal", "macd_hist"}
+
+_OPERATORS = {
+    ">": ">", "gt": ">", "above": ">", "greaterthan": ">", "crossesabove": ">", "crossabove": ">",
+    ">=": ">=", "gte": ">=", "atleast": ">=",
+    "<": "<", "lt": "<", "below": "<", "lessthan": "<", "crossesbelow": "<", "crossbelow": "<",
+    "<=": "<=", "lte": "<=", "atmost": "<=",
+    "==": "==", "=": "==", "equals": "==",
+    "between": "between",
+}
+_WINDOW_KEYS = ("window", "period", "length", "days")
+_SHORT_KEYS = ("short_window", "short_period", "short", "fast_window", "fast")
+_LONG_KEYS = ("long_window", "long_period", "long", "slow_window", "slow")
+
+class UnsupportedStrategy(ValueError):
+    """
+    Raised when a condition cannot be expressed by the engine; callers fall back to LLM codegen.
+    """
+
+# -----------------------------
+# Condition compilation
+# -----------------------------
+def _norm(name) -> str:
+    return re.sub(r"[^A-Z0-9]", "", str(name).upper())
+
+def _first(cond: dict, keys, default=None):
+    for key in keys:
+        if cond.get(key) is not None:
+            return cond[key]
+    return default
+
+def _spec(kind: str, **params):
+    return (kind, tuple(sorted(resolve_params(kind, params).items())))
+
+def parse_operand(name, cond: dict = None, side: str = "left"):
+    """
+    Map an indicator name from the intent JSON (e.g. "RSI", "SMA_50", "50-day SMA",
+    "Lower Band", "Signal") to an (indicator kind, params) spec.
+    """
+    cond = cond or {}
+    n = _norm(name)
+    if not n:
+        raise UnsupportedStrategy(f"Empty indicator name in {cond}")
+    digits = re.search(r"(\d+)", n)
+    window = int(digits.group(1)) if digits else _first(cond, _WINDOW_KEYS)
+    if "SHORT" in n or "FAST" in n:
+        window = _first(cond, _SHORT_KEYS, 20)
+    elif "LONG" in n or "SLOW" in n:
+        window = _first(cond, _LONG_KEYS, 50)
+    if window is not None and "WEEK" in n:
+        window = int(window) * 5
+    params = {"window": int(window)} if window is not None else {}
+
+    if n in ("PRICE", "CLOSE", "CLOSEPRICE", "CURRENTPRICE", "STOCKPRICE", "SHAREPRICE"):
+        return _spec("close")
+    if n == "VOLUME":
+        return _spec("volume")
+    if n.startswith("RSI"):
+        return _spec("rsi", **params)
+    if "SIGNAL" in n:
+        return _spec("macd_signal")
+    if "HIST" in n:
+        return _spec("macd_hist")
+    if n.startswith("MACD"):
+        return _spec("macd")
+    if "BAND" in n or "BOLLINGER" in n or n.startswith("BB"):
+        if "LOWER" in n:
+            return _spec("bb_lower", **params)
+        if "UPPER" in n:
+            return _spec("bb_upper", **params)
+        if "MIDDLE" in n or "MID" in n:
+            return _spec("bb_middle", **params)
+        raise UnsupportedStrategy(f"Ambiguous Bollinger operand: {name}")
+    extreme = n.replace("SLOW", "")  # "Slow SMA" is a moving average, not a rolling low
+    if "HIGH" in extreme and window is not None:
+        return _spec("rolling_high", **params)
+    if "LOW" in extreme and window is not None:
+        return _spec("rolling_low", **params)
+    if "EMA" in n or "EXPONENTIAL" in n:
+        return _spec("ema", **_ma_params(cond, params, side))
+    if "SMA" in n or "MOVINGAVERAGE" in n or "DMA" in n or n.startswith("MA") or n.endswith("MA"):
+        return _spec("sma", **_ma_params(cond, params, side))
+    raise UnsupportedStrategy(f"Unsupported indicator: {name}")
+
+def _ma_params(cond: dict, params: dict, side: str) -> dict:
+    # SMA crossovers may come as one condition carrying short/long windows
+    if params:
+        return params
+    if side == "left" and _first(cond, _SHORT_KEYS) is not None:
+        return {"window": int(_first(cond, _SHORT_KEYS))}
+    if side == "right" and _first(cond, _LONG_KEYS) is not None:
+        return {"window": int(_first(cond, _LONG_KEYS))}
+    return {}
+
+def _is_number(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(str(value).strip().rstrip("%"))
+        return True
+    except ValueError:
+        return False
+
+def _compile_condition(cond: dict):
+    if not isinstance(cond, dict):
+        raise UnsupportedStrategy(f"Condition must be an object: {cond!r}")
+    if "conditions" in cond:
+        return compile_group(cond)
+
+    raw_op = str(cond.get("operator") or cond.get("comparison") or "").strip()
+    op = _OPERATORS.get(raw_op) or _OPERATORS.get(_norm(raw_op).lower())
+    if op is None:
+        raise UnsupportedStrategy(f"Unsupported operator in {cond}")
+
+    indicator = cond.get("indicator")
+    value = cond.get("value")
+
+    if cond.get("value_type") == "percent":
+        if op == "between" or not _is_number(value) or _norm(indicator) not in ("PRICE", "CLOSE", "RETURN", "PROFIT", "LOSS", "STOPLOSS"):
+            raise UnsupportedStrategy(f"Unsupported percent condition: {cond}")
+        pct = abs(float(str(value).rstrip("%"))) / 100.0
+        # a loss/stop-loss exits once the price falls pct below the entry and a profit
+        # target once it rises pct above it, whichever operator the intent used;
+        # for a plain price/return the operator gives the direction
+        kind = _norm(indicator)
+        if kind in ("LOSS", "STOPLOSS"):
+            return ("percent", "<=", 1 - pct)
+        if kind == "PROFIT":
+            return ("percent", ">=", 1 + pct)
+        return ("percent", op, 1 + pct if op in (">", ">=") else 1 - pct)
+
+    n = _norm(indicator)
+    if n in ("BOLLINGERBANDS", "BOLLINGERBAND", "BOLLINGER", "BB", "BBANDS"):
+        # "Bollinger Bands < Lower Band" means Close compared with the band
+        left = _spec("close")
+        if value is None:
+            value = "Lower Band" if op in ("<", "<=") else "Upper Band"
+    else:
+        left = parse_operand(indicator, cond, side="left")
+
+    if op == "between":
+        low, high = cond.get("min"), cond.get("max")
+        if not (_is_number(low) and _is_number(high)):
+            raise UnsupportedStrategy(f"between needs numeric min/max: {cond}")
+        right = (float(low), float(high))
+    elif _is_number(value):
+        right = float(str(value).rstrip("%"))
+    elif isinstance(value, str) and value.strip():
+        right = parse_operand(value, cond, side="right")
+    elif left[0] == "macd":
+        right = _spec("macd_signal")  # default rule: MACD vs Signal
+    elif left[0] in ("sma", "ema") and _first(cond, _LONG_KEYS) is not None:
+        right = _spec(left[0], window=int(_first(cond, _LONG_KEYS)))
+    else:
+        raise UnsupportedStrategy(f"Missing comparison value in {cond}")
+
+    duration = cond.get("duration_days")
+    if duration:
+        if str(cond.get("duration_type", "consecutive")).lower() not in ("consecutive", ""):
+            raise UnsupportedStrategy(f"Only consecutive durations are supported: {cond}")
+        duration = int(duration)
+    return ("cmp", left, op, right, duration or 0)
+
+def compile_group(group) -> tuple:
+    """
+    Compile a {"logic": "and"|"or", "conditions": [...]} group into an evaluation tree.
+    """
+    if not isinstance(group, dict) or not group.get("conditions"):
+        raise UnsupportedStrategy("Empty condition group")
+    logic = str(group.get("logic", "and")).lower()
+    if logic not in ("and", "or"):
+        raise UnsupportedStrategy(f"Unsupported logic: {logic}")
+    return ("group", logic, tuple(_compile_condition(c) for c in group["conditions"]))
+
+def _has_percent(node) -> bool:
+    if node[0] == "percent":
+        return True
+    if node[0] == "group":
+        return any(_has_percent(child) for child in node[2])
+    return False
+
+def _specs(node):
+    if node[0] == "group":
+        for child in node[2]:
+            yield from _specs(child)
+    elif node[0] == "cmp":
+        yield node[1]
+        if isinstance(node[3], tuple) and isinstance(node[3][0], str):
+            yield node[3]
+
+def compile_strategy(intent: dict) -> dict:
+    """
+    Compile an interpreted intent. Raises UnsupportedStrategy if the engine cannot run it.
+    """
+    buy = compile_group(intent.get("buy_condition"))
+    sell = compile_group(intent.get("sell_condition"))
+    if _has_percent(buy):
+        raise UnsupportedStrategy("Percent conditions are only meaningful for exits")
+    return {"buy": buy, "sell": sell}
+
+def is_supported(intent: dict) -> bool:
+    try:
+        compile_strategy(intent)
+        return True
+    except UnsupportedStrategy:
+        return False
+
+# -----------------------------
+# Evaluation
+# -----------------------------
+def _series(df: pd.DataFrame, spec, cache: dict) -> np.ndarray:
+    # cache is per-ticker scratch; the shared indicator_cache reuses work across runs
+    if spec not in cache:
+        kind, params = spec
+        cache[spec] = indicator_cache.get(cache["__ticker__"], df, kind, dict(params))
+    return cache[spec]
+
+def _compare(left: np.ndarray, op: str, right) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        if op == "between":
+            return (left >= right[0]) & (left <= right[1])
+        if op == ">":
+            return left > right
+        if op == ">=":
+            return left >= right
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        return left == right
+
+def _consecutive(mask: np.ndarray, days: int) -> np.ndarray:
+    # true where the mask has held for `days` bars in a row
+    counts = np.convolve(mask.astype("int64"), np.ones(days, dtype="int64"))[: len(mask)]
+    return counts >= days
+
+def _evaluate(node, df, cache, close=None, entry_price=None, sl=slice(None)) -> np.ndarray:
+    kind = node[0]
+    if kind != "percent" and (entry_price is None or not _has_percent(node)):
+        # full-length masks depend only on the node, so variants and trades sharing it reuse one array
+        key = ("mask", node)
+        if key not in cache:
+            cache[key] = _evaluate_node(node, df, cache)
+        return cache[key][sl]
+    return _evaluate_node(node, df, cache, close, entry_price, sl)
+
+def _evaluate_node(node, df, cache, close=None, entry_price=None, sl=slice(None)) -> np.ndarray:
+    kind = node[0]
+    if kind == "group":
+        parts = [_evaluate(child, df, cache, close, entry_price, sl) for child in node[2]]
+        return np.logical_and.reduce(parts) if node[1] == "and" else np.logical_or.reduce(parts)
+    if kind == "percent":
+        return _compare(close[sl], node[1], entry_price * node[2])
+    _, left, op, right, duration = node
+    lhs = _series(df, left, cache)
+    if isinstance(right, tuple) and isinstance(right[0], str):
+        right = _series(df, right, cache)
+    mask = _compare(lhs, op, right)
+    if duration:
+        mask = _consecutive(mask, duration)
+    return mask
+
+def _rising_edges(mask: np.ndarray) -> np.ndarray:
+    prev = np.concatenate(([False], mask[:-1]))
+    return mask & ~prev
+
+def _match_trades(buy_events, sell_tree, df, cache, close):
+    """
+    Walk buy events in order, pairing each with the first exit after it.
+    Loops over trades only; each exit search is a vectorized scan.
+    """
+    static_sell = None
+    if not _has_percent(sell_tree):
+        key = ("exits", sell_tree)
+        if key not in cache:
+            cache[key] = np.flatnonzero(_rising_edges(_evaluate(sell_tree, df, cache)))
+        static_sell = cache[key]
+
+    trades = []
+    buy_idx = np.flatnonzero(buy_events)
+    pos = 0
+    while pos < len(buy_idx):
+        entry = int(buy_idx[pos])
+        if static_sell is not None:
+            k = np.searchsorted(static_sell, entry, side="right")
+            if k >= len(static_sell):
+                break
+            exit_ = int(static_sell[k])
+        else:
+            window = _evaluate(sell_tree, df, cache, close, close[entry], slice(entry, None))
+            hits = np.flatnonzero(_rising_edges(window)[1:])
+            if not len(hits):
+                break
+            exit_ = entry + 1 + int(hits[0])
+        trades.append((entry, exit_))
+        pos = np.searchsorted(buy_idx, exit_, side="right")
+    return trades
+
+def compute_metrics(portfolio: pd.Series, has_trades: bool) -> dict:
+    """
+    Cumulative/annualized return, volatility and max drawdown in percent, as defined in the codegen prompt.
+    """
+    return _metrics(portfolio.to_numpy(dtype="float64"), portfolio.index, has_trades)
+
+def _metrics(values: np.ndarray, index: pd.DatetimeIndex, has_trades: bool) -> dict:
+    metrics = {"Cumulative Return": 0.0, "Annualized Return": 0.0, "Volatility": 0.0, "Max Drawdown": 0.0}
+    if not has_trades or not len(values) or values[0] == 0:
+        return metrics
+    cumulative_curve = values / values[0]
+    metrics["Cumulative Return"] = (cumulative_curve[-1] - 1) * 100
+    total_days = (index[-1] - index[0]).days
+    if total_days > 0:
+        metrics["Annualized Return"] = (cumulative_curve[-1] ** (365 / total_days) - 1) * 100
+    daily_rets = values[1:] / values[:-1] - 1
+    if len(daily_rets) > 1:
+        metrics["Volatility"] = daily_rets.std(ddof=1) * math.sqrt(252) * 100
+    metrics["Max Drawdown"] = (1 - cumulative_curve / np.maximum.accumulate(cumulative_curve)).max() * 100
+    return {k: float(v) for k, v in metrics.items()}
+
+def ticker_trades(ticker: str, df: pd.DataFrame, strategy: dict, cache: dict = None) -> list:
+    """
+    (entry, exit) bar positions of every round trip the strategy makes on one ticker.
+    """
+    if cache is None:
+        cache = {}
+    cache["__ticker__"] = ticker
+    if not len(df):
+        return []
+    buy_events = _rising_edges(_evaluate(strategy["buy"], df, cache))
+    return _match_trades(buy_events, strategy["sell"], df, cache, df["Close"].to_numpy(dtype="float64"))
+
+def backtest_ticker(ticker: str, df: pd.DataFrame, strategy: dict, initial_capital: float = INITIAL_CAPITAL,
+                    cache: dict = None, summary_only: bool = False) -> dict:
+    """
+    Backtest one ticker. df is indexed by a DatetimeIndex with OHLCV columns;
+    strategy is the output of compile_strategy. Passing the same cache for many
+    strategies on one ticker reuses indicator and condition masks between them;
+    summary_only skips the trade, equity and plotting frames and returns
+    only the metrics and trade count.
+    """
+    if cache is None:
+        cache = {}
+    close = df["Close"].to_numpy(dtype="float64")
+    n = len(close)
+    trades = ticker_trades(ticker, df, strategy, cache)
+
+    # all-in / all-out with integer shares; only the state changes are looped over
+    share_delta = np.zeros(n)
+    cash_delta = np.zeros(n)
+    cash = float(initial_capital)
+    entries = np.array([e for e, _ in trades], dtype="int64")
+    exits = np.array([x for _, x in trades], dtype="int64")
+    shares_held = np.zeros(len(trades), dtype="int64")
+    for i, (entry, exit_) in enumerate(trades):
+        shares = int(cash // close[entry])
+        shares_held[i] = shares
+        cash += shares * (close[exit_] - close[entry])
+    np.add.at(share_delta, entries, shares_held)
+    np.add.at(share_delta, exits, -shares_held)
+    np.add.at(cash_delta, entries, -shares_held * close[entries])
+    np.add.at(cash_delta, exits, shares_held * close[exits])
+
+    equity = initial_capital + np.cumsum(cash_delta) + np.cumsum(share_delta) * close
+
+    metrics = {"Ticker": ticker}
+    metrics.update(_metrics(equity, df.index, bool(trades)))
+    if summary_only:
+        return {"ticker": ticker, "trade_count": len(trades), "metrics": metrics}
+
+    portfolio = pd.Series(equity, index=df.index, name="Portfolio Value")
+    trades_df = pd.DataFrame({
+        "Buy Date": df.index[entries], "Buy Price": close[entries],
+        "Sell Date": df.index[exits], "Sell Price": close[exits],
+        "Shares": shares_held, "Return": (close[exits] - close[entries]) / close[entries] * 100,
+    })
+
+    data = df.copy()
+    data["Buy"] = np.nan
+    data["Sell"] = np.nan
+    data.iloc[entries, data.columns.get_loc("Buy")] = close[entries]
+    data.iloc[exits, data.columns.get_loc("Sell")] = close[exits]
+
+    indicators = {}
+    for spec in dict.fromkeys(list(_specs(strategy["buy"])) + list(_specs(strategy["sell"]))):
+        if spec[0] in ("close", "volume"):
+            continue
+        label = spec[0].upper() + "".join(f"({v})" for k, v in spec[1] if k == "window")
+        indicators[label] = (spec[0] in OSCILLATORS, pd.Series(_series(df, spec, cache), index=df.index))
+
+    return {
+        "ticker": ticker,
+        "data": data,
+        "indicators": indicators,
+        "trade_count": len(trades),
+        "trades": trades_df,
+        "portfolio": portfolio,
+        "metrics": metrics,
+    }
+
+def _metrics_rows(values: np.ndarray, index: pd.DatetimeIndex, has_trades: np.ndarray) -> np.ndarray:
+    # _metrics for every row of a (strategies x bars) equity matrix; columns in _metrics order
+    rows = np.zeros((len(values), 4))
+    if not values.shape[1]:
+        return rows
+    curve = values / values[:, :1]
+    rows[:, 0] = (curve[:, -1] - 1) * 100
+    total_days = (index[-1] - index[0]).days
+    if total_days > 0:
+        rows[:, 1] = (curve[:, -1] ** (365 / total_days) - 1) * 100
+    if values.shape[1] > 2:
+        rows[:, 2] = (values[:, 1:] / values[:, :-1] - 1).std(axis=1, ddof=1) * math.sqrt(252) * 100
+    rows[:, 3] = (1 - curve / np.maximum.accumulate(curve, axis=1)).max(axis=1) * 100
+    rows[~has_trades] = 0.0
+    return rows
+
+def _backtest_batch(ticker: str, df: pd.DataFrame, strategies: list, initial_capital: float, cache: dict) -> list:
+    close = df["Close"].to_numpy(dtype="float64")
+    n = len(close)
+    buys = np.stack([_rising_edges(_evaluate(s["buy"], df, cache)) for s in strategies])
+    sells = np.stack([_rising_edges(_evaluate(s["sell"], df, cache)) for s in strategies])
+
+    # advance every strategy's position together, over the bars where any of them has a signal;
+    # the same rules as _match_trades: exits strictly after the entry, entries strictly after the exit
+    events = np.flatnonzero(buys.any(axis=0) | sells.any(axis=0))
+    count = len(strategies)
+    cash = np.full(count, float(initial_capital))
+    shares = np.zeros(count)
+    in_position = np.zeros(count, dtype=bool)
+    entry_event = np.zeros(count, dtype="int64")
+    entry_cash = cash.copy()
+    trade_count = np.zeros(count, dtype="int64")
+    cash_at = np.empty((count, len(events)))
+    shares_at = np.empty((count, len(events)))
+    for k, i in enumerate(events):
+        exiting = in_position & sells[:, i]
+        entering = ~in_position & buys[:, i]
+        cash[exiting] += shares[exiting] * close[i]
+        shares[exiting] = 0
+        trade_count += exiting
+        entry_cash[entering] = cash[entering]
+        entry_event[entering] = k
+        shares[entering] = np.floor_divide(cash[entering], close[i])
+        cash[entering] -= shares[entering] * close[i]
+        in_position = (in_position & ~exiting) | entering
+        cash_at[:, k] = cash
+        shares_at[:, k] = shares
+
+    # a last entry without an exit is not a trade: flat from that entry on
+    for row in np.flatnonzero(in_position):
+        cash_at[row, entry_event[row]:] = entry_cash[row]
+        shares_at[row, entry_event[row]:] = 0
+
+    last_event = np.searchsorted(events, np.arange(n), side="right") - 1
+    column = np.maximum(last_event, 0)
+    equity = cash_at[:, column] + shares_at[:, column] * close if len(events) else np.zeros((count, n))
+    equity[:, last_event < 0] = initial_capital
+
+    rows = _metrics_rows(equity, df.index, trade_count > 0)
+    names = ("Cumulative Return", "Annualized Return", "Volatility", "Max Drawdown")
+    return [
+        {"ticker": ticker, "trade_count": int(trades),
+         "metrics": dict({"Ticker": ticker}, **{name: float(v) for name, v in zip(names, row)})}
+        for trades, row in zip(trade_count, rows)
+    ]
+
+def backtest_many(ticker: str, df: pd.DataFrame, strategies: list, initial_capital: float = INITIAL_CAPITAL,
+                  cache: dict = None, chunk: int = 512) -> list:
+    """
+    backtest_ticker(summary_only=True) for many strategies on one ticker, in one
+    vectorized pass per chunk of strategies: their entry/exit signals are stacked
+    into (strategies x bars) matrices and all positions advance together. Strategies
+    whose exits depend on the entry price (percent conditions) run one at a time.
+    """
+    if cache is None:
+        cache = {}
+    cache["__ticker__"] = ticker
+    results = [None] * len(strategies)
+    batch = []
+    for i, strategy in enumerate(strategies):
+        if len(df) and not _has_percent(strategy["sell"]):
+            batch.append(i)
+        else:
+            results[i] = backtest_ticker(ticker, df, strategy, initial_capital, cache, summary_only=True)
+    for start in range(0, len(batch), chunk):
+        rows = batch[start:start + chunk]
+        for i, result in zip(rows, _backtest_batch(ticker, df, [strategies[i] for i in rows], initial_capital, cache)):
+            results[i] = result
+    return results
+
+def run_backtest(prices: dict, intent: dict, initial_capital: float = INITIAL_CAPITAL) -> list:
+    """
+    Backtest an interpreted intent over {ticker: DataFrame} prices.
+    Returns one backtest_ticker result per ticker, in ticker order.
+    """
+    strategy = compile_strategy(intent)
+    return [backtest_ticker(ticker, df, strategy, initial_capital) for ticker, df in sorted(prices.items())]
@@ -0,0 +1,217 @@
+# indicators.py
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from ta.momentum import RSIIndicator
+from ta.trend import MACD
+from ta.volatility import BollingerBands
+
+# Indicator definitions follow the rules the codegen prompt gives the LLM:
+# moving averages and rolling highs/lows are shifted by one bar to avoid lookahead,
+# RSI, MACD and Bollinger Bands are computed directly from Close without a shift.
+DEFAULT_PARAMS = {
+    "close": {},
+    "volume": {},
+    "rsi": {"window": 14},
+    "macd": {"fast": 12, "slow": 26, "signal": 9},
+    "macd_signal": {"fast": 12, "slow": 26, "signal": 9},
+    "macd_hist": {"fast": 12, "slow": 26, "signal": 9},
+    "sma": {"window": 20},
+    "ema": {"window": 20},
+    "bb_lower": {"window": 20, "dev": 2},
+    "bb_middle": {"window": 20, "dev": 2},
+    "bb_upper": {"window": 20, "dev": 2},
+    "rolling_high": {"window": 20},
+    "rolling_low": {"window": 20},
+}
+
+def _macd(close, p):
+    return MACD(close, window_fast=p["fast"], window_slow=p["slow"], window_sign=p["signal"])
+
+def _bollinger(close, p):
+    return BollingerBands(close, window=p["window"], window_dev=p["dev"])
+
+INDICATORS = {
+    "close": lambda df, p: df["Close"],
+    "volume": lambda df, p: df["Volume"],
+    "rsi": lambda df, p: RSIIndicator(df["Close"], window=p["window"]).rsi(),
+    "macd": lambda df, p: _macd(df["Close"], p).macd(),
+    "macd_signal": lambda df, p: _macd(df["Close"], p).macd_signal(),
+    "macd_hist": lambda df, p: _macd(df["Close"], p).macd_diff(),
+    "sma": lambda df, p: df["Close"].rolling(window=p["window"]).mean().shift(1),
+    "ema": lambda df, p: df["Close"].ewm(span=p["window"], adjust=False).mean().shift(1),
+    "bb_lower": lambda df, p: _bollinger(df["Close"], p).bollinger_lband(),
+    "bb_middle": lambda df, p: _bollinger(df["Close"], p).bollinger_mavg(),
+    "bb_upper": lambda df, p: _bollinger(df["Close"], p).bollinger_hband(),
+    "rolling_high": lambda df, p: df["High"].rolling(window=p["window"]).max().shift(1),
+    "rolling_low": lambda df, p: df["Low"].rolling(window=p["window"]).min().shift(1),
+}
+
+def resolve_params(kind: str, params: dict = None) -> dict:
+    """
+    Fill in default parameters for an indicator.
+    """
+    if kind not in INDICATORS:
+        raise KeyError(f"Unknown indicator: {kind}")
+    merged = dict(DEFAULT_PARAMS[kind])
+    merged.update({k: v for k, v in (params or {}).items() if k in merged})
+    return merged
+
+def compute_indicator(df: pd.DataFrame, kind: str, params: dict = None) -> pd.Series:
+    """
+    Compute one indicator series for a single-ticker price DataFrame.
+    """
+    return INDICATORS[kind](df, resolve_params(kind, params))
+
+# -----------------------------
+# Shared indicator cache
+# -----------------------------
+INDICATOR_CACHE_SIZE = int(os.getenv("INDICATOR_CACHE_SIZE", "512"))
+INDICATOR_CACHE_DIR = os.getenv("INDICATOR_CACHE_DIR")  # unset = memory only
+
+# indicators computed by one ta object are cached together
+FAMILIES = {
+    "macd": ("macd", "macd_signal", "macd_hist"),
+    "macd_signal": ("macd", "macd_signal", "macd_hist"),
+    "macd_hist": ("macd", "macd_signal", "macd_hist"),
+    "bb_lower": ("bb_lower", "bb_middle", "bb_upper"),
+    "bb_middle": ("bb_lower", "bb_middle", "bb_upper"),
+    "bb_upper": ("bb_lower", "bb_middle", "bb_upper"),
+}
+
+_fingerprints = {}  # id(df) -> (weakref to df, fingerprint)
+
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a price frame's index and OHLCV values, memoized per frame object.
+    """
+    memo = _fingerprints.get(id(df))
+    if memo is not None and memo[0]() is df:
+        return memo[1]
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(df.index.asi8).tobytes())
+    for col in ("Open", "High", "Low", "Close", "Volume"):
+        if col in df.columns:
+            h.update(col.encode())
+            h.update(np.ascontiguousarray(df[col].to_numpy(dtype="float64")).tobytes())
+    fingerprint = h.hexdigest()
+    key = id(df)
+    _fingerprints[key] = (weakref.ref(df, lambda _ref: _fingerprints.pop(key, None)), fingerprint)
+    return fingerprint
+
+class IndicatorCache:
+    """
+    LRU cache of indicator arrays keyed by (ticker, indicator, params, data fingerprint),
+    optionally persisted as .npy files under cache_dir.
+
+    Rolling intermediates are shared: every SMA window for a ticker is derived from
+    one cached cumulative sum of Close instead of a fresh rolling pass.
+    """
+    def __init__(self, max_entries: int = INDICATOR_CACHE_SIZE, cache_dir: str = INDICATOR_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, ticker, kind, params, fingerprint):
+        return (ticker, kind, tuple(sorted(params.items())), fingerprint)
+
+    def _path(self, key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def _lookup(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        if self.cache_dir and os.path.exists(self._path(key)):
+            values = np.load(self._path(key))
+            self._store(key, values, persist=False)
+            with self.lock:
+                self.hits += 1
+            return values
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key, values, persist=True):
+        values.setflags(write=False)
+        with self.lock:
+            self.entries[key] = values
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if persist and self.cache_dir:
+            tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+            np.save(tmp, values)
+            os.replace(tmp, self._path(key))
+
+    def _close_cumsum(self, ticker, df, fingerprint):
+        key = self._key(ticker, "close_cumsum", {}, fingerprint)
+        values = self._lookup(key)
+        if values is None:
+            values = np.concatenate(([0.0], np.cumsum(df["Close"].to_numpy(dtype="float64"))))
+            self._store(key, values, persist=False)
+        return values
+
+    def _sma(self, ticker, df, fingerprint, window):
+        close = df["Close"].to_numpy(dtype="float64")
+        if np.isnan(close).any():
+            return compute_indicator(df, "sma", {"window": window}).to_numpy(dtype="float64")
+        cs = self._close_cumsum(ticker, df, fingerprint)
+        sma = np.full(len(close), np.nan)
+        if window <= len(close):
+            # mean of close[t-window+1 .. t], then shifted one bar like the rolling version
+            sma[window:] = (cs[window:-1] - cs[:-window - 1]) / window
+        return sma
+
+    def get(self, ticker: str, df: pd.DataFrame, kind: str, params: dict = None) -> np.ndarray:
+        """
+        Return the indicator as a read-only float64 array aligned with df.
+        """
+        params = resolve_params(kind, params)
+        fingerprint = data_fingerprint(df)
+        key = self._key(ticker, kind, params, fingerprint)
+        values = self._lookup(key)
+        if values is not None:
+            return values
+
+        if kind == "sma":
+            values = self._sma(ticker, df, fingerprint, params["window"])
+            self._store(key, values)
+            return values
+
+        members = FAMILIES.get(kind, (kind,))
+        for member in members:
+            computed = compute_indicator(df, member, params).to_numpy(dtype="float64")
+            self._store(self._key(ticker, member, params, fingerprint), computed)
+            if member == kind:
+                values = computed
+        return values
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+indicator_cache = IndicatorCache()
+
+def cached_indicator(ticker: str, df: pd.DataFrame, kind: str, params: dict = None) -> pd.Series:
+    """
+    compute_indicator through the process-wide cache.
+    """
+    return pd.Series(indicator_cache.get(ticker, df, kind, params), index=df.index)
@@ -0,0 +1,96 @@
+# plotting.py
+import os
+
+import numpy as np
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+# Compact plot output. In "compact" mode (the default) a figure's HTML references one
+# shared plotly.js served from /plots instead of embedding the ~3.5 MB bundle, long
+# line traces are downsampled with LTTB to PLOT_MAX_POINTS, values are rounded, and
+# the figure is also saved as JSON next to the HTML for clients that render it
+# themselves. PLOT_MODE=full writes standalone HTML exactly as before.
+PLOT_MODE = os.getenv("PLOT_MODE", "compact")
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "1500"))
+PLOT_DECIMALS = int(os.getenv("PLOT_DECIMALS", "4"))
+PLOTLY_JS_URL = os.getenv("PLOTLY_JS_URL", "/plots/assets/plotly.min.js")
+PLOTLY_JS_NAME = "plotly.min.js"
+
+def write_plotly_js(directory: str) -> str:
+    """
+    Write the shared plotly.js bundle into directory once; returns its path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, PLOTLY_JS_NAME)
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp, path)
+    return path
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the
+    visual shape of the (x, y) line. x must be numeric and increasing.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # NaN gaps (indicator warm-up) would poison the triangle areas
+    y = np.nan_to_num(y, nan=np.nanmean(y) if np.isfinite(y).any() else 0.0)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket (the last point for the final bucket)
+        nxt_start, nxt_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_start:nxt_end].mean()
+        avg_y = y[nxt_start:nxt_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def _numeric_x(x) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype("int64").astype("float64")
+    if x.dtype == object:
+        return np.asarray(x.astype("datetime64[ns]").astype("int64"), dtype="float64")
+    return x.astype("float64")
+
+def compact_figure(fig, max_points: int = PLOT_MAX_POINTS, decimals: int = PLOT_DECIMALS):
+    """
+    Downsample long line traces in place and round their values. Marker-only
+    traces (trade signals) are kept exactly.
+    """
+    for trace in fig.data:
+        if trace.type != "scatter" or trace.y is None or trace.x is None:
+            continue
+        mode = trace.mode or "lines"
+        y = np.asarray(trace.y, dtype="float64")
+        if "lines" in mode and len(y) > max_points:
+            idx = lttb(_numeric_x(trace.x), y, max_points)
+            trace.x = np.asarray(trace.x)[idx]
+            y = y[idx]
+        trace.y = np.round(y, decimals)
+    return fig
+
+def write_figure(fig, path: str, mode: str = None) -> str:
+    """
+    Save a figure as HTML in the configured output mode; returns path.
+    Generated scripts call this instead of fig.write_html.
+    """
+    if (mode or PLOT_MODE) != "compact":
+        fig.write_html(path)
+        return path
+
+    compact_figure(fig)
+    fig.write_html(path, include_plotlyjs=PLOTLY_JS_URL, full_html=True)
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        f.write(pio.to_json(fig, validate=False))
+    return path
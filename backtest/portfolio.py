@@ -0,0 +1,125 @@
+# portfolio.py
+import numpy as np
+import pandas as pd
+
+from backtest.engine import INITIAL_CAPITAL, compile_strategy, compute_metrics, ticker_trades
+
+# Portfolio mode: every ticker trades from one shared pool of capital.
+# Per-ticker signals (the same entries/exits as backtest_ticker) are laid out on a
+# date x ticker matrix aligned on the union of trading days; target weights come
+# from the sizing rule and positions are only resized at rebalance points, so the
+# loop runs over rebalance dates while each step works on the whole universe.
+#   sizing:    "equal"  - equity split evenly across the positions currently held
+#              "fixed"  - each position gets position_size percent of equity
+#   rebalance: "signal" - only when some ticker enters or exits
+#              "daily" / "weekly" / "monthly" - also restore target weights each period
+SIZING_RULES = ("equal", "fixed")
+REBALANCE_RULES = ("signal", "daily", "weekly", "monthly")
+
+def holding_matrix(prices: dict, strategy: dict, index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Boolean (dates x tickers) matrix: True while the strategy wants to hold the ticker.
+    A position is opened at the entry bar's close and closed at the exit bar's close.
+    """
+    held = np.zeros((len(index), len(prices)), dtype=bool)
+    for j, (ticker, df) in enumerate(prices.items()):
+        positions = index.get_indexer(df.index)
+        for entry, exit_ in ticker_trades(ticker, df, strategy):
+            held[positions[entry]:positions[exit_], j] = True
+    return held
+
+def target_weights(held: np.ndarray, sizing: str, position_size: float = None) -> np.ndarray:
+    if sizing == "equal":
+        count = held.sum(axis=1, keepdims=True)
+        return np.divide(held, count, out=np.zeros(held.shape), where=count > 0)
+    if sizing == "fixed":
+        size = (position_size or 100.0 / held.shape[1]) / 100.0
+        weights = held * size
+        # never commit more than the whole equity when many positions are open
+        total = weights.sum(axis=1, keepdims=True)
+        return np.where(total > 1, weights / np.maximum(total, 1e-12), weights)
+    raise ValueError(f"sizing must be one of {SIZING_RULES}")
+
+def rebalance_points(held: np.ndarray, index: pd.DatetimeIndex, rebalance: str) -> np.ndarray:
+    changed = np.concatenate(([held[0].any()], (held[1:] != held[:-1]).any(axis=1)))
+    if rebalance == "signal":
+        return np.flatnonzero(changed)
+    if rebalance == "daily":
+        return np.flatnonzero(changed | held.any(axis=1))
+    if rebalance in ("weekly", "monthly"):
+        period = index.to_period("W" if rebalance == "weekly" else "M").asi8
+        new_period = np.concatenate(([True], period[1:] != period[:-1]))
+        return np.flatnonzero(changed | (new_period & held.any(axis=1)))
+    raise ValueError(f"rebalance must be one of {REBALANCE_RULES}")
+
+def run_portfolio(prices: dict, intent: dict, initial_capital: float = INITIAL_CAPITAL,
+                  sizing: str = "equal", rebalance: str = "signal", position_size: float = None) -> dict:
+    """
+    Backtest an interpreted intent over {ticker: DataFrame} prices as one portfolio
+    with shared cash and integer share positions. Returns the aggregate equity curve,
+    metrics, per-ticker weights over time and the list of share changes.
+    """
+    strategy = compile_strategy(intent)
+    prices = {t: prices[t] for t in sorted(prices) if len(prices[t])}
+    tickers = list(prices)
+    if not tickers:
+        raise ValueError("No price data for the portfolio")
+
+    index = pd.DatetimeIndex(sorted(set().union(*(df.index for df in prices.values()))))
+    close = pd.DataFrame({t: df["Close"] for t, df in prices.items()}).reindex(index)
+    tradable = close.notna().to_numpy()
+    trade_price = close.to_numpy(dtype="float64")
+    mark_price = close.ffill().fillna(0.0).to_numpy(dtype="float64")  # last known price for valuation
+
+    held = holding_matrix(prices, strategy, index)
+    weights = target_weights(held, sizing, position_size)
+    points = rebalance_points(held, index, rebalance)
+
+    n, m = len(index), len(tickers)
+    shares = np.zeros((n, m))
+    cash = np.full(n, float(initial_capital))
+    current = np.zeros(m)
+    cash_now = float(initial_capital)
+    for k, r in enumerate(points):
+        equity = cash_now + current @ mark_price[r]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target = np.floor(weights[r] * equity / trade_price[r])
+        # tickers without a bar today cannot trade and keep their position
+        target = np.where(tradable[r], target, current)
+        sells = np.minimum(target - current, 0)
+        buys = np.maximum(target - current, 0)
+        cash_now -= sells @ np.nan_to_num(trade_price[r])
+        cost = buys @ np.nan_to_num(trade_price[r])
+        if cost > cash_now:
+            buys = np.floor(buys * cash_now / cost)
+            cost = buys @ np.nan_to_num(trade_price[r])
+        cash_now -= cost
+        current = current + sells + buys
+
+        end = points[k + 1] if k + 1 < len(points) else n
+        shares[r:end] = current
+        cash[r:end] = cash_now
+
+    values = cash + (shares * mark_price).sum(axis=1)
+    equity = pd.Series(values, index=index, name="Portfolio Value")
+    position_value = pd.DataFrame(shares * mark_price, index=index, columns=tickers)
+    weights_df = position_value.div(equity, axis=0)
+
+    delta = np.diff(shares, axis=0, prepend=np.zeros((1, m)))
+    rows, cols = np.nonzero(delta)
+    trades = pd.DataFrame({
+        "Date": index[rows], "Ticker": np.array(tickers)[cols],
+        "Shares": delta[rows, cols].astype("int64"), "Price": trade_price[rows, cols],
+    })
+
+    metrics = {"Portfolio": ", ".join(tickers), "Sizing": sizing, "Rebalance": rebalance}
+    metrics.update(compute_metrics(equity, bool(len(trades))))
+    metrics["Trades"] = int(len(trades))
+    return {
+        "tickers": tickers,
+        "equity": equity,
+        "cash": pd.Series(cash, index=index, name="Cash"),
+        "weights": weights_df,
+        "trades": trades,
+        "metrics": metrics,
+    }
@@ -0,0 +1,109 @@
+# report.py
+import os
+
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from backtest.plotting import write_figure
+
+# Same outputs the generated scripts produce: one {ticker}_plot.html per ticker
+# (price, indicators and trade markers over the equity curve) and trading_results.html.
+
+def plot_result(result: dict) -> go.Figure:
+    ticker = result["ticker"]
+    data = result["data"]
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
+                        specs=[[{"secondary_y": True}], [{}]])
+    fig.add_trace(go.Scatter(x=data.index, y=data["Close"], name="Close", line=dict(color="blue")),
+                  row=1, col=1, secondary_y=False)
+
+    rsi_plotted = False
+    for label, (oscillator, series) in result["indicators"].items():
+        line = dict(dash="dot") if not oscillator else dict()
+        fig.add_trace(go.Scatter(x=series.index, y=series, name=label, line=line),
+                      row=1, col=1, secondary_y=oscillator)
+        rsi_plotted = rsi_plotted or label.startswith("RSI")
+
+    buys = data["Buy"].dropna()
+    sells = data["Sell"].dropna()
+    fig.add_trace(go.Scatter(x=buys.index, y=buys, mode="markers", name="Buy",
+                             marker=dict(symbol="triangle-up", color="green", size=10)),
+                  row=1, col=1, secondary_y=False)
+    fig.add_trace(go.Scatter(x=sells.index, y=sells, mode="markers", name="Sell",
+                             marker=dict(symbol="triangle-down", color="red", size=10)),
+                  row=1, col=1, secondary_y=False)
+
+    portfolio = result["portfolio"]
+    fig.add_trace(go.Scatter(x=portfolio.index, y=portfolio, name="Portfolio Value", line=dict(color="purple")),
+                  row=2, col=1)
+
+    fig.update_layout(title=f"{ticker} Backtest", xaxis=dict(type="date"))
+    fig.update_yaxes(title_text="Price", row=1, col=1, secondary_y=False)
+    fig.update_yaxes(title_text="Oscillator / Indicator", row=1, col=1, secondary_y=True,
+                     range=[0, 100] if rsi_plotted else None)
+    fig.update_yaxes(title_text="Portfolio Value", row=2, col=1)
+    return fig
+
+def write_reports(results: list, output_dir: str = ".") -> list:
+    """
+    Write per-ticker plots and trading_results.html into output_dir.
+    Returns the list of file names written.
+    """
+    output_files = []
+    for result in results:
+        name = f"{result['ticker']}_plot.html"
+        write_figure(plot_result(result), os.path.join(output_dir, name))
+        output_files.append(name)
+
+    trading_results = pd.DataFrame([r["metrics"] for r in results])
+    trading_results.to_html(os.path.join(output_dir, "trading_results.html"), index=False)
+    output_files.append("trading_results.html")
+    return output_files
+
+def summarize(results: list) -> str:
+    """
+    Text summary printed to the task output: executed trades and metrics per ticker.
+    """
+    lines = []
+    for result in results:
+        if result["trades"].empty:
+            lines.append(f"No trades executed for {result['ticker']}")
+        else:
+            lines.append(f"Trades for {result['ticker']}:")
+            lines.append(result["trades"].to_string(index=False))
+    lines.append(pd.DataFrame([r["metrics"] for r in results]).to_string(index=False))
+    return "\n".join(lines)
+
+def plot_portfolio(result: dict) -> go.Figure:
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.6, 0.4])
+    equity = result["equity"]
+    fig.add_trace(go.Scatter(x=equity.index, y=equity, name="Portfolio Value", line=dict(color="purple")),
+                  row=1, col=1)
+    for ticker in result["tickers"]:
+        weights = result["weights"][ticker] * 100
+        fig.add_trace(go.Scatter(x=weights.index, y=weights, name=ticker, stackgroup="weights"),
+                      row=2, col=1)
+
+    fig.update_layout(title="Portfolio Backtest", xaxis=dict(type="date"))
+    fig.update_yaxes(title_text="Portfolio Value", row=1, col=1)
+    fig.update_yaxes(title_text="Allocation %", range=[0, 100], row=2, col=1)
+    return fig
+
+def write_portfolio_report(result: dict, output_dir: str = ".") -> list:
+    """
+    Write portfolio_plot.html (equity curve and allocation) and portfolio_results.html
+    (metrics and share changes) into output_dir. Returns the file names written.
+    """
+    write_figure(plot_portfolio(result), os.path.join(output_dir, "portfolio_plot.html"))
+    metrics_html = pd.DataFrame([result["metrics"]]).to_html(index=False)
+    trades_html = result["trades"].to_html(index=False)
+    with open(os.path.join(output_dir, "portfolio_results.html"), "w") as f:
+        f.write(f"<h2>Portfolio metrics</h2>{metrics_html}<h2>Trades</h2>{trades_html}")
+    return ["portfolio_plot.html", "portfolio_results.html"]
+
+def summarize_portfolio(result: dict) -> str:
+    lines = [f"Portfolio of {', '.join(result['tickers'])}: {result['metrics']['Trades']} share changes"]
+    lines.append(pd.DataFrame([result["metrics"]]).to_string(index=False))
+    return "\n".join(lines)
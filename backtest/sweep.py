@@ -0,0 +1,165 @@
+# sweep.py
+import copy
+import itertools
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest.engine import backtest_many, compile_strategy
+from marketdata.columnar import load_prices
+
+# Grid search over one interpreted intent. Parameters are addressed by dotted paths
+# into the intent JSON, e.g.
+#   {"buy_condition.conditions.0.value": [25, 30, 35],
+#    "sell_condition.conditions.0.value": {"start": 65, "stop": 80, "step": 5}}
+# The combinations for one ticker run through the engine together (backtest_many
+# vectorizes them across the parameter grid) and share an indicator/condition-mask
+# cache of at most SWEEP_CACHE_MB. (ticker, combination chunk) jobs are spread across
+# a process pool where one can be started; Celery prefork workers are daemonic and
+# may not start child processes, so there the jobs run in-process.
+SWEEP_MAX_COMBINATIONS = int(os.getenv("SWEEP_MAX_COMBINATIONS", "20000"))
+SWEEP_WORKERS = int(os.getenv("SWEEP_WORKERS", str(os.cpu_count() or 1)))
+SWEEP_CACHE_MB = int(os.getenv("SWEEP_CACHE_MB", "256"))  # per job
+# below this many backtests a sweep runs in-process: starting and stopping a pool costs about a second
+SWEEP_PARALLEL_MIN = int(os.getenv("SWEEP_PARALLEL_MIN", "500"))
+METRICS = ["Cumulative Return", "Annualized Return", "Volatility", "Max Drawdown"]
+LOWER_IS_BETTER = {"Volatility", "Max Drawdown"}
+
+def expand_range(spec) -> list:
+    """
+    A list of values, a single value, or an inclusive {"start", "stop", "step"} range.
+    """
+    if isinstance(spec, dict):
+        start, stop = spec["start"], spec["stop"]
+        step = spec.get("step", 1)
+        if step <= 0:
+            raise ValueError(f"Range step must be positive: {spec}")
+        values = np.arange(start, stop + step / 2, step)
+        if all(isinstance(v, int) for v in (start, stop, step)):
+            return [int(v) for v in values]
+        return [round(float(v), 10) for v in values]
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    return [spec]
+
+def parameter_grid(params: dict) -> list:
+    """
+    Cartesian product of all parameter ranges as a list of {path: value} dicts.
+    """
+    paths = list(params)
+    ranges = [expand_range(params[p]) for p in paths]
+    total = int(np.prod([len(r) for r in ranges])) if ranges else 0
+    if total > SWEEP_MAX_COMBINATIONS:
+        raise ValueError(f"Sweep has {total} combinations; the limit is {SWEEP_MAX_COMBINATIONS}")
+    return [dict(zip(paths, values)) for values in itertools.product(*ranges)]
+
+def _set_path(obj, path: str, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        obj = obj[int(key)] if isinstance(obj, list) else obj[key]
+    last = keys[-1]
+    if isinstance(obj, list):
+        obj[int(last)] = value
+    else:
+        obj[last] = value
+
+def apply_params(intent: dict, combo: dict) -> dict:
+    variant = copy.deepcopy(intent)
+    for path, value in combo.items():
+        try:
+            _set_path(variant, path, value)
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            raise ValueError(f"Parameter path {path!r} does not exist in the intent") from e
+    return variant
+
+class MaskCache(OrderedDict):
+    """
+    The engine's per-ticker scratch cache, limited to max_bytes of arrays; the least
+    recently used arrays are dropped first (the engine recomputes them on demand).
+    """
+    def __init__(self, max_bytes: int = SWEEP_CACHE_MB * 1024 * 1024):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.nbytes -= getattr(super().__getitem__(key), "nbytes", 0)
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        self.nbytes += getattr(value, "nbytes", 0)
+        for old in list(self):
+            if self.nbytes <= self.max_bytes or old == key:
+                break
+            if isinstance(old, str):
+                continue  # bookkeeping such as "__ticker__", not an array
+            self.nbytes -= getattr(super().__getitem__(old), "nbytes", 0)
+            del self[old]
+
+def _sweep_job(job: tuple) -> list:
+    ticker, prices_path, strategies, start = job
+    df = load_prices(ticker, path=prices_path)
+    results = backtest_many(ticker, df, strategies, cache=MaskCache())
+    return [dict(result["metrics"], combo=i, Trades=result["trade_count"])
+            for i, result in enumerate(results, start)]
+
+def _can_fork_pool() -> bool:
+    # Celery prefork workers are daemonic and may not start child processes
+    return not multiprocessing.current_process().daemon
+
+def run_sweep(intent: dict, params: dict, prices_path: str, sort_by: str = "Cumulative Return",
+              top: int = 50, max_workers: int = None) -> dict:
+    """
+    Evaluate every parameter combination for every ticker in the columnar cache at prices_path.
+    Returns the combinations ranked by the mean of sort_by across tickers, plus
+    per-ticker rows for the returned combinations.
+    """
+    if sort_by not in METRICS:
+        raise ValueError(f"sort_by must be one of {METRICS}")
+    combos = parameter_grid(params)
+    if not combos:
+        raise ValueError("No sweep parameters given")
+    strategies = [compile_strategy(apply_params(intent, combo)) for combo in combos]
+    tickers = list(load_prices(path=prices_path))
+
+    # split each ticker's combinations so a sweep over few tickers still uses every worker
+    max_workers = max_workers or SWEEP_WORKERS
+    chunks = max(1, min(len(strategies), -(-max_workers // max(1, len(tickers)))))
+    size = -(-len(strategies) // chunks)
+    jobs = [(ticker, prices_path, strategies[start:start + size], start)
+            for ticker in tickers for start in range(0, len(strategies), size)]
+
+    rows = []
+    parallel = max_workers > 1 and len(jobs) > 1 and len(strategies) * len(tickers) >= SWEEP_PARALLEL_MIN
+    if parallel and _can_fork_pool():
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+            for job_rows in pool.map(_sweep_job, jobs):
+                rows.extend(job_rows)
+    else:
+        for job in jobs:
+            rows.extend(_sweep_job(job))
+
+    by_ticker = pd.DataFrame(rows)
+    params_df = pd.DataFrame(combos)
+    ranked = by_ticker.groupby("combo")[METRICS + ["Trades"]].mean()
+    ranked = params_df.join(ranked).sort_values(sort_by, ascending=sort_by in LOWER_IS_BETTER)
+    ranked = ranked.head(top)
+
+    best = by_ticker[by_ticker["combo"].isin(ranked.index)]
+    best = best.merge(params_df, left_on="combo", right_index=True)
+    return {
+        "combinations": len(combos),
+        "tickers": tickers,
+        "sort_by": sort_by,
+        "ranked": ranked.reset_index(drop=True).to_dict("records"),
+        "by_ticker": best.drop(columns="combo").to_dict("records"),
+    }
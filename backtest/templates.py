@@ -0,0 +1,179 @@
+# templates.py
+import copy
+import hashlib
+import json
+import re
+
+from backtest.engine import UnsupportedStrategy, compile_group, compile_strategy
+from backtest.indicators import data_fingerprint
+
+# Vetted strategy templates with parameter slots. An interpreted intent matches a
+# template when its compiled buy/sell conditions are exactly the template's rules
+# for some parameters (e.g. RSI(21) < 25 / RSI(21) > 75 is "rsi" with window=21,
+# buy_below=25, sell_above=75). A strategy named after a template but given no
+# rules gets the template's default rules - the same defaults the interpreter
+# prompt lists. Matched intents run on the native engine with no LLM codegen, and
+# their outputs are cached by (template, params, data fingerprint); anything else
+# goes down the usual engine or codegen path.
+TEMPLATE_VERSION = 1  # bump when template rules or report output change
+
+def _cmp(indicator, operator, value, **extra) -> dict:
+    return dict(indicator=indicator, operator=operator, value=value, **extra)
+
+def _rules(buy: dict, sell: dict) -> tuple:
+    return {"logic": "and", "conditions": [buy]}, {"logic": "and", "conditions": [sell]}
+
+def _single(group):
+    # the one comparison of a single-condition group, without a duration
+    if group[0] != "group" or len(group[2]) != 1:
+        return None
+    node = group[2][0]
+    if node[0] != "cmp" or node[4]:
+        return None
+    return node
+
+def _normalized(node):
+    # "and" and "or" mean the same for a group of one condition, so compare such groups as "and"
+    if node[0] != "group":
+        return node
+    children = tuple(_normalized(child) for child in node[2])
+    return ("group", "and" if len(children) == 1 else node[1], children)
+
+def _window(spec) -> int:
+    return dict(spec[1]).get("window")
+
+def _extract_threshold(kind):
+    def extract(buy, sell):
+        b, s = _single(buy), _single(sell)
+        if not b or not s or b[1][0] != kind or not isinstance(b[3], float) or not isinstance(s[3], float):
+            return None
+        return {"window": _window(b[1]), "buy_below": b[3], "sell_above": s[3]}
+    return extract
+
+def _extract_crossover(kind):
+    def extract(buy, sell):
+        b = _single(buy)
+        if not b or b[1][0] != kind or not isinstance(b[3], tuple):
+            return None
+        return {"short_window": _window(b[1]), "long_window": _window(b[3])}
+    return extract
+
+def _extract_macd(buy, sell):
+    b = _single(buy)
+    return {} if b and b[1][0] == "macd" else None
+
+def _extract_bollinger(buy, sell):
+    b = _single(buy)
+    if not b or b[1][0] != "close" or not isinstance(b[3], tuple):
+        return None
+    return {"window": _window(b[3])}
+
+# name -> aliases (normalized strategy names), default params, rules(params), extract(buy, sell)
+TEMPLATES = {
+    "rsi": {
+        "aliases": ("RSI", "RSISTRATEGY", "RELATIVESTRENGTHINDEX"),
+        "defaults": {"window": 14, "buy_below": 30.0, "sell_above": 70.0},
+        "rules": lambda p: _rules(
+            _cmp("RSI", "<", p["buy_below"], window=p["window"]),
+            _cmp("RSI", ">", p["sell_above"], window=p["window"]),
+        ),
+        "extract": _extract_threshold("rsi"),
+    },
+    "macd": {
+        "aliases": ("MACD", "MACDCROSSOVER", "MACDSTRATEGY"),
+        "defaults": {},
+        "rules": lambda p: _rules(_cmp("MACD", ">", "Signal"), _cmp("MACD", "<", "Signal")),
+        "extract": _extract_macd,
+    },
+    "sma_crossover": {
+        "aliases": ("SMACROSSOVER", "SMA", "MOVINGAVERAGECROSSOVER", "GOLDENCROSS", "DMACROSSOVER"),
+        "defaults": {"short_window": 20, "long_window": 50},
+        "rules": lambda p: _rules(
+            _cmp(f"SMA_{p['short_window']}", ">", f"SMA_{p['long_window']}"),
+            _cmp(f"SMA_{p['short_window']}", "<", f"SMA_{p['long_window']}"),
+        ),
+        "extract": _extract_crossover("sma"),
+    },
+    "ema_crossover": {
+        "aliases": ("EMACROSSOVER", "EMA", "EXPONENTIALMOVINGAVERAGECROSSOVER"),
+        "defaults": {"short_window": 12, "long_window": 26},
+        "rules": lambda p: _rules(
+            _cmp(f"EMA_{p['short_window']}", ">", f"EMA_{p['long_window']}"),
+            _cmp(f"EMA_{p['short_window']}", "<", f"EMA_{p['long_window']}"),
+        ),
+        "extract": _extract_crossover("ema"),
+    },
+    "bollinger": {
+        "aliases": ("BOLLINGERBANDS", "BOLLINGERBAND", "BOLLINGER", "BB", "BBANDS"),
+        "defaults": {"window": 20},
+        "rules": lambda p: _rules(
+            _cmp("Price", "<", "Lower Band", window=p["window"]),
+            _cmp("Price", ">", "Upper Band", window=p["window"]),
+        ),
+        "extract": _extract_bollinger,
+    },
+}
+
+def _strategy_name(intent: dict) -> str:
+    name = intent.get("strategy") or intent.get("strategy_description") or ""
+    return re.sub(r"[^A-Z0-9]", "", str(name).upper())
+
+def has_rules(intent: dict) -> bool:
+    """
+    Whether the intent spells out any buy or sell conditions.
+    """
+    return any(isinstance(intent.get(k), dict) and intent[k].get("conditions")
+               for k in ("buy_condition", "sell_condition"))
+
+def _compiled_rules(name: str, params: dict) -> tuple:
+    buy, sell = TEMPLATES[name]["rules"](params)
+    return compile_group(buy), compile_group(sell)
+
+def match_template(intent: dict):
+    """
+    (template name, params) for an intent one template expresses exactly, else None.
+    Portfolio intents are not templated.
+    """
+    if intent.get("portfolio"):
+        return None
+    if not has_rules(intent):
+        strategy = _strategy_name(intent)
+        for name, template in TEMPLATES.items():
+            if strategy in template["aliases"]:
+                return name, dict(template["defaults"])
+        return None
+
+    try:
+        compiled = compile_strategy(intent)
+    except UnsupportedStrategy:
+        return None
+    for name, template in TEMPLATES.items():
+        params = template["extract"](compiled["buy"], compiled["sell"])
+        if params is None or any(v is None for v in params.values()):
+            continue
+        try:
+            if _compiled_rules(name, params) == (_normalized(compiled["buy"]), _normalized(compiled["sell"])):
+                return name, params
+        except UnsupportedStrategy:
+            continue
+    return None
+
+def apply_template(intent: dict, name: str, params: dict) -> dict:
+    """
+    The intent with its rules replaced by the template's, tagged with "template".
+    """
+    rendered = copy.deepcopy(intent)
+    rendered["buy_condition"], rendered["sell_condition"] = TEMPLATES[name]["rules"](params)
+    rendered["template"] = {"name": name, "params": params}
+    return rendered
+
+def template_key(name: str, params: dict, prices: dict) -> str:
+    """
+    Cache key of a template run: template, params and the content of every ticker's data.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([TEMPLATE_VERSION, name, params], sort_keys=True).encode())
+    for ticker in sorted(prices):
+        h.update(ticker.encode())
+        h.update(data_fingerprint(prices[ticker]).encode())
+    return h.hexdigest()
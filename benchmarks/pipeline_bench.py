@@ -0,0 +1,301 @@
+# pipeline_bench.py
+"""
+End-to-end and per-stage benchmark of the query pipeline.
+
+Runs the LangGraph nodes (interpreter, ticker_lookup, fetch, codegen, code_cleaner,
+validate) one after another, then the execution task, and times the same planning through
+the graph, whose branches overlap, in-process against local stub LLM and FMP
+servers, on synthetic OHLCV data of configurable size, inside a throwaway working
+directory. Reports per-stage latency percentiles, throughput under concurrent
+submissions and memory peaks, and writes everything as JSON for comparison
+across commits.
+
+    python -m benchmarks.pipeline_bench --tickers 10 --years 5 --iterations 20
+    python -m benchmarks.pipeline_bench --path codegen --concurrency 8 --submissions 64
+    python -m benchmarks.pipeline_bench --compare old.json new.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stubs import company_names, start_fmp_stub, start_llm_stub, stub_intent
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+STAGES = ["interpreter", "ticker_lookup", "fetch", "fmp_fetch", "codegen", "code_cleaner", "validate", "executor", "total",
+          "planning_graph"]
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000  # ms
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+def _rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss / scale
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _setup_environment(args):
+    """
+    Start the stubs, point the pipeline at them and move into a scratch directory.
+    Must run before the pipeline modules are imported: they read their configuration
+    (API URLs, database paths) at import time.
+    """
+    intent = stub_intent(args.tickers, args.years, engine=args.path == "engine")
+    llm = start_llm_stub(intent, args.llm_latency / 1000)
+    fmp = start_fmp_stub(args.fmp_latency / 1000)
+
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_API_BASE": f"{llm.url}/v1",
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+        "FMP_API_KEY": "benchmark",
+        "FMP_BASE_URL": fmp.url,
+        "FMP_RATE_LIMIT": "0",
+        "LLM_CACHE_ENABLED": "1" if args.llm_cache else "0",
+        "TASK_EVENTS_ENABLED": "0",
+        "METRICS_BACKEND": "local",
+        "TRACE_LOG_ENABLED": "0",
+        "WARM_POOL_ENABLED": "0" if args.no_warm_pool else "1",
+    })
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    return llm, fmp, workdir
+
+class Pipeline:
+    """
+    The pipeline stages as direct calls, each timed; execution runs the Celery
+    task eagerly with an in-memory result backend, so no broker is needed.
+    """
+    def __init__(self, trace_memory: bool):
+        import workflow
+        from tasks.executor import app, run_engine_backtest, run_python_code
+
+        app.conf.update(result_backend="cache+memory://", task_always_eager=True)
+        self.workflow = workflow
+        self.run_engine_backtest = run_engine_backtest
+        self.run_python_code = run_python_code
+        self.trace_memory = trace_memory
+
+        # time the FMP download inside node_fetch separately
+        fetch = workflow.get_fmp_stock_data
+        def timed_fetch(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return fetch(*a, **kw)
+            finally:
+                self._record("fmp_fetch", time.perf_counter() - start)
+        workflow.get_fmp_stock_data = timed_fetch
+        self.timings = None
+
+    def _record(self, stage, seconds):
+        if self.timings is not None:
+            self.timings[stage] = seconds
+
+    def _stage(self, name, fn, state, memory):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        update = fn(state)
+        self.timings[name] = time.perf_counter() - start
+        if self.trace_memory:
+            memory[name] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        state.update(update or {})
+        return state
+
+    def _execute(self, state):
+        if state.get("use_engine"):
+            intent_json = state["intent"].replace("```json\n", "").replace("\n```", "")
+            result = self.run_engine_backtest.apply(args=(intent_json, state["data_snapshot"])).result
+        else:
+            result = self.run_python_code.apply(args=(state["clean_code"], state.get("data_snapshot"))).result
+        if not result.get("files"):
+            raise RuntimeError(f"Execution produced no files: {result.get('output', '')[-500:]}")
+        return {}
+
+    def run(self, query: str) -> tuple:
+        wf = self.workflow
+        self.timings, memory = {}, {}
+        start = time.perf_counter()
+        state = {"input": query}
+        self._stage("interpreter", wf.node_interpreter, state, memory)
+        self._stage("ticker_lookup", wf.node_ticker_lookup, state, memory)
+        self._stage("fetch", wf.node_fetch, state, memory)
+        self._stage("codegen", wf.node_codegen, state, memory)
+        if not state.get("use_engine"):
+            self._stage("code_cleaner", wf.node_cleaner, state, memory)
+        state.update(wf.node_join(state))
+        if not state.get("use_engine"):
+            self._stage("validate", wf.node_validate, state, memory)
+        self._stage("executor", self._execute, state, memory)
+        self.timings["total"] = time.perf_counter() - start
+
+        # the same planning through the graph, whose data and code branches overlap
+        start = time.perf_counter()
+        wf.plan_query(query)
+        self.timings["planning_graph"] = time.perf_counter() - start
+        return self.timings, memory
+
+def run_concurrent(args, query: str) -> dict:
+    """
+    Submit args.submissions end-to-end runs from args.concurrency threads.
+    """
+    import workflow
+    from tasks.executor import run_engine_backtest, run_python_code
+
+    def one(_):
+        start = time.perf_counter()
+        state = workflow.plan_query(query)
+        if state.get("use_engine"):
+            run_engine_backtest.apply(args=(state["intent"], state["data_snapshot"]))
+        else:
+            run_python_code.apply(args=(state["clean_code"], state.get("data_snapshot")))
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(one, range(args.submissions)))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": args.concurrency,
+        "submissions": args.submissions,
+        "wall_s": wall,
+        "throughput_per_s": args.submissions / wall if wall else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+def run_benchmark(args) -> dict:
+    llm, fmp, workdir = _setup_environment(args)
+    if args.trace_memory:
+        tracemalloc.start()
+    pipeline = Pipeline(args.trace_memory)
+    query = f"Backtest RSI on {', '.join(company_names(args.tickers))} for the past {args.years} years"
+
+    samples = {stage: [] for stage in STAGES}
+    memory_peaks = {}
+    cold = None
+    for i in range(args.warmup + args.iterations):
+        timings, memory = pipeline.run(query)
+        if i == 0:
+            cold = {k: v * 1000 for k, v in timings.items()}
+        if i < args.warmup:
+            continue
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds)
+        for stage, mb in memory.items():
+            memory_peaks[stage] = max(memory_peaks.get(stage, 0.0), mb)
+
+    throughput = run_concurrent(args, query) if args.submissions else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "workdir": workdir,
+        "cold_run_ms": cold,
+        "stages": {stage: percentiles(s) for stage, s in samples.items() if s},
+        "throughput": throughput,
+        "memory": {
+            "peak_rss_mb": _rss_mb(),
+            "peak_child_rss_mb": _rss_mb(resource.RUSAGE_CHILDREN),
+            "stage_peak_traced_mb": memory_peaks or None,
+        },
+        "requests": {"llm": llm.requests, "fmp": fmp.requests},
+    }
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """
+    Print p50/p90 deltas per stage; returns 1 if any stage regressed by more than threshold percent.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'stage':<15}{'metric':<8}{old.get('commit', '?'):>12}{new.get('commit', '?'):>12}{'delta':>10}")
+    regressed = False
+    for stage in STAGES:
+        a, b = old["stages"].get(stage), new["stages"].get(stage)
+        if not a or not b:
+            continue
+        for metric in ("p50_ms", "p90_ms"):
+            delta = (b[metric] - a[metric]) / a[metric] * 100 if a[metric] else 0.0
+            flag = " !" if delta > threshold else ""
+            regressed = regressed or bool(flag)
+            print(f"{stage:<15}{metric[:3]:<8}{a[metric]:>12.1f}{b[metric]:>12.1f}{delta:>9.1f}%{flag}")
+    if old.get("throughput") and new.get("throughput"):
+        a, b = old["throughput"]["throughput_per_s"], new["throughput"]["throughput_per_s"]
+        print(f"{'throughput':<23}{a:>12.2f}{b:>12.2f}{(b - a) / a * 100 if a else 0.0:>9.1f}%")
+    return 1 if regressed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", type=int, default=5, help="synthetic tickers per query")
+    parser.add_argument("--years", type=float, default=2, help="years of daily bars per ticker")
+    parser.add_argument("--path", choices=["engine", "codegen"], default="engine",
+                        help="engine: strategy runs on the native engine; codegen: LLM codegen + cleaner + script")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1, help="runs excluded from the percentiles")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--submissions", type=int, default=0, help="end-to-end runs for the throughput test (0 = skip)")
+    parser.add_argument("--llm-latency", type=float, default=0, help="stub LLM latency per request, ms")
+    parser.add_argument("--fmp-latency", type=float, default=0, help="stub FMP latency per request, ms")
+    parser.add_argument("--llm-cache", action="store_true", help="leave the LLM response cache enabled")
+    parser.add_argument("--no-warm-pool", action="store_true", help="run scripts in fresh subprocesses")
+    parser.add_argument("--trace-memory", action="store_true", help="per-stage tracemalloc peaks (slower)")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold for --compare, percent")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    output = os.path.abspath(args.output) if args.output else None
+    result = run_benchmark(args)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit']}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<15} p50 {stats['p50_ms']:9.1f} ms   p90 {stats['p90_ms']:9.1f} ms   max {stats['max_ms']:9.1f} ms")
+    if result["throughput"]:
+        print(f"throughput     {result['throughput']['throughput_per_s']:.2f} runs/s at concurrency {args.concurrency}")
+    print(f"peak rss       {result['memory']['peak_rss_mb']:.0f} MB (children {result['memory']['peak_child_rss_mb']:.0f} MB)")
+    print(f"results        {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# stubs.py
+"""
+Local stand-ins for the external services the pipeline calls, for benchmarking:
+an OpenAI-compatible chat completions server and an FMP server that serves
+deterministic synthetic OHLCV data. Both add a configurable fixed latency per
+request so network-bound stages can be modelled.
+"""
+import datetime
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+COMPANY_PREFIX = "Benchmark Company"
+SYMBOL_PREFIX = "BM"
+
+# script the stub "codegen" stage returns: loads the snapshot, reports events, writes compact plots
+STUB_SCRIPT = """import pandas as pd
+import plotly.graph_objects as go
+from marketdata.columnar import load_prices
+from backtest.plotting import write_figure
+from tasks.script_output import emit
+
+prices = load_prices()
+tickers = sorted(prices)
+output_files = []
+for i, ticker in enumerate(tickers):
+    emit("progress", ticker=ticker, done=i, total=len(tickers))
+    df = prices[ticker]
+    sma = df["Close"].rolling(window=20).mean().shift(1)
+    cumulative = (df["Close"].iloc[-1] / df["Close"].iloc[0] - 1) * 100
+    emit("metrics", ticker=ticker, metrics={"Cumulative Return": float(cumulative)})
+    fig = go.Figure([go.Scatter(x=df.index, y=df["Close"], name="Close"),
+                     go.Scatter(x=df.index, y=sma, name="SMA(20)")])
+    write_figure(fig, f"{ticker}_plot.html")
+    output_files.append(f"{ticker}_plot.html")
+print("Generated files:", output_files)
+"""
+
+def company_names(count: int) -> list:
+    return [f"{COMPANY_PREFIX} {i}" for i in range(count)]
+
+def stub_intent(tickers: int, years: float, engine: bool = True) -> dict:
+    """
+    Intent the stub interpreter returns. engine=True uses RSI rules the native engine
+    runs; engine=False uses an indicator it cannot express, forcing codegen + cleaner.
+    """
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=int(365 * years))
+    indicator = "RSI" if engine else "VWAP"
+    return {
+        "ticker": company_names(tickers),
+        "strategy": indicator,
+        "buy_condition": {"logic": "and", "conditions": [{"indicator": indicator, "operator": "<", "value": 30}]},
+        "sell_condition": {"logic": "and", "conditions": [{"indicator": indicator, "operator": ">", "value": 70}]},
+        "start_date": start.isoformat(),
+        "end_date": today.isoformat(),
+    }
+
+def synthetic_ohlcv(symbol: str, start: str, end: str) -> list:
+    """
+    Deterministic geometric random walk per symbol, newest bar first like FMP.
+    """
+    seed = int.from_bytes(hashlib.blake2b(symbol.encode(), digest_size=4).digest(), "little")
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+    days = days[np.is_busday(days)]
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(days))))
+    spread = np.abs(rng.normal(0, 0.01, len(days)))
+    rows = [
+        {"date": str(d), "open": round(float(c * (1 - s / 2)), 4), "high": round(float(c * (1 + s)), 4),
+         "low": round(float(c * (1 - s)), 4), "close": round(float(c), 4), "adjClose": round(float(c), 4),
+         "volume": int(1e6 + i * 10)}
+        for i, (d, c, s) in enumerate(zip(days, close, spread))
+    ]
+    return rows[::-1]
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "BenchmarkStub/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+
+class _FMPHandler(_Handler):
+    def do_GET(self):
+        self._delay()
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = [urllib.parse.unquote(p) for p in url.path.split("/") if p]
+        if parts and parts[-1] == "search":
+            name = query.get("query", "")
+            if not name.startswith(COMPANY_PREFIX):
+                return self._send_json([])
+            index = name[len(COMPANY_PREFIX):].strip()
+            return self._send_json([
+                {"symbol": f"{SYMBOL_PREFIX}{index}.NS", "name": name, "exchangeShortName": "NSE"},
+                {"symbol": f"{SYMBOL_PREFIX}{index}.BO", "name": name, "exchangeShortName": "BSE"},
+            ])
+        if len(parts) >= 2 and parts[-2] == "historical-price-full":
+            symbol = parts[-1]
+            # only the listing itself has data, so suffix probes like X.NS.NS come back empty
+            if symbol.count(".") != 1 or not symbol.startswith(SYMBOL_PREFIX):
+                return self._send_json({})
+            historical = synthetic_ohlcv(symbol, query["from"], query["to"])
+            return self._send_json({"symbol": symbol, "historical": historical})
+        self._send_json({"error": "not found"}, status=404)
+
+class _LLMHandler(_Handler):
+    def do_POST(self):
+        self._delay()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+        if "extracts structured info" in system:
+            content = json.dumps(self.server.intent)
+        elif "code formatter" in system:
+            content = user
+        else:
+            content = STUB_SCRIPT
+
+        usage = {"prompt_tokens": len(system + user) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if body.get("stream"):
+            return self._stream(body, content)
+        self._send_json({
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, body, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for i in range(0, len(content), 64):
+            chunk = {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": content[i:i + 64]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, latency: float = 0.0, intent: dict = None):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.intent = intent
+        self.requests = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+def start_fmp_stub(latency: float = 0.0) -> StubServer:
+    return StubServer(_FMPHandler, latency)
+
+def start_llm_stub(intent: dict, latency: float = 0.0) -> StubServer:
+    return StubServer(_LLMHandler, latency, intent)
@@ -1,48 +1,90 @@
 import { useState, useEffect } from "react";
 
+const API_BASE = "http://localhost:8000";
+const MAX_OUTPUT_LINES = 200;
+
 export default function TradingQueryInput() {
   const [query, setQuery] = useState("");
   const [taskId, setTaskId] = useState(null);
   const [status, setStatus] = useState("");
   const [files, setFiles] = useState([]);
+  const [output, setOutput] = useState([]);
 
-  // Poll backend for task status
+  // Follow task progress over server-sent events; fall back to polling if the
+  // stream cannot be opened or drops before the result arrives
   useEffect(() => {
     if (!taskId) return;
 
-    const interval = setInterval(async () => {
-      try {
-        const res = await fetch(`http://localhost:8000/api/task-status/${taskId}`);
-        const data = await res.json();
+    let interval = null;
+    let finished = false;
 
-        if (data.status === "SUCCESS") {
-          setStatus("Completed! See generated charts below.");
-          setFiles(data.files || []);
-          clearInterval(interval);
-        } else if (data.status === "FAILURE") {
-          setStatus("Task failed. Check logs.");
+    const showResult = (data) => {
+      finished = true;
+      if (data.status === "SUCCESS") {
+        setStatus("Completed! See generated charts below.");
+        setFiles(data.files || []);
+      } else {
+        setStatus(`Task failed: ${data.error || "check logs."}`);
+      }
+    };
+
+    const poll = () => {
+      interval = setInterval(async () => {
+        try {
+          const res = await fetch(`${API_BASE}/api/task-status/${taskId}`);
+          const data = await res.json();
+
+          if (data.status === "SUCCESS" || data.status === "FAILURE") {
+            showResult(data);
+            clearInterval(interval);
+          } else {
+            setStatus(`Task status: ${data.status}...`);
+          }
+        } catch (err) {
+          setStatus("Error fetching task status.");
+          console.error(err);
           clearInterval(interval);
-        } else {
-          setStatus(`Task status: ${data.status}...`);
         }
-      } catch (err) {
-        setStatus("Error fetching task status.");
-        console.error(err);
-        clearInterval(interval);
-      }
-    }, 2000);
+      }, 2000);
+    };
+
+    const source = new EventSource(`${API_BASE}/api/task-events/${taskId}`);
 
-    return () => clearInterval(interval);
+    source.addEventListener("status", (e) => {
+      const data = JSON.parse(e.data);
+      setStatus(`Task status: ${data.status}...`);
+    });
+
+    source.addEventListener("output", (e) => {
+      const { line } = JSON.parse(e.data);
+      setOutput((lines) => [...lines, line].slice(-MAX_OUTPUT_LINES));
+    });
+
+    source.addEventListener("result", (e) => {
+      showResult(JSON.parse(e.data));
+      source.close();
+    });
+
+    source.onerror = () => {
+      source.close();
+      if (!finished) poll();
+    };
+
+    return () => {
+      source.close();
+      if (interval) clearInterval(interval);
+    };
   }, [taskId]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
     setStatus("Submitting query...");
     setFiles([]);
+    setOutput([]);
     setTaskId(null);
 
     try {
-      const res = await fetch("http://localhost:8000/api/submit-query", {
+      const res = await fetch(`${API_BASE}/api/submit-query`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ query }),
@@ -106,6 +148,15 @@ export default function TradingQueryInput() {
           </div>
         )}
 
+        {output.length > 0 && (
+          <pre
+            className="mt-4 p-3 bg-gray-900 text-gray-100 rounded-lg"
+            style={{ maxHeight: "240px", overflowY: "auto", fontSize: "12px", whiteSpace: "pre-wrap" }}
+          >
+            {output.join("\n")}
+          </pre>
+        )}
+
         {files.length > 0 && (
           <div className="mt-6 p-3 bg-gray-50 border rounded-lg space-y-6">
             <h2 className="text-lg font-bold mb-2">Generated Charts:</h2>
@@ -113,7 +164,7 @@ export default function TradingQueryInput() {
               <div key={file} className="space-y-2">
                 <p className="font-semibold">{file}</p>
                 <iframe
-                  src={`http://localhost:8000/plots/${file}`}
+                  src={`${API_BASE}/plots/${file}`}
                   title={file}
                   width="100%"
                   height="500px"
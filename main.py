@@ -2,186 +2,77 @@
 
 import os
 import json
-import sqlite3
-import pandas as pd
-import requests
-import urllib.parse
-from dotenv import load_dotenv
-from typing import TypedDict
-import re      # ✅ missing
-import ast     # ✅ missing
+from collections import Counter
+from typing import List, Optional
 import logging  # ✅ missing
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
 from celery.result import AsyncResult
 
 # your multi-agent/langgraph imports
-from agents.interpreter import interpret_query
-from agents.codegen import generate_code
-from agents.code_cleaner import clean_code
-from agents.ticker_lookup import resolve_ticker
-from langgraph.graph import StateGraph, END
+from agents.llm_cache import get_cache as get_llm_cache
+from marketdata.snapshot import create_snapshot
+from backtest.engine import is_supported
+from backtest.templates import apply_template, has_rules, match_template
+from backtest.plotting import write_plotly_js
+from workflow import get_fmp_stock_data, node_interpreter, node_ticker_lookup
 
 # Celery app + task
 from tasks.executor import app as celery_app
-from tasks.executor import run_python_code  # Celery task
+from tasks.executor import run_parameter_sweep  # Celery tasks
+from tasks.pipeline import run_batch_pipeline, run_query_pipeline
+from tasks.events import TERMINAL_STATES, next_event, subscribe
+from tasks.results import list_files, read_manifest, result_path
+from tracing import TRACE_HEADER, bind_trace, current_trace_id, render_metrics, unbind_trace
 
 # -----------------------------
 # Config
 # -----------------------------
 PLOTS_DIR = os.path.abspath(".")  # directory where .html plots are written
 os.makedirs(PLOTS_DIR, exist_ok=True)
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on idle event streams
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))
 
-# -----------------------------
-# Types & Models
-# -----------------------------
-class GraphState(TypedDict):
-    input: str
-    intent: str
-    code: str
-    clean_code: str
-    execution_result: str
-
-class QueryRequest(BaseModel):
-    query: str
+# shared plotly.js for compact plots, served as /plots/assets/plotly.min.js
+write_plotly_js(os.path.join(PLOTS_DIR, "assets"))
 
 # -----------------------------
-# Utilities
+# Types & Models
 # -----------------------------
-def save_dataframe_to_sqlite(df: pd.DataFrame, db_name: str = "market_data.db", table_name: str = "stock_data"):
-    conn = sqlite3.connect(db_name)
-    df.to_sql(table_name, conn, if_exists="replace", index=False)
-    conn.close()
-
-def fetch_fmp_single_ticker(tkr: str, ticker_try: str, start_date: str, end_date: str) -> pd.DataFrame:
-    """
-    Fetch historical data for a single ticker_try from FMP.
-    Returns empty DataFrame on no-data or HTTP error.
-    """
-    load_dotenv()
-    FMP_API_KEY = os.getenv("FMP_API_KEY")
-    FMP_BASE_URL = "https://financialmodelingprep.com/api/v3"
-    url = f"{FMP_BASE_URL}/historical-price-full/{urllib.parse.quote(ticker_try)}"
-    params = {"from": start_date, "to": end_date, "apikey": FMP_API_KEY}
-
-    resp = requests.get(url, params=params, timeout=15)
-    if resp.status_code != 200:
-        # return empty DataFrame (caller will try other suffixes)
-        print(f"HTTP Error {resp.status_code} for {ticker_try}")
-        return pd.DataFrame()
-
-    data = resp.json()
-    if "historical" not in data or not data["historical"]:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(data["historical"])
-    df.rename(columns={
-        "date": "Date",
-        "close": "Close",
-        "open": "Open",
-        "high": "High",
-        "low": "Low",
-        "volume": "Volume",
-        "adjClose": "Adj Close" if "adjClose" in df.columns else "Close"
-    }, inplace=True)
-
-    keep_cols = [c for c in ["Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"] if c in df.columns]
-    df = df[keep_cols]
-    df["Ticker"] = tkr
-    return df
-
-def get_fmp_stock_data(tickers, start_date: str, end_date: str) -> pd.DataFrame:
+class CachedStaticFiles(StaticFiles):
     """
-    Fetch data for a list or comma-separated string of tickers.
-    Raises RuntimeError if nothing fetched.
+    StaticFiles for job results and shared assets only (PLOTS_DIR is the repo root),
+    with cache headers: job results never change once written (each job has its
+    own directory), shared assets are cached for a day.
     """
-    # normalize tickers
-    if isinstance(tickers, str):
-        tickers = [t.strip() for t in tickers.split(",")]
-    elif not isinstance(tickers, list):
-        raise ValueError("Tickers must be string or list")
-
-    dfs = []
-    for tkr in tickers:
-        found = False
-        for suffix in [".NS", ".BS", ""]:
-            ticker_try = tkr + suffix if suffix else tkr
-            df = fetch_fmp_single_ticker(tkr, ticker_try, start_date, end_date)
-            if not df.empty:
-                dfs.append(df)
-                found = True
-                break
-        if not found:
-            print(f"No data found for {tkr} with any suffix")
-
-    if not dfs:
-        raise RuntimeError("No data fetched for any ticker.")
-
-    final_df = pd.concat(dfs, ignore_index=True)
-    save_dataframe_to_sqlite(final_df)
-    return final_df
-
-# -----------------------------
-# LangGraph nodes
-# -----------------------------
-def node_interpreter(state):
-    user_input = state["input"]
-    return interpret_query(user_input)
-
-def node_ticker_lookup(state):
-    try:
-        intent_json = state["intent"].replace("```json\n", "").replace("\n```", "")
-        parsed = json.loads(intent_json)
-        ticker_or_company = parsed["ticker"]
-        resolved = resolve_ticker(ticker_or_company)
-        parsed["ticker"] = resolved
-        return {"intent": json.dumps(parsed)}
-    except Exception as e:
-        return {"intent": state.get("intent", ""), "error": str(e)}
-
-def node_codegen(state):
-    cleaned_content = state["intent"].replace("```json\n", "").replace("\n```", "")
-    parsed_query = json.loads(cleaned_content)
-    tickers = parsed_query["ticker"]
-    start_date = parsed_query["start_date"]
-    end_date = parsed_query["end_date"]
-    _buy_condition = parsed_query.get("buy_condition")
-    _sell_condition = parsed_query.get("sell_condition")
-
-    # Fetch data and then call generate_code
-    stock_data = get_fmp_stock_data(tickers, start_date, end_date)
-    return generate_code(cleaned_content, stock_data)
+    async def get_response(self, path, scope):
+        if not os.path.normpath(path).startswith("assets" + os.sep) and result_path(path) is None:
+            raise HTTPException(status_code=404)
+        response = await super().get_response(path, scope)
+        if path.startswith("results/"):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=86400"
+        return response
 
-def node_cleaner(state):
-    return clean_code(state["code"])
+class QueryRequest(BaseModel):
+    query: str
 
-def node_executor(state):
-    # queue Celery task with the cleaned code
-    result = run_python_code.delay(state["clean_code"])
-    return {"execution_result": f"Task submitted: {result.id}"}
+class BatchRequest(BaseModel):
+    queries: List[str]
 
-# -----------------------------
-# Build LangGraph
-# -----------------------------
-builder = StateGraph(GraphState)
-builder.add_node("interpreter", node_interpreter)
-builder.add_node("ticker_lookup", node_ticker_lookup)
-builder.add_node("codegen", node_codegen)
-builder.add_node("code_cleaner", node_cleaner)
-builder.add_node("executor", node_executor)
-
-builder.set_entry_point("interpreter")
-builder.add_edge("interpreter", "ticker_lookup")
-builder.add_edge("ticker_lookup", "codegen")
-builder.add_edge("codegen", "code_cleaner")
-builder.add_edge("code_cleaner", "executor")
-builder.add_edge("executor", END)
-
-langgraph_app = builder.compile()
+class SweepRequest(BaseModel):
+    query: Optional[str] = None
+    intent: Optional[dict] = None  # already interpreted intent (tickers resolved); skips the LLM
+    params: dict  # dotted intent path -> list of values or {"start", "stop", "step"}
+    sort_by: str = "Cumulative Return"
+    top: int = 50
 
 # -----------------------------
 # FastAPI app
@@ -194,48 +85,104 @@ fastapi_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER],
 )
 
+fastapi_app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+@fastapi_app.middleware("http")
+async def trace_request(request: Request, call_next):
+    # continue the caller's trace if it sent one; the id is echoed back and
+    # handed to every Celery task the request queues
+    token = bind_trace(request.headers.get(TRACE_HEADER))
+    try:
+        response = await call_next(request)
+        response.headers[TRACE_HEADER] = current_trace_id()
+        return response
+    finally:
+        unbind_trace(token)
+
 # Serve generated HTML files under /plots/* for iframe usage
-fastapi_app.mount("/plots", StaticFiles(directory=PLOTS_DIR), name="plots")
+fastapi_app.mount("/plots", CachedStaticFiles(directory=PLOTS_DIR), name="plots")
 
-# ---- submit-query (queue task and return task_id) ----
+# ---- submit-query (queue the pipeline and return task_id) ----
 @fastapi_app.post("/api/submit-query")
-async def submit_query(req: QueryRequest):
+def submit_query(req: QueryRequest):
     """
-    Run the LangGraph pipeline which will eventually enqueue a Celery task.
-    Returns the Celery task id so the frontend can poll /api/task-status/<id>.
+    Queue the LangGraph pipeline as a Celery task and return its id immediately.
+    The frontend polls /api/task-status/<id>: the status moves through the planning
+    stages (INTERPRETING, RESOLVING_TICKERS, FETCHING_DATA, GENERATING_CODE, CLEANING_CODE,
+    VALIDATING_CODE, REPAIRING_CODE) and then the execution states under the same id.
     """
     try:
-        # run the graph synchronously (it will call node_executor which enqueues Celery)
-        final = langgraph_app.invoke({"input": req.query})
+        trace_id = current_trace_id()
+        result = run_query_pipeline.delay(req.query, trace_id=trace_id)
+        return {"status": "PENDING", "task_id": result.id, "trace_id": trace_id}
 
-        # LangGraph node_executor returns {"execution_result": "Task submitted: <id>"}
-        execution_result = final.get("execution_result", "") if isinstance(final, dict) else ""
-        if not execution_result:
-            # As fallback, try to extract from different structure
-            execution_result = final
-
-        # parse the result like "Task submitted: <id>"
-        task_id = None
-        if isinstance(execution_result, str):
-            if ":" in execution_result:
-                task_id = execution_result.split(":", 1)[1].strip()
-            else:
-                task_id = execution_result.strip()
+    except Exception as e:
+        # don't crash the server; return error to frontend
+        return {"status": "ERROR", "error": str(e)}
 
-        if not task_id:
-            return {"status": "ERROR", "error": "Could not parse Celery task id from pipeline output", "pipeline_result": execution_result}
+# ---- submit-batch (many queries, one planning pass, executions fanned out) ----
+@fastapi_app.post("/api/submit-batch")
+def submit_batch(req: BatchRequest):
+    """
+    Queue a batch of queries. They are interpreted concurrently, the union of their
+    tickers and date ranges is fetched once, and each query then executes as its own
+    task. Poll /api/batch-status/<batch_id> for the aggregated status and results.
+    """
+    queries = [q.strip() for q in req.queries if q.strip()]
+    if not queries:
+        return {"status": "ERROR", "error": "At least one query is required"}
+    if len(queries) > BATCH_MAX_QUERIES:
+        return {"status": "ERROR", "error": f"A batch holds at most {BATCH_MAX_QUERIES} queries"}
+    try:
+        trace_id = current_trace_id()
+        result = run_batch_pipeline.delay(queries, trace_id=trace_id)
+        return {"status": "PENDING", "batch_id": result.id, "queries": len(queries), "trace_id": trace_id}
+    except Exception as e:
+        return {"status": "ERROR", "error": str(e)}
 
-        return {"status": "PENDING", "task_id": task_id}
+# ---- sweep (grid-search one strategy over parameter ranges) ----
+@fastapi_app.post("/api/sweep")
+def submit_sweep(req: SweepRequest):
+    """
+    Interpret the query (or take a ready intent), fetch its data once, and queue a
+    parameter sweep on the native engine. Poll /api/task-status/<id> for the ranked table.
+    """
+    try:
+        if req.intent is not None:
+            parsed = req.intent
+        elif req.query:
+            state = {"input": req.query}
+            state.update(node_interpreter(state))
+            state.update(node_ticker_lookup(state))
+            if state.get("error"):
+                return {"status": "ERROR", "error": state["error"]}
+            parsed = json.loads(state["intent"])
+        else:
+            return {"status": "ERROR", "error": "Either query or intent is required"}
+
+        # a strategy named without rules gets its template's default rules; rules the
+        # intent spells out are kept as written, since the swept parameter paths point into them
+        template = match_template(parsed)
+        if template and not has_rules(parsed):
+            parsed = apply_template(parsed, *template)
+        if not is_supported(parsed):
+            return {"status": "ERROR", "error": "Strategy cannot be swept: the native engine does not support its conditions"}
+
+        stock_data = get_fmp_stock_data(parsed["ticker"], parsed["start_date"], parsed["end_date"])
+        snapshot_path = create_snapshot(stock_data)
+        result = run_parameter_sweep.delay(json.dumps(parsed), snapshot_path, req.params, req.sort_by, req.top,
+                                           trace_id=current_trace_id())
+        return {"status": "PENDING", "task_id": result.id, "intent": parsed, "trace_id": current_trace_id()}
 
     except Exception as e:
-        # don't crash the server; return error to frontend
         return {"status": "ERROR", "error": str(e)}
 
 # ---- task-status endpoint (single canonical) ----
 @fastapi_app.get("/api/task-status/{task_id}")
-async def task_status(task_id: str):
+def task_status(task_id: str):
     async_result = AsyncResult(task_id, app=celery_app)
     state = async_result.state
 
@@ -244,58 +191,157 @@ async def task_status(task_id: str):
         logging.info("DEBUG result from Celery: %r", res)
 
         files = []
-        output = ""
-
         if isinstance(res, dict):
             files = res.get("files") or res.get("html_files") or []
-            output = res.get("output", "")
-        else:
-            output = str(res)
-
-        # --- NEW: fallback parser for "Generated files: ['...']"
-        if not files and output:
-            m = re.search(r"Generated files:\s*(\[.*\])", output)
-            if m:
-                try:
-                    candidate = m.group(1)
-                    parsed = ast.literal_eval(candidate)
-                    if isinstance(parsed, (list, tuple)):
-                        files = list(parsed)
-                except Exception:
-                    logging.exception("Failed to parse Generated files from output")
-
-        return {"status": "SUCCESS", "files": files}
+
+        response = {"status": "SUCCESS", "files": files}
+        if isinstance(res, dict) and res.get("results") is not None:
+            response["results"] = res["results"]
+        if isinstance(res, dict) and res.get("metrics"):
+            response["metrics"] = res["metrics"]
+        if isinstance(res, dict) and res.get("manifest"):
+            response["manifest"] = res["manifest"]
+        return response
 
     elif state == "FAILURE":
+        # tasks report failures by raising (tasks.executor.fail), so the result is the exception
         err = async_result.result
         return {"status": "FAILURE", "error": str(err)}
 
-    meta = async_result.info or {}
-    logs = meta.get("logs", [])
-    return {"status": state, "logs": logs}
-
-    # For ongoing states return state (PENDING/PROGRESS/STARTED)
-    # If the worker updates meta logs, include them for frontend visibility
-    meta = async_result.info or {}
+    meta = async_result.info if isinstance(async_result.info, dict) else {}
     logs = meta.get("logs", [])
-    return {"status": state, "logs": logs}
-
-# ---- optional: list all html files under PLOTS_DIR ----
+    return {
+        "status": state,
+        "stage": meta.get("stage"),
+        "logs": logs,
+        "progress": meta.get("progress"),
+        "metrics": meta.get("metrics"),
+        "files": meta.get("files"),
+    }
+
+# ---- batch-status: planning progress, then every job's status and metrics ----
+@fastapi_app.get("/api/batch-status/{batch_id}")
+def batch_status(batch_id: str):
+    """
+    While the batch is planned this mirrors /api/task-status of the planning task.
+    Afterwards each job carries its own task status; the batch is PROGRESS until
+    every job has finished, then SUCCESS, PARTIAL (some failed) or FAILURE (all failed).
+    "metrics" flattens the per-ticker metrics of all finished jobs into table rows.
+    """
+    planning = task_status(batch_id)
+    result = AsyncResult(batch_id, app=celery_app).result if planning["status"] == "SUCCESS" else None
+    if not isinstance(result, dict) or "jobs" not in result:
+        return dict(planning, batch_id=batch_id)
+
+    jobs, rows = [], []
+    for index, job in enumerate(result["jobs"]):
+        if job["task_id"] is None:
+            status = {"status": "FAILURE", "error": job["error"]}
+        else:
+            status = task_status(job["task_id"])
+        jobs.append(dict(status, index=index, query=job["query"], task_id=job["task_id"]))
+        for ticker, metrics in (status.get("metrics") or {}).items():
+            rows.append(dict(metrics, index=index, query=job["query"], Ticker=ticker))
+
+    counts = Counter(job["status"] for job in jobs)
+    done = sum(counts[s] for s in TERMINAL_STATES)
+    if done < len(jobs):
+        state = "PROGRESS"
+    elif counts["SUCCESS"] == len(jobs):
+        state = "SUCCESS"
+    else:
+        state = "FAILURE" if counts["SUCCESS"] == 0 else "PARTIAL"
+    return {
+        "status": state,
+        "batch_id": batch_id,
+        "counts": dict(counts, total=len(jobs), done=done),
+        "jobs": jobs,
+        "metrics": rows,
+    }
+
+# ---- task-events: push stream of a task's progress (server-sent events) ----
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@fastapi_app.get("/api/task-events/{task_id}")
+async def task_events(task_id: str, request: Request):
+    """
+    Stream a task's stage transitions, log lines and script output as they happen.
+    The first event is the current status; the last is "result", carrying the same
+    payload as /api/task-status, after which the stream closes.
+    """
+    async def stream():
+        client, pubsub = await subscribe(task_id)
+        try:
+            current = await run_in_threadpool(task_status, task_id)
+            if current["status"] in TERMINAL_STATES:
+                yield sse("result", current)
+                return
+            yield sse("status", current)
+
+            while not await request.is_disconnected():
+                event = await next_event(pubsub, timeout=SSE_KEEPALIVE)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                elif event["type"] == "done":
+                    yield sse("result", await run_in_threadpool(task_status, task_id))
+                    return
+                else:
+                    yield sse(event["type"], event)
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+            await client.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # an explicit Content-Encoding keeps GZipMiddleware from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"},
+    )
+
+# ---- LLM response cache hit/miss metrics ----
+@fastapi_app.get("/api/llm-cache-stats")
+def llm_cache_stats():
+    return get_llm_cache().stats()
+
+# ---- Prometheus metrics: span latency histograms from the API and all workers ----
+@fastapi_app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# ---- job results: manifest of one job's output files and metrics ----
+@fastapi_app.get("/api/results/{job_id}")
+def get_results(job_id: str):
+    manifest = read_manifest(job_id)
+    if manifest is None:
+        return {"error": "Results not found"}
+    return manifest
+
+# ---- figure JSON of a compact plot, for clients that render it with plotly.js ----
+@fastapi_app.get("/api/figure/{file_name:path}")
+def get_figure(file_name: str):
+    file_path = result_path(os.path.splitext(file_name)[0] + ".json")
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Figure not found")
+    return FileResponse(file_path, media_type="application/json",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+# ---- list produced html files, newest first, one page at a time ----
 @fastapi_app.get("/api/list-html")
-def list_html_files():
+def list_html_files(offset: int = 0, limit: int = 50, job_id: Optional[str] = None):
     try:
-        files = [f for f in os.listdir(PLOTS_DIR) if f.endswith(".html")]
-        return {"files": files}
+        return list_files(offset=max(0, offset), limit=min(max(1, limit), 500), job_id=job_id)
     except Exception as e:
         return {"files": [], "error": str(e)}
 
 # ---- serve a single html file (if needed) ----
-@fastapi_app.get("/api/html/{file_name}")
+@fastapi_app.get("/api/html/{file_name:path}")
 def get_html(file_name: str):
-    file_path = os.path.join(PLOTS_DIR, file_name)
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="text/html")
-    return {"error": "File not found"}
+    file_path = result_path(file_name)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(file_path, media_type="text/html")
 
 # -----------------------------
 # Run standalone (dev)
@@ -0,0 +1,82 @@
+# columnar.py
+import json
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Per-ticker typed cache: <root>/<ticker>/index.npy (datetime64[ns]) + values.npy
+# (float64 matrix, one column per VALUE_COLUMNS entry) + meta.json.
+# Loading memory-maps the arrays, so no SQL, no string parsing and no copy.
+VALUE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+MARKET_DATA_DIR_ENV = "MARKET_DATA_DIR"
+
+def _safe_name(ticker: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._&-]", "_", ticker)
+
+def write_columnar(df: pd.DataFrame, root: str) -> str:
+    """
+    Write a long-format price DataFrame (Date, Ticker, OHLCV columns) as one
+    partition per ticker under root. The tree is built in a temporary directory
+    and renamed into place. Returns root.
+    """
+    tmp_root = f"{root}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_root)
+    try:
+        for ticker, group in df.groupby("Ticker", sort=True):
+            group = group.assign(Date=pd.to_datetime(group["Date"])).sort_values("Date")
+            columns = [c for c in VALUE_COLUMNS if c in group.columns]
+            part = os.path.join(tmp_root, _safe_name(ticker))
+            os.makedirs(part)
+            np.save(os.path.join(part, "index.npy"), group["Date"].values.astype("datetime64[ns]"))
+            np.save(os.path.join(part, "values.npy"), np.ascontiguousarray(group[columns].to_numpy(dtype="float64")))
+            with open(os.path.join(part, "meta.json"), "w") as f:
+                json.dump({"ticker": ticker, "columns": columns, "rows": len(group)}, f)
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.replace(tmp_root, root)
+    except Exception:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        raise
+    return root
+
+def _load_partition(part: str, mmap: bool = True):
+    with open(os.path.join(part, "meta.json")) as f:
+        meta = json.load(f)
+    mode = "r" if mmap else None
+    index = np.load(os.path.join(part, "index.npy"), mmap_mode=mode)
+    values = np.load(os.path.join(part, "values.npy"), mmap_mode=mode)
+    df = pd.DataFrame(values, index=pd.DatetimeIndex(index, name="Date"), columns=meta["columns"], copy=False)
+    return meta["ticker"], df
+
+def load_prices(ticker: str = None, path: str = None, mmap: bool = True):
+    """
+    Load price history from the columnar cache.
+
+    path defaults to the MARKET_DATA_DIR environment variable set by the executor.
+    With ticker given, returns that ticker's DataFrame; otherwise returns
+    {ticker: DataFrame} for every ticker in the cache. Each DataFrame is indexed by
+    a sorted DatetimeIndex named Date and has float64 OHLCV columns. With mmap=True
+    the price columns are read-only views of the files; add new columns freely but
+    call .copy() before modifying price values in place.
+    """
+    path = path or os.environ.get(MARKET_DATA_DIR_ENV)
+    if not path:
+        raise RuntimeError(f"No columnar cache path given and {MARKET_DATA_DIR_ENV} is not set")
+
+    if ticker is not None:
+        part = os.path.join(path, _safe_name(ticker))
+        if not os.path.isdir(part):
+            raise KeyError(f"No cached prices for {ticker}")
+        return _load_partition(part, mmap)[1]
+
+    prices = {}
+    for name in sorted(os.listdir(path)):
+        part = os.path.join(path, name)
+        if os.path.isfile(os.path.join(part, "meta.json")):
+            tkr, df = _load_partition(part, mmap)
+            prices[tkr] = df
+    return prices
@@ -0,0 +1,203 @@
+# fmp.py
+import os
+import time
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from tracing import propagate, span
+
+load_dotenv()
+
+# FMP_BASE_URL can be pointed at a local stub server for testing
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+FMP_BASE_URL = os.getenv("FMP_BASE_URL", "https://financialmodelingprep.com/api/v3")
+FMP_MAX_CONCURRENCY = int(os.getenv("FMP_MAX_CONCURRENCY", "8"))
+FMP_RATE_LIMIT = float(os.getenv("FMP_RATE_LIMIT", "10"))  # requests per second, per host
+FMP_TIMEOUT = 15
+
+TICKER_SUFFIXES = [".NS", ".BS", ""]
+
+class FetchFailed(RuntimeError):
+    """
+    Raised when FMP did not answer a price request with 200: the range may have
+    bars, so it must not be recorded as empty.
+    """
+
+# -----------------------------
+# Shared session + rate limiting
+# -----------------------------
+class RateLimiter:
+    """
+    Token bucket: allows `rate` requests per second with bursts up to `burst`.
+    """
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_session = None
+_session_lock = threading.Lock()
+_limiters = {}
+
+def get_session() -> requests.Session:
+    """
+    Process-wide keep-alive session, sized so every worker thread gets a pooled connection.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=FMP_MAX_CONCURRENCY)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def _limiter_for(url: str) -> RateLimiter:
+    host = urllib.parse.urlsplit(url).netloc
+    with _session_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter(FMP_RATE_LIMIT)
+        return _limiters[host]
+
+def fmp_get(url: str, params: dict, timeout: float = FMP_TIMEOUT) -> requests.Response:
+    """
+    GET through the shared session, honouring the per-host rate limit.
+    Traced as span fmp.request; time spent waiting on the rate limit is logged with it.
+    """
+    endpoint = url[len(FMP_BASE_URL):].strip("/").split("/")[0] if url.startswith(FMP_BASE_URL) else url
+    with span("fmp.request", endpoint=endpoint) as attrs:
+        start = time.perf_counter()
+        _limiter_for(url).acquire()
+        attrs["throttled_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        resp = get_session().get(url, params=params, timeout=timeout)
+        attrs["status_code"] = resp.status_code
+        return resp
+
+# -----------------------------
+# Fetching
+# -----------------------------
+def fetch_fmp_single_ticker(tkr: str, ticker_try: str, start_date: str, end_date: str) -> pd.DataFrame:
+    """
+    Fetch historical data for a single ticker_try from FMP.
+    Returns an empty DataFrame when FMP has no bars; raises FetchFailed on an HTTP
+    error and requests.RequestException when the request itself fails.
+    """
+    url = f"{FMP_BASE_URL}/historical-price-full/{urllib.parse.quote(ticker_try)}"
+    params = {"from": start_date, "to": end_date, "apikey": FMP_API_KEY}
+
+    with span("fmp.fetch_ticker", ticker=ticker_try) as attrs:
+        resp = fmp_get(url, params)
+        if resp.status_code != 200:
+            raise FetchFailed(f"HTTP Error {resp.status_code} for {ticker_try}")
+        data = resp.json()
+        attrs["rows"] = len(data.get("historical") or []) if isinstance(data, dict) else 0
+
+    if "historical" not in data or not data["historical"]:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(data["historical"])
+    df.rename(columns={
+        "date": "Date",
+        "close": "Close",
+        "open": "Open",
+        "high": "High",
+        "low": "Low",
+        "volume": "Volume",
+        "adjClose": "Adj Close" if "adjClose" in df.columns else "Close"
+    }, inplace=True)
+
+    keep_cols = [c for c in ["Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"] if c in df.columns]
+    df = df[keep_cols]
+    df["Ticker"] = tkr
+    return df
+
+def _probe(tkr: str, ticker_try: str, start_date: str, end_date: str):
+    # the bars (possibly none), or None if FMP could not be asked
+    try:
+        return fetch_fmp_single_ticker(tkr, ticker_try, start_date, end_date)
+    except (requests.RequestException, FetchFailed) as e:
+        print(f"Request failed for {ticker_try}: {e}")
+        return None
+
+def fetch_tickers_serial(tickers, start_date: str, end_date: str, failed: set = None) -> dict:
+    """
+    Original one-at-a-time behaviour: try each suffix in order until one returns data.
+    Returns {ticker: DataFrame} for tickers that had data; tickers without data
+    for which some request failed are added to failed.
+    """
+    results = {}
+    for tkr in tickers:
+        errors = 0
+        for suffix in TICKER_SUFFIXES:
+            ticker_try = tkr + suffix if suffix else tkr
+            df = _probe(tkr, ticker_try, start_date, end_date)
+            if df is None:
+                errors += 1
+            elif not df.empty:
+                results[tkr] = df
+                break
+        if errors and tkr not in results and failed is not None:
+            failed.add(tkr)
+    return results
+
+def fetch_tickers_concurrent(tickers, start_date: str, end_date: str, max_workers: int = None,
+                             failed: set = None) -> dict:
+    """
+    Fetch many tickers at once over the shared session.
+    All suffix probes for a ticker race each other; the first non-empty result wins
+    and the ticker's remaining queued probes are cancelled.
+    Returns {ticker: DataFrame} for tickers that had data; tickers without data
+    for which some request failed are added to failed.
+    """
+    max_workers = max_workers or FMP_MAX_CONCURRENCY
+    results = {}
+    errors = set()
+    pending = {}  # ticker -> list of futures still outstanding
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        future_to_ticker = {}
+        for tkr in tickers:
+            for suffix in TICKER_SUFFIXES:
+                ticker_try = tkr + suffix if suffix else tkr
+                fut = pool.submit(propagate(_probe), tkr, ticker_try, start_date, end_date)
+                future_to_ticker[fut] = tkr
+                pending.setdefault(tkr, []).append(fut)
+
+        for fut in as_completed(future_to_ticker):
+            tkr = future_to_ticker[fut]
+            if tkr in results or fut.cancelled():
+                continue
+            df = fut.result()
+            if df is None:
+                errors.add(tkr)
+            elif not df.empty:
+                results[tkr] = df
+                for other in pending[tkr]:
+                    other.cancel()
+
+    if failed is not None:
+        failed.update(errors - set(results))
+    return results
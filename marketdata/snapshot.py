@@ -0,0 +1,80 @@
+# snapshot.py
+import os
+import shutil
+import sqlite3
+import stat
+import time
+import uuid
+
+import pandas as pd
+
+from marketdata.columnar import write_columnar
+
+# Each pipeline run gets its own read-only snapshot directory so a later query can
+# never change the data an already-queued backtest will read:
+#   snapshots/<run_id>/market_data.db   SQLite copy (table stock_data)
+#   snapshots/<run_id>/prices/<ticker>/ columnar cache read by marketdata.columnar.load_prices
+SNAPSHOT_DIR = os.path.abspath(os.getenv("SNAPSHOT_DIR", "snapshots"))
+SNAPSHOT_TTL = int(os.getenv("SNAPSHOT_TTL", str(24 * 3600)))  # seconds
+SNAPSHOT_TABLE = "stock_data"
+SNAPSHOT_DB = "market_data.db"
+SNAPSHOT_PRICES = "prices"
+
+def create_snapshot(df: pd.DataFrame, run_id: str = None) -> str:
+    """
+    Freeze df into snapshots/<run_id>/ and return the directory's absolute path.
+    The directory is built under a temporary name and renamed, so readers never see a partial snapshot.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    prune_snapshots()
+
+    run_id = run_id or uuid.uuid4().hex
+    path = os.path.join(SNAPSHOT_DIR, run_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_path)
+
+    try:
+        db_path = os.path.join(tmp_path, SNAPSHOT_DB)
+        conn = sqlite3.connect(db_path)
+        try:
+            df.to_sql(SNAPSHOT_TABLE, conn, if_exists="replace", index=False)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{SNAPSHOT_TABLE}_ticker_date ON {SNAPSHOT_TABLE} ("Ticker", "Date")')
+            conn.commit()
+        finally:
+            conn.close()
+        os.chmod(db_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        write_columnar(df, os.path.join(tmp_path, SNAPSHOT_PRICES))
+        os.replace(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+def snapshot_env(snapshot: str) -> dict:
+    """
+    Environment variables that point a generated script at a snapshot.
+    """
+    return {
+        "MARKET_DATA_DB": os.path.join(snapshot, SNAPSHOT_DB),
+        "MARKET_DATA_DIR": os.path.join(snapshot, SNAPSHOT_PRICES),
+    }
+
+def prune_snapshots(max_age: int = SNAPSHOT_TTL):
+    """
+    Delete snapshots older than max_age seconds.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,184 @@
+# store.py
+import contextlib
+import datetime
+import sqlite3
+
+import pandas as pd
+
+DB_NAME = "market_data.db"
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_history (
+    "Ticker" TEXT NOT NULL,
+    "Date" TEXT NOT NULL,
+    "Open" REAL,
+    "High" REAL,
+    "Low" REAL,
+    "Close" REAL,
+    "Adj Close" REAL,
+    "Volume" INTEGER,
+    PRIMARY KEY ("Ticker", "Date")
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS price_coverage (
+    "Ticker" TEXT NOT NULL,
+    "start" TEXT NOT NULL,
+    "end" TEXT NOT NULL,
+    PRIMARY KEY ("Ticker", "start")
+);
+"""
+
+def _to_date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+def _merge_ranges(ranges):
+    """
+    Merge inclusive (start, end) date ranges that overlap or touch.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class PriceStore:
+    """
+    Durable OHLCV store keyed by (Ticker, Date).
+    Bars are upserted, and the date ranges already fetched per ticker are tracked
+    in price_coverage so callers only need to download the gaps.
+    """
+    def __init__(self, db_name: str = DB_NAME):
+        self.db_name = db_name
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def covered_ranges(self, ticker: str) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT "start", "end" FROM price_coverage WHERE "Ticker" = ? ORDER BY "start"',
+                (ticker,),
+            ).fetchall()
+        return [(_to_date(s), _to_date(e)) for s, e in rows]
+
+    def missing_ranges(self, ticker: str, start_date, end_date) -> list:
+        """
+        Return the inclusive (start, end) ISO date pairs within [start_date, end_date]
+        that have not been fetched for this ticker yet.
+        """
+        start, end = _to_date(start_date), _to_date(end_date)
+        gaps = []
+        cursor = start
+        for cov_start, cov_end in self.covered_ranges(ticker):
+            if cov_end < cursor:
+                continue
+            if cov_start > end:
+                break
+            if cov_start > cursor:
+                gaps.append((cursor, cov_start - datetime.timedelta(days=1)))
+            cursor = max(cursor, cov_end + datetime.timedelta(days=1))
+            if cursor > end:
+                break
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return [(s.isoformat(), e.isoformat()) for s, e in gaps]
+
+    def upsert(self, df: pd.DataFrame, start_date=None, end_date=None):
+        """
+        Insert or update bars from a fetched DataFrame and, if a range is given,
+        mark [start_date, end_date] as covered for every ticker in it.
+        Today's (possibly still forming) bar is never marked as covered.
+        """
+        rows = []
+        if not df.empty:
+            frame = df.copy()
+            for col in PRICE_COLUMNS:
+                if col not in frame.columns:
+                    frame[col] = None
+            frame["Date"] = frame["Date"].map(lambda d: _to_date(d).isoformat())
+            frame = frame.astype(object).where(frame.notna(), None)
+            rows = frame[["Ticker", "Date"] + PRICE_COLUMNS].values.tolist()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if rows:
+                conn.executemany(
+                    'INSERT INTO price_history ("Ticker", "Date", "Open", "High", "Low", "Close", "Adj Close", "Volume") '
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    'ON CONFLICT("Ticker", "Date") DO UPDATE SET '
+                    '"Open"=excluded."Open", "High"=excluded."High", "Low"=excluded."Low", '
+                    '"Close"=excluded."Close", "Adj Close"=excluded."Adj Close", "Volume"=excluded."Volume"',
+                    rows,
+                )
+            if start_date is not None and end_date is not None and not df.empty:
+                end = min(_to_date(end_date), datetime.date.today() - datetime.timedelta(days=1))
+                start = _to_date(start_date)
+                if start <= end:
+                    for ticker in df["Ticker"].unique():
+                        self._add_coverage(conn, ticker, start, end)
+
+    def mark_covered(self, tickers, start_date, end_date):
+        """
+        Record a fetched range even when it returned no bars (e.g. a weekend gap).
+        """
+        start = _to_date(start_date)
+        end = min(_to_date(end_date), datetime.date.today() - datetime.timedelta(days=1))
+        if start > end:
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for ticker in tickers:
+                self._add_coverage(conn, ticker, start, end)
+
+    def _add_coverage(self, conn, ticker, start, end):
+        rows = conn.execute(
+            'SELECT "start", "end" FROM price_coverage WHERE "Ticker" = ?', (ticker,)
+        ).fetchall()
+        ranges = [(_to_date(s), _to_date(e)) for s, e in rows] + [(start, end)]
+        conn.execute('DELETE FROM price_coverage WHERE "Ticker" = ?', (ticker,))
+        conn.executemany(
+            'INSERT INTO price_coverage ("Ticker", "start", "end") VALUES (?, ?, ?)',
+            [(ticker, s.isoformat(), e.isoformat()) for s, e in _merge_ranges(ranges)],
+        )
+
+    def load(self, tickers, start_date, end_date) -> pd.DataFrame:
+        """
+        Read stored bars for tickers within [start_date, end_date], in the same
+        column layout get_fmp_stock_data has always returned.
+        """
+        if not tickers:
+            return pd.DataFrame(columns=["Date"] + PRICE_COLUMNS + ["Ticker"])
+        placeholders = ",".join("?" for _ in tickers)
+        query = (
+            'SELECT "Date", "Open", "High", "Low", "Close", "Adj Close", "Volume", "Ticker" '
+            f'FROM price_history WHERE "Ticker" IN ({placeholders}) AND "Date" BETWEEN ? AND ? '
+            'ORDER BY "Ticker", "Date"'
+        )
+        params = list(tickers) + [_to_date(start_date).isoformat(), _to_date(end_date).isoformat()]
+        with self._connect() as conn:
+            df = pd.read_sql(query, conn, params=params)
+        if df["Adj Close"].isna().all():
+            df = df.drop(columns=["Adj Close"])
+        return df
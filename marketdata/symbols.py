@@ -0,0 +1,217 @@
+# symbols.py
+import contextlib
+import difflib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from marketdata.fmp import FMP_API_KEY, FMP_BASE_URL, FMP_MAX_CONCURRENCY, fmp_get
+from tracing import propagate
+
+# Persistent name/alias -> symbol index used by agents.ticker_lookup.
+# Lookups are served from an in-process map; only names it does not know (or whose
+# entries are older than SYMBOL_INDEX_TTL) go to the FMP /search endpoint. A close
+# but inexact alias (difflib, SYMBOL_FUZZY_CUTOFF) is only used when the search
+# finds nothing or fails, and is logged, since it can be a different company.
+DB_NAME = "market_data.db"
+SYMBOL_INDEX_TTL = int(os.getenv("SYMBOL_INDEX_TTL", str(30 * 24 * 3600)))  # seconds
+SYMBOL_FUZZY_CUTOFF = float(os.getenv("SYMBOL_FUZZY_CUTOFF", "0.9"))
+EXCHANGE_PREFERENCE = [e.strip() for e in os.getenv("SYMBOL_EXCHANGES", "NSE,BSE").split(",") if e.strip()]
+EXCHANGE_SUFFIXES = {"NSE": ".NS", "BSE": ".BO"}
+
+# dropped from names so "Reliance Industries Ltd." and "reliance industries" match
+CORPORATE_SUFFIXES = {"ltd", "limited", "inc", "incorporated", "corp", "corporation", "co", "plc", "the"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbol_index (
+    alias TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    exchange TEXT,
+    name TEXT,
+    rank INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    PRIMARY KEY (alias, symbol)
+) WITHOUT ROWID;
+"""
+
+def normalize_name(name: str) -> str:
+    words = re.sub(r"[^a-z0-9&]+", " ", str(name).lower()).split()
+    kept = [w for w in words if w not in CORPORATE_SUFFIXES]
+    return " ".join(kept or words)
+
+def _aliases(name: str, symbol: str) -> set:
+    aliases = {normalize_name(symbol.split(".")[0])}
+    if name:
+        aliases.add(normalize_name(name))
+    aliases.discard("")
+    return aliases
+
+class SymbolIndex:
+    """
+    Name/alias -> symbol map persisted in SQLite and mirrored in memory.
+    When an alias maps to several listings the preferred exchange wins
+    (EXCHANGE_PREFERENCE, NSE then BSE by default), then the search rank.
+    """
+    def __init__(self, db_name: str = DB_NAME, ttl: int = SYMBOL_INDEX_TTL,
+                 exchanges: list = None, fuzzy_cutoff: float = SYMBOL_FUZZY_CUTOFF):
+        self.db_name = db_name
+        self.ttl = ttl
+        self.exchanges = exchanges or EXCHANGE_PREFERENCE
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.entries = {}  # alias -> {symbol: (exchange, rank, updated)}
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            rows = conn.execute("SELECT alias, symbol, exchange, rank, updated FROM symbol_index").fetchall()
+        for alias, symbol, exchange, rank, updated in rows:
+            self.entries.setdefault(alias, {})[symbol] = (exchange, rank, updated)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _best(self, candidates: dict) -> str:
+        def preference(item):
+            exchange, rank, _ = item[1]
+            pref = self.exchanges.index(exchange) if exchange in self.exchanges else len(self.exchanges)
+            return pref, rank
+        return min(candidates.items(), key=preference)[0]
+
+    def lookup(self, name: str, allow_stale: bool = False, fuzzy: bool = False):
+        """
+        Resolve a name from memory only. Returns None on a miss or, unless allow_stale,
+        when the matching entries are older than the TTL. With fuzzy, a name with no
+        exact alias falls back to the closest alias above the fuzzy cutoff.
+        """
+        key = normalize_name(name)
+        with self.lock:
+            candidates = self.entries.get(key)
+            if not candidates and fuzzy and key:
+                close = difflib.get_close_matches(key, list(self.entries), n=1, cutoff=self.fuzzy_cutoff)
+                candidates = self.entries.get(close[0]) if close else None
+                if candidates:
+                    print(f"⚠️ No exact match for {name}, using the close match '{close[0]}'")
+            if not candidates:
+                return None
+            fresh = {s: v for s, v in candidates.items() if time.time() - v[2] <= self.ttl}
+            if not fresh and not allow_stale:
+                return None
+            return self._best(fresh or candidates)
+
+    def add(self, rows):
+        """
+        Upsert (alias, symbol, exchange, name, rank) rows.
+        """
+        now = time.time()
+        rows = [(normalize_name(a), s, e, n, r, now) for a, s, e, n, r in rows if normalize_name(a)]
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO symbol_index (alias, symbol, exchange, name, rank, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        with self.lock:
+            for alias, symbol, exchange, _, rank, updated in rows:
+                self.entries.setdefault(alias, {})[symbol] = (exchange, rank, updated)
+        return len(rows)
+
+    def load_listing(self, path: str, exchange: str = None) -> int:
+        """
+        Bulk-load an exchange listing CSV (e.g. NSE's EQUITY_L.csv). Recognizes
+        SYMBOL/symbol and NAME OF COMPANY/name/companyName columns, plus an
+        exchange/exchangeShortName column when the file covers several exchanges.
+        """
+        df = pd.read_csv(path, dtype=str).fillna("")
+        df.columns = [c.strip() for c in df.columns]
+        symbol_col = next(c for c in df.columns if c.lower() == "symbol")
+        name_col = next((c for c in df.columns if c.lower() in ("name of company", "name", "companyname")), None)
+        exchange_col = next((c for c in df.columns if c.lower() in ("exchange", "exchangeshortname")), None)
+
+        rows = []
+        for record in df.to_dict("records"):
+            ex = (record[exchange_col] if exchange_col else exchange) or None
+            symbol = record[symbol_col].strip()
+            if not symbol:
+                continue
+            if "." not in symbol and ex in EXCHANGE_SUFFIXES:
+                symbol += EXCHANGE_SUFFIXES[ex]
+            name = record[name_col].strip() if name_col else ""
+            rows.extend((alias, symbol, ex, name, 0) for alias in _aliases(name, symbol))
+        return self.add(rows)
+
+    def search(self, name: str):
+        """
+        Query FMP /search for one name, index every result under the name and
+        return the preferred symbol (None if FMP knows nothing).
+        """
+        resp = fmp_get(f"{FMP_BASE_URL}/search", {"query": name, "apikey": FMP_API_KEY})
+        resp.raise_for_status()
+        results = resp.json() or []
+        rows = []
+        for rank, r in enumerate(results):
+            symbol, exchange = r.get("symbol"), r.get("exchangeShortName")
+            if not symbol:
+                continue
+            rows.append((name, symbol, exchange, r.get("name"), rank))
+            # a listing whose own name or symbol matches the alias outranks search order
+            exact = rank - len(results)
+            rows.extend((alias, symbol, exchange, r.get("name"), exact) for alias in _aliases(r.get("name"), symbol))
+        if not rows:
+            return None
+        self.add(rows)
+        return self.lookup(name)
+
+    def resolve(self, names: list, max_workers: int = None) -> dict:
+        """
+        Resolve many names at once: {name: symbol or None}. Cached names never
+        leave the process; the rest are searched concurrently, falling back to a
+        stale entry if the search fails, and to a fuzzy match if neither finds anything.
+        """
+        resolved = {name: self.lookup(name) for name in names}
+        misses = [name for name, symbol in resolved.items() if symbol is None]
+        if not misses:
+            return resolved
+
+        def search_one(name):
+            try:
+                symbol = self.search(name)
+            except (requests.RequestException, ValueError) as e:
+                print(f"❌ Error resolving {name}: {e}")
+                symbol = self.lookup(name, allow_stale=True)
+            return symbol or self.lookup(name, allow_stale=True, fuzzy=True)
+
+        with ThreadPoolExecutor(max_workers=min(len(misses), max_workers or FMP_MAX_CONCURRENCY)) as pool:
+            for name, symbol in zip(misses, pool.map(propagate(search_one), misses)):
+                resolved[name] = symbol
+        return resolved
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_symbol_index() -> SymbolIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SymbolIndex()
+        return _index
+
+if __name__ == "__main__":
+    # python -m marketdata.symbols EQUITY_L.csv NSE
+    if len(sys.argv) < 2:
+        sys.exit("usage: python -m marketdata.symbols <listing.csv> [EXCHANGE]")
+    count = get_symbol_index().load_listing(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Indexed {count} aliases from {sys.argv[1]}")
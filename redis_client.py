@@ -0,0 +1,20 @@
+# redis_client.py
+import os
+import threading
+
+import redis
+
+# Shared Redis connection for task events (tasks.events) and pipeline metrics
+# (tracing). It lives at the top level so modules outside tasks, e.g. marketdata
+# through tracing, do not depend on the tasks package.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_redis() -> redis.Redis:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(REDIS_URL)
+        return _client
@@ -0,0 +1,51 @@
+# events.py
+import json
+import logging
+import os
+
+import redis
+import redis.asyncio as aioredis
+
+from redis_client import REDIS_URL, get_redis
+
+# Push channel for task progress. Workers publish small JSON events on a per-task
+# Redis pub/sub channel; the API relays them to browsers as server-sent events.
+#   {"type": "status", "status": "GENERATING_CODE", "stage": "codegen"}
+#   {"type": "log", "message": "Starting execution..."}
+#   {"type": "output", "line": "..."}            one line of script stdout
+#   {"type": "done", "status": "SUCCESS"}        result is stored in the backend
+TASK_EVENTS_ENABLED = os.getenv("TASK_EVENTS_ENABLED", "1") == "1"
+TERMINAL_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+
+def channel(task_id: str) -> str:
+    return f"task-events:{task_id}"
+
+def publish(task_id: str, event_type: str, **data):
+    """
+    Best effort: progress events must never fail the task that sends them.
+    """
+    if not task_id or not TASK_EVENTS_ENABLED:
+        return
+    try:
+        get_redis().publish(channel(task_id), json.dumps(dict(data, type=event_type), default=str))
+    except redis.RedisError:
+        logging.exception("Could not publish %s event for %s", event_type, task_id)
+
+async def subscribe(task_id: str):
+    """
+    Async pub/sub subscription for one task; the caller must close it.
+    Subscribe before reading the current state so no event can fall in between.
+    """
+    client = aioredis.Redis.from_url(REDIS_URL)
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel(task_id))
+    return client, pubsub
+
+async def next_event(pubsub, timeout: float):
+    """
+    The next event on the subscription, or None if nothing arrived within timeout.
+    """
+    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+    if message is None:
+        return None
+    return json.loads(message["data"])
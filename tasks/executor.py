@@ -4,93 +4,295 @@ import subprocess
 import uuid
 import os
 import logging
-import ast
 import time
+import json
+from collections import deque
+
+from marketdata.snapshot import snapshot_env
+from marketdata.columnar import load_prices
+from backtest.engine import run_backtest
+from backtest.portfolio import run_portfolio
+from backtest.report import write_portfolio_report, write_reports, summarize, summarize_portfolio
+from backtest.sweep import run_sweep
+from backtest.templates import template_key
+from tasks.worker_pool import WARM_POOL_ENABLED, LineReader, get_pool
+from tasks.events import TERMINAL_STATES, publish
+from tasks.script_output import OUTPUT_TAIL_LINES, OutputCollector
+from tasks.results import job_dir, remember_output, reuse_output, write_manifest
+from tracing import bind_trace, flush_metrics, record_span, span, unbind_trace
+from celery.signals import task_postrun, task_prerun, worker_process_init
 
 logging.basicConfig(level=logging.INFO)
 
 app = Celery(
     "executor",
     broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    backend="redis://localhost:6379/0",
+    include=["tasks.pipeline"],
 )
 
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SCRIPT_DIR = "generated_scripts"
+PROGRESS_INTERVAL = 0.5  # seconds between task meta updates from script events
 os.makedirs(SCRIPT_DIR, exist_ok=True)
 
-# Optionally, set the PLOTS_DIR to the same folder your FastAPI serves via StaticFiles.
-# If FastAPI uses PLOTS_DIR = os.path.abspath("."), keep this as '.'
-PLOTS_DIR = os.path.abspath(".")  
+@worker_process_init.connect
+def warm_up_pool(**kwargs):
+    # start the warm interpreters as soon as the Celery worker process forks,
+    # so the first job does not pay for importing pandas/ta/plotly
+    if WARM_POOL_ENABLED:
+        get_pool()
+
+# task id -> (trace token, start time) of the task running in this process
+_running = {}
+
+@task_prerun.connect
+def start_trace(task_id=None, task=None, kwargs=None, **extra):
+    # tasks queued by the API carry its trace id; anything else traces under its own id
+    trace_id = (kwargs or {}).get("trace_id") or task_id
+    _running[task_id] = (bind_trace(trace_id), time.perf_counter())
+
+@task_postrun.connect
+def announce_result(task_id=None, task=None, state=None, **kwargs):
+    # the result is already stored when postrun fires, so listeners can fetch it.
+    # A pipeline task replaced by its execution task ends as IGNORED; the
+    # replacement reports under the same id.
+    if state in TERMINAL_STATES:
+        publish(task_id, "done", status=state)
+
+    token, start = _running.pop(task_id, (None, None))
+    if token is not None:
+        record_span(f"task.{task.name.rsplit('.', 1)[-1]}", time.perf_counter() - start,
+                    "error" if state == "FAILURE" else "ok", task_id=task_id, state=state)
+        unbind_trace(token)
+    flush_metrics()
+
+def report(task, state: str, logs: list, **meta):
+    """
+    Store the task state with its logs and push the newest log line to listeners.
+    """
+    task.update_state(state=state, meta=dict(meta, logs=logs))
+    publish(task.request.id, "status", status=state, **meta)
+    if logs:
+        publish(task.request.id, "log", message=logs[-1])
+
+class TaskFailed(RuntimeError):
+    """
+    Raised by a task once its failure has been reported; Celery stores the task as
+    FAILURE with this message, which /api/task-status returns as "error".
+    """
+
+def fail(task, logs: list, error: str):
+    """
+    Push the failure to listeners and raise TaskFailed(error).
+    """
+    publish(task.request.id, "status", status="FAILURE")
+    if logs:
+        publish(task.request.id, "log", message=logs[-1])
+    raise TaskFailed(error)
+
+def stream_subprocess(cmd: list, env: dict, timeout: float, on_line, cwd: str = None) -> bytes:
+    """
+    Run cmd with stdout+stderr piped, calling on_line for each line as it arrives.
+    Same contract as subprocess.check_output: returns the output or raises
+    CalledProcessError / TimeoutExpired, except that the output is only the last
+    OUTPUT_TAIL_LINES lines, like a warm worker's.
+    """
+    deadline = time.monotonic() + timeout
+    with span("run_python_code.spawn", pool="subprocess"):
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, cwd=cwd)
+    reader = LineReader(proc.stdout, cmd)
+    chunks = deque(maxlen=OUTPUT_TAIL_LINES)
+    try:
+        while True:
+            line = reader.readline(max(0.0, deadline - time.monotonic()))
+            if not line:
+                break
+            chunks.append(line)
+            on_line(line.decode(errors="replace").rstrip("\n"))
+        proc.wait(max(0.0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout, output=b"".join(chunks))
+    finally:
+        proc.stdout.close()
+
+    output = b"".join(chunks)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=output)
+    return output
 
 @app.task(bind=True)
-def run_python_code(self, code: str):
+def run_python_code(self, code: str, data_snapshot: str = None, trace_id: str = None):
     """
     Save the incoming code, run it in a subprocess, and return output + discovered HTML files.
-    The function tries multiple strategies to discover generated HTML files:
-      1) Look for a printed debug line: Generated files: [...]
-      2) Detect new .html files created between before/after snapshots of PLOTS_DIR.
+    data_snapshot is the per-run snapshot directory the script reads (exposed as
+    MARKET_DATA_DB / MARKET_DATA_DIR); without it scripts fall back to the shared market_data.db.
+    Output is parsed line by line as it arrives (tasks.script_output): progress,
+    per-ticker metrics and produced files are pushed into the task meta while the
+    script runs, and only a capped head/tail of the raw output is kept.
+    The script runs inside its own results/<task id>/ directory, and a manifest of
+    what it wrote is saved there (tasks.results); returned file paths are relative
+    to PLOTS_DIR. The write, spawn, execute and discover phases are traced
+    under trace_id (bound by the task_prerun handler).
     """
-    filename = os.path.join(SCRIPT_DIR, f"code_{uuid.uuid4().hex}.py")
+    filename = os.path.abspath(os.path.join(SCRIPT_DIR, f"code_{uuid.uuid4().hex}.py"))
     logging.info(f"Saved code to {filename} (length={len(code)})")
     
-    with open(filename, "w") as f:
-        f.write(code)
+    with span("run_python_code.write", bytes=len(code)):
+        with open(filename, "w") as f:
+            f.write(code)
 
     logs = []
+    collector = OutputCollector()
+    last_update = [0.0]
     try:
-        # Snapshot before running
-        before_html = set([f for f in os.listdir(PLOTS_DIR) if f.endswith(".html")])
+        out_dir = job_dir(self.request.id or uuid.uuid4().hex)
 
         logs.append("Starting execution...")
-        self.update_state(state="PROGRESS", meta={"logs": logs})
-
-        # Execute the script
-        output = subprocess.check_output(
-            ["python", filename],
-            stderr=subprocess.STDOUT,
-            timeout=60  # increase if scripts take longer
-        )
-        decoded_output = output.decode()
+        report(self, "PROGRESS", logs)
+
+        job_env = snapshot_env(os.path.abspath(data_snapshot)) if data_snapshot else {}
+
+        def on_line(line):
+            event = collector.feed(line)
+            if event is None:
+                publish(self.request.id, "output", line=line)
+                return
+            publish(self.request.id, event.pop("type"), **event)
+            # structured events update the stored meta, throttled to spare the backend
+            now = time.monotonic()
+            if now - last_update[0] >= PROGRESS_INTERVAL:
+                last_update[0] = now
+                self.update_state(state="PROGRESS", meta=dict(collector.meta(), logs=logs))
+
+        # Execute the script: in a warm pre-imported interpreter when enabled,
+        # otherwise in a fresh subprocess; output lines are pushed as they arrive
+        with span("run_python_code.execute", warm=WARM_POOL_ENABLED):
+            if WARM_POOL_ENABLED:
+                get_pool().run(filename, job_env, timeout=60, on_line=on_line, cwd=out_dir)
+            else:
+                env = os.environ.copy()
+                # make the repo importable so scripts can use marketdata.columnar.load_prices
+                env["PYTHONPATH"] = os.pathsep.join(p for p in [REPO_ROOT, env.get("PYTHONPATH")] if p)
+                env.update(job_env)
+                env["PYTHONUNBUFFERED"] = "1"  # so print() reaches the pipe line by line
+                stream_subprocess(
+                    ["python", filename],
+                    env=env,
+                    cwd=out_dir,
+                    timeout=60,  # increase if scripts take longer
+                    on_line=on_line,
+                )
         logs.append("Execution finished (subprocess returned).")
 
-        # 1) Try parse "Generated files: [...]" in output
-        files = []
-        for line in decoded_output.splitlines():
-            if "Generated files:" in line:
-                try:
-                    # safely evaluate the list literal
-                    candidate = line.split("Generated files:", 1)[1].strip()
-                    parsed = ast.literal_eval(candidate)
-                    if isinstance(parsed, (list, tuple)):
-                        files = list(parsed)
-                        break
-                except Exception:
-                    # ignore parse errors, fallback to directory scan
-                    pass
-
-        # 2) Fallback: detect new HTML files created
-        if not files:
-            after_html = set([f for f in os.listdir(PLOTS_DIR) if f.endswith(".html")])
-            new_files = sorted(list(after_html - before_html))
-            files = new_files
+        # reported files, or the .html files in the job directory if none were reported
+        with span("run_python_code.discover") as attrs:
+            manifest = write_manifest(os.path.basename(out_dir), collector.files, collector.metrics)
+            files = [entry["path"] for entry in manifest["files"]]
+            attrs["files"] = len(files)
 
         # Finalize logs and return
         logs.append(f"Detected files: {files}")
-        self.update_state(state="SUCCESS", meta={"logs": logs})
+        report(self, "SUCCESS", logs)
         return {
-            "output": decoded_output,
+            "output": collector.text(),
             "file": filename,
             "logs": logs,
-            "files": files
+            "files": files,
+            "metrics": collector.metrics,
+            "manifest": manifest,
         }
 
     except subprocess.CalledProcessError as e:
-        err_out = e.output.decode() if hasattr(e, "output") else str(e)
+        err_out = collector.text() or (e.output or b"").decode(errors="replace")
         logs.append(f"Error during execution: {err_out}")
-        self.update_state(state="FAILURE", meta={"logs": logs})
-        return {"output": err_out, "file": filename, "logs": logs, "files": []}
+        fail(self, logs, err_out)
 
     except subprocess.TimeoutExpired:
         logs.append("Code execution timed out.")
-        self.update_state(state="FAILURE", meta={"logs": logs})
-        return {"output": "Code execution timed out.", "file": filename, "logs": logs, "files": []}
+        fail(self, logs, collector.text() + "\nCode execution timed out.")
+
+
+@app.task(bind=True)
+def run_engine_backtest(self, intent_json: str, data_snapshot: str, trace_id: str = None):
+    """
+    Run a strategy the native engine can express directly on the run's snapshot,
+    without generated code or a subprocess. Returns the same shape as run_python_code.
+    An intent with a "portfolio" entry is backtested as one portfolio with shared capital.
+    An intent rendered from a strategy template (backtest.templates) reuses the files
+    of an earlier run with the same template, params and data when one exists.
+    """
+    logs = ["Running native backtest engine..."]
+    report(self, "PROGRESS", logs)
+    try:
+        prices = load_prices(path=snapshot_env(data_snapshot)["MARKET_DATA_DIR"])
+        intent = json.loads(intent_json)
+        out_dir = job_dir(self.request.id or uuid.uuid4().hex)
+        template = intent.get("template")
+        key = template_key(template["name"], template["params"], prices) if template else None
+        with span("template.cache", template=template and template["name"]) as attrs:
+            cached = reuse_output(key, os.path.basename(out_dir)) if key else None
+            attrs["hit"] = cached is not None
+        if cached:
+            manifest, summary = cached
+            files = [entry["path"] for entry in manifest["files"]]
+            logs.append(f"Reused the output of an identical {template['name']} template run")
+            logs.append(f"Detected files: {files}")
+            report(self, "SUCCESS", logs)
+            return {"output": summary + f"\nGenerated files: {files}", "file": None, "logs": logs,
+                    "files": files, "metrics": manifest["metrics"], "manifest": manifest}
+
+        if intent.get("portfolio"):
+            # all tickers share one pool of capital
+            options = intent["portfolio"] if isinstance(intent["portfolio"], dict) else {}
+            result = run_portfolio(
+                prices, intent,
+                sizing=options.get("sizing", "equal"),
+                rebalance=options.get("rebalance", "signal"),
+                position_size=options.get("position_size"),
+            )
+            metrics = {"Portfolio": result["metrics"]}
+            written = write_portfolio_report(result, out_dir)
+            summary = summarize_portfolio(result)
+        else:
+            results = run_backtest(prices, intent)
+            metrics = {r["ticker"]: r["metrics"] for r in results}
+            written = write_reports(results, out_dir)
+            summary = summarize(results)
+        manifest = write_manifest(os.path.basename(out_dir), written, metrics)
+        if key:
+            remember_output(key, os.path.basename(out_dir), summary)
+        files = [entry["path"] for entry in manifest["files"]]
+        output = summary + f"\nGenerated files: {files}"
+        logs.append(f"Detected files: {files}")
+        report(self, "SUCCESS", logs)
+        return {"output": output, "file": None, "logs": logs, "files": files, "metrics": metrics, "manifest": manifest}
+
+    except Exception as e:
+        logging.exception("Engine backtest failed")
+        logs.append(f"Error during execution: {e}")
+        fail(self, logs, str(e))
+
+
+@app.task(bind=True)
+def run_parameter_sweep(self, intent_json: str, data_snapshot: str, params: dict,
+                        sort_by: str = "Cumulative Return", top: int = 50, trace_id: str = None):
+    """
+    Grid-search parameter ranges for one intent on the run's snapshot.
+    The ranked table is returned under "results".
+    """
+    logs = ["Running parameter sweep..."]
+    report(self, "PROGRESS", logs)
+    try:
+        prices_path = snapshot_env(data_snapshot)["MARKET_DATA_DIR"]
+        results = run_sweep(json.loads(intent_json), params, prices_path, sort_by=sort_by, top=top)
+        logs.append(f"Evaluated {results['combinations']} combinations on {len(results['tickers'])} tickers")
+        report(self, "SUCCESS", logs)
+        return {"output": "\n".join(logs), "file": None, "logs": logs, "files": [], "results": results}
+
+    except Exception as e:
+        logging.exception("Parameter sweep failed")
+        logs.append(f"Error during execution: {e}")
+        fail(self, logs, str(e))
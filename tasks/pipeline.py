@@ -0,0 +1,73 @@
+# pipeline.py
+import logging
+
+from tasks.executor import app, fail, report
+from workflow import STAGE_STATES, execution_signature, plan_batch, plan_query
+
+# Celery task state of a batch while it is being planned
+BATCH_STAGE_STATES = {
+    "interpreter": "INTERPRETING",
+    "fetch": "FETCHING_DATA",
+    "codegen": "GENERATING_CODE",
+}
+
+@app.task(bind=True)
+def run_query_pipeline(self, query: str, trace_id: str = None):
+    """
+    Plan a query (interpreter, ticker lookup, data fetch, codegen, cleaner, validation) off the API
+    event loop, publishing each stage as the task state, then replace this task with
+    the execution task. The execution task keeps this task's id, so callers poll a
+    single job id from submission to the final result. trace_id (from the API
+    request) is bound for the whole run and handed on to the execution task.
+    """
+    logs = []
+
+    def on_stage(stage):
+        logs.append(f"Stage: {stage}")
+        report(self, STAGE_STATES[stage], logs, stage=stage)
+
+    try:
+        state = plan_query(query, on_stage=on_stage)
+        if state.get("error"):
+            raise RuntimeError(state["error"])
+    except Exception as e:
+        logging.exception("Query pipeline failed")
+        logs.append(f"Error during pipeline: {e}")
+        fail(self, logs, str(e))
+
+    raise self.replace(execution_signature(state))
+
+@app.task(bind=True)
+def run_batch_pipeline(self, queries: list, trace_id: str = None):
+    """
+    Plan a batch of queries in one pass (workflow.plan_batch: concurrent interpretation,
+    one shared data fetch) and queue each planned query's execution task, so the
+    executions fan out across workers. The result lists one job per query with its
+    execution task id, or the error that stopped it being planned; the task id is
+    the batch id /api/batch-status aggregates over.
+    """
+    logs = [f"Planning {len(queries)} queries"]
+
+    def on_stage(stage, done, total):
+        logs.append(f"Stage: {stage} ({done}/{total} queries)")
+        report(self, BATCH_STAGE_STATES[stage], logs, stage=stage, progress={"done": done, "total": total})
+
+    try:
+        states = plan_batch(queries, on_stage=on_stage)
+    except Exception as e:
+        logging.exception("Batch pipeline failed")
+        logs.append(f"Error during pipeline: {e}")
+        fail(self, logs, str(e))
+
+    jobs = []
+    for query, state in zip(queries, states):
+        if state.get("error"):
+            jobs.append({"query": query, "task_id": None, "error": state["error"]})
+            continue
+        result = execution_signature(state).apply_async()
+        jobs.append({"query": query, "task_id": result.id, "engine": bool(state.get("use_engine"))})
+
+    queued = sum(1 for job in jobs if job["task_id"])
+    logs.append(f"Queued {queued} of {len(queries)} queries for execution")
+    report(self, "SUCCESS", logs)
+    return {"output": "\n".join(logs), "file": None, "logs": logs, "files": [], "jobs": jobs}
@@ -0,0 +1,185 @@
+# results.py
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+
+# Every job writes into its own directory under RESULTS_DIR and finishes with a
+# manifest.json describing what it produced:
+#   {"job_id", "created", "status", "files": [{"name", "path", "size"}], "metrics": {ticker: {...}}}
+# File paths are relative to PLOTS_DIR so they can be served from /plots/<path>.
+# Produced files are also recorded in an SQLite index for paginated listings, and
+# jobs whose output is fully determined by their inputs (strategy templates) are
+# recorded by cache key so a repeat run copies the earlier job's files.
+# Keep PLOTS_DIR the same folder FastAPI serves via StaticFiles (main.PLOTS_DIR).
+PLOTS_DIR = os.path.abspath(".")
+RESULTS_DIR = os.path.join(PLOTS_DIR, "results")
+RESULTS_DB = os.path.join(RESULTS_DIR, "index.db")
+MANIFEST = "manifest.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_files (
+    job_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    created TEXT NOT NULL,
+    PRIMARY KEY (job_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_result_files_created ON result_files (created DESC, path);
+CREATE TABLE IF NOT EXISTS cached_outputs (
+    key TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    output TEXT,
+    created TEXT NOT NULL
+);
+"""
+
+@contextlib.contextmanager
+def _connect():
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    conn = sqlite3.connect(RESULTS_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        yield conn
+    finally:
+        conn.close()
+
+def job_dir(job_id: str) -> str:
+    """
+    Output directory of one job, created on first use.
+    """
+    path = os.path.join(RESULTS_DIR, job_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _resolve(directory: str, name: str):
+    # names reported by a script may be relative to its output dir or absolute
+    path = os.path.realpath(os.path.join(directory, name))
+    return path if os.path.isfile(path) else None
+
+def result_path(name: str):
+    """
+    Absolute path of a job's output file given its path relative to PLOTS_DIR, or
+    None unless it is an existing file inside a job directory under RESULTS_DIR.
+    """
+    path = os.path.realpath(os.path.join(PLOTS_DIR, name))
+    root = os.path.realpath(RESULTS_DIR)
+    if path.startswith(root + os.sep) and os.path.dirname(path) != root and os.path.isfile(path):
+        return path
+    return None
+
+def write_manifest(job_id: str, files: list, metrics: dict = None, status: str = "SUCCESS") -> dict:
+    """
+    Describe a finished job. Reported files that do not exist are dropped; when the
+    job reported none, the .html files in its directory are used. Returns the manifest.
+    """
+    directory = job_dir(job_id)
+    if not files:
+        files = sorted(f for f in os.listdir(directory) if f.endswith(".html"))
+
+    root = os.path.realpath(PLOTS_DIR)
+    entries = []
+    for name in dict.fromkeys(files):
+        path = _resolve(directory, name)
+        if path is None or not path.startswith(root + os.sep):
+            continue
+        entries.append({
+            "name": os.path.basename(path),
+            "path": os.path.relpath(path, root).replace(os.sep, "/"),
+            "size": os.path.getsize(path),
+        })
+
+    manifest = {
+        "job_id": job_id,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "status": status,
+        "files": entries,
+        "metrics": metrics or {},
+    }
+    tmp = os.path.join(directory, f".{MANIFEST}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, default=str)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO result_files (job_id, name, path, size, created) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, e["name"], e["path"], e["size"], manifest["created"]) for e in entries],
+        )
+    return manifest
+
+def read_manifest(job_id: str):
+    path = os.path.join(RESULTS_DIR, os.path.basename(job_id), MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def list_files(offset: int = 0, limit: int = 50, job_id: str = None) -> dict:
+    """
+    One page of produced files, newest first.
+    """
+    where, args = ("WHERE job_id = ?", [job_id]) if job_id else ("", [])
+    with _connect() as conn:
+        (total,) = conn.execute(f"SELECT COUNT(*) FROM result_files {where}", args).fetchone()
+        rows = conn.execute(
+            f"SELECT job_id, name, path, size, created FROM result_files {where} "
+            "ORDER BY created DESC, path LIMIT ? OFFSET ?",
+            args + [limit, offset],
+        ).fetchall()
+    files = [dict(zip(("job_id", "name", "path", "size", "created"), row)) for row in rows]
+    return {"total": total, "offset": offset, "limit": limit, "files": files}
+
+# -----------------------------
+# Output cache
+# -----------------------------
+def remember_output(key: str, job_id: str, output: str):
+    """
+    Record that job_id holds the output for key; output is the job's text summary.
+    """
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO cached_outputs (key, job_id, output, created) VALUES (?, ?, ?, ?)",
+            (key, job_id, output, datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")),
+        )
+
+def reuse_output(key: str, job_id: str):
+    """
+    Copy the cached output for key into job_id's directory and write its manifest.
+    Returns (manifest, output text), or None when nothing usable is cached.
+    """
+    with _connect() as conn:
+        row = conn.execute("SELECT job_id, output FROM cached_outputs WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    source_id, output = row
+    source = read_manifest(source_id)
+    sources = [os.path.join(PLOTS_DIR, entry["path"]) for entry in (source or {}).get("files", [])]
+    if source is None or source_id == job_id or not all(os.path.isfile(src) for src in sources):
+        # the earlier job's directory was cleaned up
+        with _connect() as conn:
+            conn.execute("DELETE FROM cached_outputs WHERE key = ?", (key,))
+        return None
+
+    directory = job_dir(job_id)
+    for src in sources:
+        _share(src, directory)
+        # compact plots keep a .json figure next to the .html
+        figure = os.path.splitext(src)[0] + ".json"
+        if os.path.isfile(figure):
+            _share(figure, directory)
+    return write_manifest(job_id, [os.path.basename(src) for src in sources], source.get("metrics")), output
+
+def _share(src: str, directory: str):
+    # result files are never modified after the job ends, so a hard link is safe
+    dst = os.path.join(directory, os.path.basename(src))
+    if os.path.exists(dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
@@ -0,0 +1,101 @@
+# script_output.py
+"""
+Structured output protocol between generated scripts and run_python_code.
+
+A script reports progress, per-ticker metrics and produced files by printing
+one line per event:
+
+    @@event {"type": "progress", "ticker": "TCS.NS", "done": 1, "total": 3}
+    @@event {"type": "metrics", "ticker": "TCS.NS", "metrics": {"Cumulative Return": 4.2, ...}}
+    @@event {"type": "files", "files": ["TCS.NS_plot.html"]}
+
+emit() writes such a line; OutputCollector parses the stream line by line on the
+executor side. The legacy "Generated files: [...]" line is still understood.
+"""
+import ast
+import json
+import os
+from collections import deque
+
+EVENT_PREFIX = "@@event "
+OUTPUT_HEAD_LINES = int(os.getenv("OUTPUT_HEAD_LINES", "50"))
+OUTPUT_TAIL_LINES = int(os.getenv("OUTPUT_TAIL_LINES", "400"))
+OUTPUT_MAX_LINE = 2000  # characters kept per line
+
+def emit(event_type: str, **data):
+    """
+    Called from generated scripts: print one structured event line.
+    """
+    print(EVENT_PREFIX + json.dumps(dict(data, type=event_type), default=str), flush=True)
+
+def parse_line(line: str):
+    """
+    The event carried by one output line, or None for plain output.
+    """
+    if line.startswith(EVENT_PREFIX):
+        try:
+            event = json.loads(line[len(EVENT_PREFIX):])
+        except ValueError:
+            return None
+        return event if isinstance(event, dict) and "type" in event else None
+    if "Generated files:" in line:
+        try:
+            files = ast.literal_eval(line.split("Generated files:", 1)[1].strip())
+        except (ValueError, SyntaxError):
+            return None
+        if isinstance(files, (list, tuple)):
+            return {"type": "files", "files": list(files)}
+    return None
+
+class OutputCollector:
+    """
+    Consume script output line by line: keep the first OUTPUT_HEAD_LINES and last
+    OUTPUT_TAIL_LINES lines (so a chatty script cannot bloat the stored result) and
+    fold structured events into progress, metrics and files.
+    """
+    def __init__(self, head: int = OUTPUT_HEAD_LINES, tail: int = OUTPUT_TAIL_LINES):
+        self.head = []
+        self.head_size = head
+        self.tail = deque(maxlen=tail)
+        self.dropped = 0
+        self.progress = None
+        self.metrics = {}
+        self.files = []
+
+    def feed(self, line: str):
+        """
+        Record one line; returns its event (or None) so callers can forward it.
+        """
+        line = line[:OUTPUT_MAX_LINE]
+        if len(self.head) < self.head_size:
+            self.head.append(line)
+        else:
+            if len(self.tail) == self.tail.maxlen:
+                self.dropped += 1
+            self.tail.append(line)
+
+        event = parse_line(line)
+        if event is None:
+            return None
+        if event["type"] == "progress":
+            self.progress = {k: v for k, v in event.items() if k != "type"}
+        elif event["type"] == "metrics" and event.get("ticker") is not None:
+            self.metrics[str(event["ticker"])] = event.get("metrics") or {}
+        elif event["type"] == "files":
+            for name in event.get("files") or []:
+                if name not in self.files:
+                    self.files.append(name)
+        return event
+
+    def text(self) -> str:
+        lines = list(self.head)
+        if self.dropped:
+            lines.append(f"... {self.dropped} lines truncated ...")
+        lines.extend(self.tail)
+        return "\n".join(lines)
+
+    def meta(self) -> dict:
+        """
+        Progress snapshot for the Celery task meta.
+        """
+        return {"progress": self.progress, "metrics": self.metrics, "files": self.files}
@@ -0,0 +1,142 @@
+# warm_worker.py
+"""
+Long-lived interpreter used by tasks.worker_pool.
+
+Imports the heavy libraries generated scripts use once at startup, then runs one
+script per JSON request read from stdin, each in a fresh __main__ namespace. Every
+complete line the script prints is forwarded as {"line"} while it runs, and the job
+ends with one JSON line: {"ok", "output", "rss"}, where "output" is only the last
+OUTPUT_TAIL_LINES lines (the executor already has every line).
+"""
+import contextlib
+import importlib
+import io
+import json
+import os
+import resource
+import sys
+import traceback
+import warnings
+from collections import deque
+
+from tasks.script_output import OUTPUT_MAX_LINE, OUTPUT_TAIL_LINES
+
+PRELOAD = ["numpy", "pandas", "ta", "plotly.graph_objects", "plotly.subplots", "plotly.io"]
+
+def _preload():
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+def _apply_limits():
+    limit_mb = int(os.getenv("WARM_POOL_MEMORY_LIMIT_MB", "0"))
+    if limit_mb > 0:
+        limit = limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux, bytes on macOS; either way a usable high-water mark
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class LineStream(io.TextIOBase):
+    """
+    Stream that hands each completed line to on_line as it is written and keeps
+    only the last OUTPUT_TAIL_LINES lines (for the error of a failed job).
+    """
+    def __init__(self, on_line):
+        super().__init__()
+        self.on_line = on_line
+        self.partial = ""
+        self.tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            self._line(line)
+        return len(text)
+
+    def _line(self, line):
+        self.on_line(line)
+        self.tail.append(line[:OUTPUT_MAX_LINE])
+
+    def flush_partial(self):
+        if self.partial:
+            self._line(self.partial)
+            self.partial = ""
+
+    def getvalue(self) -> str:
+        return "".join(line + "\n" for line in self.tail)
+
+def run_job(job: dict, on_line=lambda line: None) -> dict:
+    path = job["file"]
+    with open(path) as f:
+        code = f.read()
+
+    saved_env = dict(os.environ)
+    saved_path = list(sys.path)
+    saved_argv = sys.argv
+    saved_filters = warnings.filters[:]
+    saved_cwd = os.getcwd()
+
+    os.environ.update(job.get("env") or {})
+    if job.get("cwd"):
+        os.chdir(job["cwd"])
+    sys.argv = [path]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    namespace = {"__name__": "__main__", "__file__": path, "__builtins__": __builtins__}
+
+    buf = LineStream(on_line)
+    ok = True
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            exec(compile(code, path, "exec"), namespace)
+    except SystemExit as e:
+        ok = e.code in (None, 0)
+    except BaseException:
+        buf.write(traceback.format_exc())
+        ok = False
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+        sys.path[:] = saved_path
+        sys.argv = saved_argv
+        warnings.filters[:] = saved_filters
+        os.chdir(saved_cwd)
+        namespace.clear()
+        buf.flush_partial()
+
+    return {"ok": ok, "output": buf.getvalue(), "rss": _rss_bytes()}
+
+def main():
+    # keep a private handle on the real stdout for the protocol and point fd 1 at
+    # stderr, so nothing a script writes at the fd level can corrupt a response
+    proto = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    _apply_limits()
+    _preload()
+    proto.write(json.dumps({"ready": True}) + "\n")
+    proto.flush()
+
+    def send(message):
+        proto.write(json.dumps(message) + "\n")
+        proto.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        send(run_job(json.loads(line), on_line=lambda text: send({"line": text})))
+
+if __name__ == "__main__":
+    main()
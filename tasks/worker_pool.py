@@ -0,0 +1,160 @@
+# worker_pool.py
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+
+from tracing import span
+
+# Pool of pre-started interpreters (tasks/warm_worker.py) with pandas, numpy, ta
+# and plotly already imported. Each Celery worker process owns one pool; a worker
+# is recycled after WARM_POOL_MAX_JOBS jobs, once its RSS passes WARM_POOL_MAX_RSS_MB,
+# or when a job times out or crashes it.
+WARM_POOL_ENABLED = os.getenv("WARM_POOL_ENABLED", "1") == "1"
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "1"))
+WARM_POOL_MAX_JOBS = int(os.getenv("WARM_POOL_MAX_JOBS", "50"))
+WARM_POOL_MAX_RSS_MB = int(os.getenv("WARM_POOL_MAX_RSS_MB", "1024"))
+WARM_POOL_START_TIMEOUT = 120  # seconds to import the preloaded libraries
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LineReader:
+    """
+    Read lines from a pipe with a timeout. Works on the raw fd so data already
+    pulled into a file object's buffer can never hide from select().
+    """
+    def __init__(self, pipe, args=None):
+        self.fd = pipe.fileno()
+        self.args = args
+        self.buffer = b""
+        self.eof = False
+
+    def readline(self, timeout: float) -> bytes:
+        """
+        Next line including its newline; a final unterminated line at EOF, then b"".
+        Raises TimeoutExpired if no full line arrives within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self.buffer and not self.eof:
+            ready, _, _ = select.select([self.fd], [], [], max(0.0, deadline - time.monotonic()))
+            if not ready:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            chunk = os.read(self.fd, 65536)
+            self.eof = not chunk
+            self.buffer += chunk
+        if b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            return line + b"\n"
+        line, self.buffer = self.buffer, b""
+        return line
+
+class WarmWorker:
+    def __init__(self):
+        env = os.environ.copy()
+        env["PYTHONPATH"] = os.pathsep.join(p for p in [REPO_ROOT, env.get("PYTHONPATH")] if p)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", "-m", "tasks.warm_worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            text=True,
+        )
+        self.reader = LineReader(self.proc.stdout, self.proc.args)
+        self.jobs = 0
+        self.rss = 0
+        self.ready = False
+
+    def _read_line(self, timeout: float) -> str:
+        line = self.reader.readline(timeout)
+        if not line:
+            raise subprocess.CalledProcessError(
+                self.proc.poll() or 1, self.proc.args, output=b"Warm worker exited unexpectedly."
+            )
+        return line.decode()
+
+    def wait_ready(self, timeout: float = WARM_POOL_START_TIMEOUT):
+        if not self.ready:
+            json.loads(self._read_line(timeout))
+            self.ready = True
+
+    def run(self, filename: str, env: dict, timeout: float, on_line=None, cwd: str = None) -> dict:
+        deadline = time.monotonic() + timeout
+        self.wait_ready()
+        job = {"file": os.path.abspath(filename), "env": env, "cwd": cwd and os.path.abspath(cwd)}
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        while True:
+            result = json.loads(self._read_line(max(0.0, deadline - time.monotonic())))
+            if "line" not in result:
+                break
+            if on_line:
+                on_line(result["line"])
+        self.jobs += 1
+        self.rss = result.get("rss", 0)
+        return result
+
+    def worn_out(self) -> bool:
+        return self.jobs >= WARM_POOL_MAX_JOBS or self.rss >= WARM_POOL_MAX_RSS_MB * 1024 * 1024
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+class WarmPool:
+    """
+    Run generated scripts in warm interpreters. run() mirrors subprocess.check_output:
+    it returns the combined stdout/stderr as bytes and raises CalledProcessError or
+    TimeoutExpired on failure, so callers can swap it in directly. on_line, if given,
+    is called with each output line while the script runs; cwd is the directory the
+    script runs in.
+    """
+    def __init__(self, size: int = WARM_POOL_SIZE):
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(WarmWorker())
+
+    def run(self, filename: str, env: dict = None, timeout: float = 60, on_line=None, cwd: str = None) -> bytes:
+        worker = self.idle.get()
+        try:
+            # normally instant; covers the interpreter start-up after a recycle
+            with span("run_python_code.spawn", pool="warm"):
+                worker.wait_ready()
+            result = worker.run(filename, env or {}, timeout, on_line, cwd)
+        except (subprocess.TimeoutExpired, subprocess.CalledProcessError, OSError, ValueError):
+            self._replace(worker)
+            raise
+
+        if worker.worn_out():
+            logging.info(f"Recycling warm worker after {worker.jobs} jobs (rss={worker.rss // (1024 * 1024)} MB)")
+            self._replace(worker)
+        else:
+            self.idle.put(worker)
+
+        output = result.get("output", "").encode()
+        if not result.get("ok"):
+            raise subprocess.CalledProcessError(1, [sys.executable, filename], output=output)
+        return output
+
+    def _replace(self, worker: WarmWorker):
+        worker.kill()
+        self.idle.put(WarmWorker())
+
+    def shutdown(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().kill()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> WarmPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WarmPool()
+        return _pool
@@ -0,0 +1,26 @@
+# conftest.py
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the repo is a set of flat modules and namespace packages run from its root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_prices(close, start: str = "2022-01-03") -> pd.DataFrame:
+    """
+    OHLCV frame indexed by business days, built around a close series.
+    """
+    close = np.asarray(close, dtype="float64")
+    index = pd.bdate_range(start, periods=len(close), name="Date")
+    return pd.DataFrame({
+        "Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+        "Volume": np.full(len(close), 1e6),
+    }, index=index)
+
+@pytest.fixture
+def random_walk():
+    rng = np.random.default_rng(7)
+    return make_prices(100 * np.exp(np.cumsum(rng.normal(0, 0.02, 600))))
@@ -0,0 +1,66 @@
+# test_code_validator.py
+import pytest
+
+from agents import code_validator
+from agents.code_validator import static_errors, validate_code
+from marketdata import snapshot
+from conftest import make_prices
+
+GOOD = """
+import pandas as pd
+from marketdata.columnar import load_prices
+from tasks.script_output import emit
+
+prices = load_prices()
+rows = []
+for ticker, df in prices.items():
+    sma = df["Close"].rolling(5).mean()
+    rows.append({"Ticker": ticker, "Last SMA": float(sma.iloc[-1])})
+    emit("metrics", ticker=ticker, metrics=rows[-1])
+print(pd.DataFrame(rows))
+"""
+
+@pytest.fixture
+def data_snapshot(tmp_path, monkeypatch, random_walk):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    df = random_walk.reset_index().assign(Ticker="TEST.NS")
+    df["Date"] = df["Date"].dt.strftime("%Y-%m-%d")
+    return snapshot.create_snapshot(df)
+
+def test_good_script_passes_static_checks():
+    assert static_errors(GOOD) == []
+
+@pytest.mark.parametrize("code,expected", [
+    ("from marketdata.columnar import load_prices\nprices = load_prices(\n", "SyntaxError"),
+    ("import yfinance\nfrom marketdata.columnar import load_prices\nload_prices()", "import of yfinance"),
+    ("import ta\nfrom marketdata.columnar import load_prices\nta.add_all_ta_features(load_prices())",
+     "add_all_ta_features"),
+    ("import pandas as pd\nfrom marketdata.columnar import load_prices\nload_prices()\n"
+     "s = pd.Series([1])\ns.append(pd.Series([2]))", "pd.concat"),
+    ("import pandas as pd\nprint(pd.DataFrame())", "never calls"),
+])
+def test_broken_scripts_are_rejected(code, expected):
+    errors = static_errors(code)
+    assert errors and expected in "\n".join(errors)
+
+def test_list_append_is_allowed():
+    code = "from marketdata.columnar import load_prices\nrows = []\nrows.append(load_prices())"
+    assert static_errors(code) == []
+
+@pytest.mark.parametrize("warm", [False, True])
+def test_dry_run_accepts_a_working_script(data_snapshot, monkeypatch, warm):
+    monkeypatch.setattr(code_validator, "WARM_POOL_ENABLED", warm)
+    assert validate_code(GOOD, data_snapshot) is None
+
+def test_dry_run_returns_the_traceback(data_snapshot, monkeypatch):
+    monkeypatch.setattr(code_validator, "WARM_POOL_ENABLED", False)
+    code = GOOD + "\nheld = (df.index[-1] - df.index[0]).days.days\n"
+    error = validate_code(code, data_snapshot)
+    assert "AttributeError" in error and "days" in error
+    assert "@@event" not in error
+
+def test_dry_run_stops_a_hanging_script(data_snapshot, monkeypatch):
+    monkeypatch.setattr(code_validator, "WARM_POOL_ENABLED", False)
+    monkeypatch.setattr(code_validator, "DRY_RUN_TIMEOUT", 2)
+    error = validate_code(GOOD + "\nwhile True:\n    pass\n", data_snapshot)
+    assert "did not finish within 2s" in error
@@ -0,0 +1,146 @@
+# test_engine.py
+import math
+
+import numpy as np
+import pytest
+
+from backtest.engine import INITIAL_CAPITAL, backtest_ticker, compile_strategy
+from backtest.indicators import compute_indicator
+from conftest import make_prices
+
+def _rising(mask):
+    return mask & ~np.concatenate(([False], mask[:-1]))
+
+def reference_backtest(close, buy_mask, sell_mask, capital=INITIAL_CAPITAL):
+    """
+    The codegen prompt's rules as a plain per-bar loop: signals on the bar a condition
+    turns true, strictly alternating buy -> sell, all-in integer shares, the last
+    unmatched buy dropped.
+    """
+    buys, sells = _rising(buy_mask), _rising(sell_mask)
+    trades, entry = [], None
+    for i in range(len(close)):
+        if entry is None and buys[i] and (not trades or i > trades[-1][1]):
+            entry = i
+        elif entry is not None and sells[i] and i > entry:
+            trades.append((entry, i))
+            entry = None
+
+    cash, shares, equity = float(capital), 0, []
+    actions = {e: "buy" for e, _ in trades}
+    actions.update({x: "sell" for _, x in trades})
+    for i, price in enumerate(close):
+        if actions.get(i) == "buy":
+            shares = int(cash // price)
+            cash -= shares * price
+        elif actions.get(i) == "sell":
+            cash += shares * price
+            shares = 0
+        equity.append(cash + shares * price)
+    return trades, np.array(equity)
+
+def reference_metrics(equity, index):
+    curve = equity / equity[0]
+    days = (index[-1] - index[0]).days
+    rets = np.diff(equity) / equity[:-1]
+    return {
+        "Cumulative Return": (curve[-1] - 1) * 100,
+        "Annualized Return": (curve[-1] ** (365 / days) - 1) * 100,
+        "Volatility": rets.std(ddof=1) * math.sqrt(252) * 100,
+        "Max Drawdown": (1 - curve / np.maximum.accumulate(curve)).max() * 100,
+    }
+
+def _sma_cross_intent(short, long):
+    return {
+        "buy_condition": {"logic": "and", "conditions": [
+            {"indicator": f"SMA_{short}", "operator": ">", "value": f"SMA_{long}"}]},
+        "sell_condition": {"logic": "and", "conditions": [
+            {"indicator": f"SMA_{short}", "operator": "<", "value": f"SMA_{long}"}]},
+    }
+
+@pytest.mark.parametrize("short,long", [(5, 20), (10, 50)])
+def test_sma_crossover_matches_reference_loop(random_walk, short, long):
+    df = random_walk
+    result = backtest_ticker("TEST", df, compile_strategy(_sma_cross_intent(short, long)))
+
+    fast = compute_indicator(df, "sma", {"window": short}).to_numpy()
+    slow = compute_indicator(df, "sma", {"window": long}).to_numpy()
+    with np.errstate(invalid="ignore"):
+        trades, equity = reference_backtest(df["Close"].to_numpy(), fast > slow, fast < slow)
+
+    assert result["trade_count"] == len(trades) > 0
+    assert list(result["trades"]["Buy Date"]) == [df.index[e] for e, _ in trades]
+    assert list(result["trades"]["Sell Date"]) == [df.index[x] for _, x in trades]
+    np.testing.assert_allclose(result["portfolio"].to_numpy(), equity)
+    expected = reference_metrics(equity, df.index)
+    for name, value in expected.items():
+        assert result["metrics"][name] == pytest.approx(value)
+
+@pytest.mark.parametrize("kind,fast,slow", [("SMA", 10, 50), ("EMA", 12, 26)])
+def test_fast_slow_crossover_is_a_moving_average_crossover(random_walk, kind, fast, slow):
+    # "Slow" contains "LOW" but is not a rolling low
+    named = {
+        "buy_condition": {"logic": "and", "conditions": [
+            {"indicator": f"Fast {kind}", "operator": ">", "value": f"Slow {kind}", "fast": fast, "slow": slow}]},
+        "sell_condition": {"logic": "and", "conditions": [
+            {"indicator": f"Fast {kind}", "operator": "<", "value": f"Slow {kind}", "fast": fast, "slow": slow}]},
+    }
+    explicit = {
+        side: {"logic": "and", "conditions": [
+            {"indicator": f"{kind}_{fast}", "operator": op, "value": f"{kind}_{slow}"}]}
+        for side, op in (("buy_condition", ">"), ("sell_condition", "<"))
+    }
+    assert compile_strategy(named) == compile_strategy(explicit)
+    result = backtest_ticker("TEST", random_walk, compile_strategy(named))
+    assert result["trade_count"] == backtest_ticker("TEST", random_walk, compile_strategy(explicit))["trade_count"] > 0
+
+def test_rsi_thresholds_match_reference_loop(random_walk):
+    df = random_walk
+    intent = {
+        "buy_condition": {"logic": "and", "conditions": [{"indicator": "RSI", "operator": "<", "value": 35}]},
+        "sell_condition": {"logic": "or", "conditions": [{"indicator": "RSI", "operator": ">", "value": 65}]},
+    }
+    result = backtest_ticker("TEST", df, compile_strategy(intent))
+    rsi = compute_indicator(df, "rsi", {"window": 14}).to_numpy()
+    with np.errstate(invalid="ignore"):
+        trades, equity = reference_backtest(df["Close"].to_numpy(), rsi < 35, rsi > 65)
+    assert result["trade_count"] == len(trades) > 0
+    np.testing.assert_allclose(result["portfolio"].to_numpy(), equity)
+
+def test_no_trades_gives_zero_metrics(random_walk):
+    intent = {
+        "buy_condition": {"logic": "and", "conditions": [{"indicator": "Price", "operator": "<", "value": 0}]},
+        "sell_condition": {"logic": "and", "conditions": [{"indicator": "Price", "operator": ">", "value": 0}]},
+    }
+    result = backtest_ticker("TEST", random_walk, compile_strategy(intent))
+    assert result["trade_count"] == 0
+    assert all(result["metrics"][k] == 0 for k in ("Cumulative Return", "Max Drawdown", "Volatility"))
+
+# -----------------------------
+# Percent exits
+# -----------------------------
+CLOSES = [100, 105, 111, 108, 95, 89, 90, 120]
+
+def _exit_price(sell: dict) -> float:
+    intent = {
+        "buy_condition": {"logic": "and", "conditions": [{"indicator": "Price", "operator": ">", "value": 0}]},
+        "sell_condition": {"logic": "or", "conditions": [sell]},
+    }
+    result = backtest_ticker("TEST", make_prices(CLOSES), compile_strategy(intent))
+    assert result["trade_count"] == 1
+    return float(result["trades"]["Sell Price"].iloc[0])
+
+@pytest.mark.parametrize("indicator", ["StopLoss", "Stop Loss", "Loss"])
+@pytest.mark.parametrize("operator", [">", "<", ">=", "<="])
+def test_stop_loss_exits_below_entry_whatever_the_operator(indicator, operator):
+    sell = {"indicator": indicator, "operator": operator, "value": 10, "value_type": "percent"}
+    assert _exit_price(sell) == 89
+
+@pytest.mark.parametrize("operator", [">", "<"])
+def test_profit_target_exits_above_entry_whatever_the_operator(operator):
+    sell = {"indicator": "Profit", "operator": operator, "value": 10, "value_type": "percent"}
+    assert _exit_price(sell) == 111
+
+def test_price_percent_uses_the_operator_direction():
+    assert _exit_price({"indicator": "Price", "operator": ">", "value": 15, "value_type": "percent"}) == 120
+    assert _exit_price({"indicator": "Price", "operator": "<", "value": 10, "value_type": "percent"}) == 89
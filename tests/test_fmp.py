@@ -0,0 +1,43 @@
+# test_fmp.py
+import pytest
+import requests
+
+from marketdata import fmp
+
+class _Response:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+BARS = {"historical": [{"date": "2024-01-02", "open": 1, "high": 2, "low": 0.5, "close": 1.5, "volume": 10}]}
+
+def _fmp(responses):
+    # symbol tried -> response (or exception); anything else is FMP's empty answer
+    def get(url, params, timeout=None):
+        answer = responses.get(url.rsplit("/", 1)[-1], _Response(200, {}))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    return get
+
+@pytest.mark.parametrize("fetch", [fmp.fetch_tickers_serial, fmp.fetch_tickers_concurrent])
+def test_failed_requests_are_reported_apart_from_empty_results(monkeypatch, fetch):
+    monkeypatch.setattr(fmp, "fmp_get", _fmp({
+        "AAA.NS": _Response(200, BARS),
+        "BBB.NS": _Response(429, {"error": "limit"}),
+        "CCC": requests.ConnectionError("reset"),
+    }))
+    failed = set()
+    fetched = fetch(["AAA", "BBB", "CCC", "DDD"], "2024-01-01", "2024-01-31", failed=failed)
+    assert list(fetched) == ["AAA"]
+    assert list(fetched["AAA"]["Ticker"]) == ["AAA"]
+    assert failed == {"BBB", "CCC"}  # DDD really has no bars
+
+def test_a_probe_with_data_outweighs_a_failed_one(monkeypatch):
+    monkeypatch.setattr(fmp, "fmp_get", _fmp({"AAA.NS": _Response(500), "AAA": _Response(200, BARS)}))
+    failed = set()
+    assert list(fmp.fetch_tickers_concurrent(["AAA"], "2024-01-01", "2024-01-31", failed=failed)) == ["AAA"]
+    assert not failed
@@ -0,0 +1,31 @@
+# test_local_cleaner.py
+import pytest
+
+from agents.local_cleaner import SyntaxStream
+
+CODE = "import pandas as pd\nrows = []\nfor i in range(3):\n    rows.append(i)\nprint(pd.Series(rows))\n"
+
+def _stream(text: str, chunk: int = 7):
+    stream = SyntaxStream()
+    for i in range(0, len(text), chunk):
+        stream.feed(text[i:i + chunk])
+    return stream.close()
+
+@pytest.mark.parametrize("response", [
+    CODE,
+    "```python\n" + CODE + "```\n",
+    "Here is the script you asked for.\nIt prints the rows.\n```python\n" + CODE + "```\nThat's it!\n",
+    "Sure, here is the script:\n\n" + CODE,
+    CODE + "```\n",
+])
+def test_valid_code_has_no_syntax_error(response):
+    assert _stream(response) is None
+
+@pytest.mark.parametrize("response,line", [
+    ("import pandas as pd\nrows = [\nprint(rows)\nx = 1\n", 2),
+    ("Some prose first.\nAnd more of it.\n```python\nimport os\nif True\n    pass\n```\n", 2),
+    ("```\nimport os\nprint(os.getcwd()\n", 2),
+])
+def test_syntax_error_is_found(response, line):
+    error = _stream(response)
+    assert error is not None and error[0] == line
@@ -0,0 +1,61 @@
+# test_portfolio.py
+import numpy as np
+import pytest
+
+from backtest.engine import INITIAL_CAPITAL
+from backtest.portfolio import run_portfolio
+from conftest import make_prices
+
+INTENT = {
+    "buy_condition": {"logic": "and", "conditions": [{"indicator": "SMA_5", "operator": ">", "value": "SMA_20"}]},
+    "sell_condition": {"logic": "and", "conditions": [{"indicator": "SMA_5", "operator": "<", "value": "SMA_20"}]},
+}
+
+@pytest.fixture
+def universe():
+    # three tickers on different calendars, so some dates have no bar for some tickers
+    rng = np.random.default_rng(11)
+    prices = {}
+    for ticker, start, n in (("AAA", "2022-01-03", 400), ("BBB", "2022-02-01", 380), ("CCC", "2022-01-03", 300)):
+        prices[ticker] = make_prices(50 * (1 + ticker.count("B")) * np.exp(np.cumsum(rng.normal(0, 0.025, n))), start)
+    prices["CCC"] = prices["CCC"].iloc[::2]  # sparser bars
+    return prices
+
+@pytest.mark.parametrize("sizing,rebalance,position_size", [
+    ("equal", "signal", None),
+    ("equal", "daily", None),
+    ("equal", "monthly", None),
+    ("fixed", "weekly", 25.0),
+    ("fixed", "signal", 60.0),
+])
+def test_cash_is_conserved(universe, sizing, rebalance, position_size):
+    result = run_portfolio(universe, INTENT, sizing=sizing, rebalance=rebalance, position_size=position_size)
+    trades, cash, equity = result["trades"], result["cash"], result["equity"]
+    assert len(trades)
+
+    # cash only moves by the value of the shares traded that day
+    flows = (trades["Shares"] * trades["Price"]).groupby(trades["Date"]).sum()
+    spent = flows.reindex(cash.index, fill_value=0.0).cumsum()
+    np.testing.assert_allclose(cash.to_numpy(), INITIAL_CAPITAL - spent.to_numpy(), rtol=0, atol=1e-6)
+    assert (cash >= -1e-6).all()
+
+    # trades happen at real bars, and positions never go short
+    for row in trades.itertuples():
+        assert row.Price == universe[row.Ticker].loc[row.Date, "Close"]
+    positions = trades.pivot_table(index="Date", columns="Ticker", values="Shares", aggfunc="sum").fillna(0).cumsum()
+    assert (positions >= 0).all().all()
+
+    # equity is cash plus the held shares at their last known close
+    closes = {t: df["Close"].reindex(equity.index).ffill().fillna(0.0) for t, df in universe.items()}
+    held = positions.reindex(equity.index).ffill().fillna(0.0)
+    marked = sum(held[t] * closes[t] for t in held.columns)
+    np.testing.assert_allclose(equity.to_numpy(), (cash + marked).to_numpy(), rtol=1e-12)
+
+def test_no_signals_keep_all_cash(universe):
+    intent = {
+        "buy_condition": {"logic": "and", "conditions": [{"indicator": "Price", "operator": "<", "value": 0}]},
+        "sell_condition": {"logic": "and", "conditions": [{"indicator": "Price", "operator": ">", "value": 0}]},
+    }
+    result = run_portfolio(universe, intent)
+    assert result["trades"].empty
+    assert (result["equity"] == INITIAL_CAPITAL).all()
@@ -0,0 +1,37 @@
+# test_results.py
+import os
+
+import pytest
+
+from tasks import results
+
+@pytest.fixture
+def plots_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(results, "PLOTS_DIR", str(tmp_path))
+    monkeypatch.setattr(results, "RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(results, "RESULTS_DB", str(tmp_path / "results" / "index.db"))
+    (tmp_path / ".env").write_text("FMP_API_KEY=secret\n")
+    (tmp_path / "main.py").write_text("")
+    return tmp_path
+
+def test_job_files_are_served(plots_dir):
+    path = os.path.join(results.job_dir("job1"), "AAA_plot.html")
+    open(path, "w").close()
+    manifest = results.write_manifest("job1", ["AAA_plot.html"])
+    assert manifest["files"][0]["path"] == "results/job1/AAA_plot.html"
+    assert results.result_path("results/job1/AAA_plot.html") == os.path.realpath(path)
+
+@pytest.mark.parametrize("name", [
+    ".env",
+    "main.py",
+    "../.env",
+    "results/../.env",
+    "results/job1/../../.env",
+    "results/index.db",
+    "results/job1/missing.html",
+    os.path.abspath(__file__),
+])
+def test_files_outside_job_directories_are_not_served(plots_dir, name):
+    os.makedirs(results.job_dir("job1"), exist_ok=True)
+    results.write_manifest("job1", [])  # creates results/index.db
+    assert results.result_path(name) is None
@@ -0,0 +1,88 @@
+# test_sweep.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import sweep
+from backtest.engine import backtest_many, backtest_ticker, compile_strategy
+from backtest.sweep import MaskCache, apply_params, parameter_grid, run_sweep
+from conftest import make_prices
+from marketdata.columnar import load_prices, write_columnar
+
+INTENT = {
+    "buy_condition": {"logic": "and", "conditions": [{"indicator": "RSI", "operator": "<", "value": 30, "window": 14}]},
+    "sell_condition": {"logic": "and", "conditions": [{"indicator": "RSI", "operator": ">", "value": 70, "window": 14}]},
+}
+PARAMS = {
+    "buy_condition.conditions.0.value": {"start": 25, "stop": 40, "step": 5},
+    "sell_condition.conditions.0.value": [60, 70],
+    "buy_condition.conditions.0.window": [7, 14],
+}
+
+@pytest.fixture
+def prices_path(tmp_path):
+    rng = np.random.default_rng(3)
+    frames = [make_prices(100 * np.exp(np.cumsum(rng.normal(0, 0.02, 400)))).reset_index().assign(Ticker=t)
+              for t in ("AAA", "BBB")]
+    return write_columnar(pd.concat(frames, ignore_index=True), str(tmp_path / "prices"))
+
+def test_grid_expands_ranges():
+    grid = parameter_grid(PARAMS)
+    assert len(grid) == 16
+    assert {c["buy_condition.conditions.0.value"] for c in grid} == {25, 30, 35, 40}
+
+def test_unknown_path_is_rejected():
+    with pytest.raises(ValueError, match="does not exist"):
+        apply_params(INTENT, {"buy_condition.conditions.3.value": 1})
+
+@pytest.fixture
+def always_parallel(monkeypatch):
+    monkeypatch.setattr(sweep, "SWEEP_PARALLEL_MIN", 0)
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_sweep_matches_one_backtest_per_combination(prices_path, always_parallel, workers):
+    result = run_sweep(INTENT, PARAMS, prices_path, top=100, max_workers=workers)
+    assert result["combinations"] == 16 and result["tickers"] == ["AAA", "BBB"]
+    prices = load_prices(path=prices_path)
+    for row in result["by_ticker"]:
+        combo = {path: row[path] for path in PARAMS}
+        expected = backtest_ticker(row["Ticker"], prices[row["Ticker"]], compile_strategy(apply_params(INTENT, combo)))
+        assert row["Trades"] == expected["trade_count"]
+        assert row["Cumulative Return"] == pytest.approx(expected["metrics"]["Cumulative Return"])
+
+def test_serial_and_pooled_sweeps_agree(prices_path, always_parallel):
+    serial = run_sweep(INTENT, PARAMS, prices_path, top=100, max_workers=1)
+    pooled = run_sweep(INTENT, PARAMS, prices_path, top=100, max_workers=4)
+    assert serial["ranked"] == pooled["ranked"]
+
+def test_daemonic_process_runs_in_process(prices_path, always_parallel, monkeypatch):
+    monkeypatch.setattr(sweep.multiprocessing.current_process(), "daemon", True, raising=False)
+    monkeypatch.setattr(sweep, "ProcessPoolExecutor", None)  # would raise if a pool were started
+    result = run_sweep(INTENT, PARAMS, prices_path, top=100, max_workers=4)
+    assert result["combinations"] == 16
+
+def test_percent_exits_match_one_backtest_per_combination(random_walk):
+    # stop-loss/take-profit exits depend on each entry price and leave the vectorized path
+    intents = []
+    for value in (3, 5, 8):
+        intent = apply_params(INTENT, {"buy_condition.conditions.0.value": 40})
+        intent["sell_condition"] = {"logic": "or", "conditions": [
+            {"indicator": "StopLoss", "operator": "<", "value": value, "value_type": "percent"},
+            {"indicator": "RSI", "operator": ">", "value": 65, "window": 14}]}
+        intents.append(intent)
+    strategies = [compile_strategy(i) for i in intents] + [compile_strategy(INTENT)]
+    for strategy, result in zip(strategies, backtest_many("TEST", random_walk, strategies)):
+        expected = backtest_ticker("TEST", random_walk, strategy, summary_only=True)
+        assert result["trade_count"] == expected["trade_count"]
+        assert result["metrics"] == pytest.approx(expected["metrics"])
+
+def test_mask_cache_stays_within_its_budget():
+    cache = MaskCache(max_bytes=3 * 800)
+    cache["__ticker__"] = "AAA"
+    for i in range(10):
+        cache[("mask", i)] = np.zeros(100)  # 800 bytes each
+        assert cache.nbytes <= cache.max_bytes
+    assert list(cache) == ["__ticker__", ("mask", 7), ("mask", 8), ("mask", 9)]
+    cache[("mask", 7)]  # recently used entries survive
+    cache[("mask", 10)] = np.zeros(100)
+    assert ("mask", 7) in cache and ("mask", 8) not in cache
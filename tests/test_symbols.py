@@ -0,0 +1,48 @@
+# test_symbols.py
+import pytest
+import requests
+
+from marketdata.symbols import SymbolIndex
+
+@pytest.fixture
+def index(tmp_path):
+    index = SymbolIndex(db_name=str(tmp_path / "symbols.db"), exchanges=["NSE", "BSE"])
+    index.add([
+        ("Reliance Industries Ltd", "RELIANCE.NS", "NSE", "Reliance Industries Ltd", 0),
+        ("Reliance Industries Ltd", "RELIANCE.BO", "BSE", "Reliance Industries Ltd", 0),
+        ("Tata Consultancy Services", "TCS.NS", "NSE", "Tata Consultancy Services", 0),
+    ])
+    return index
+
+def test_exact_alias_prefers_the_first_exchange(index):
+    assert index.lookup("reliance industries") == "RELIANCE.NS"
+    assert index.lookup("Tata Consultancy Services Limited") == "TCS.NS"
+
+def test_lookup_is_exact_unless_fuzzy(index):
+    assert index.lookup("Reliance Industrie") is None
+    assert index.lookup("Reliance Industrie", fuzzy=True) == "RELIANCE.NS"
+
+def test_found_names_never_use_a_close_alias(index, monkeypatch):
+    searched = []
+
+    def search(name):
+        searched.append(name)
+        index.add([(name, "RELIANCEPOWER.NS", "NSE", "Reliance Power", 0)])
+        return "RELIANCEPOWER.NS"
+
+    monkeypatch.setattr(index, "search", search)
+    assert index.resolve(["Reliance Industrie"]) == {"Reliance Industrie": "RELIANCEPOWER.NS"}
+    assert searched == ["Reliance Industrie"]
+
+def _offline(name):
+    raise requests.ConnectionError("offline")
+
+@pytest.mark.parametrize("search", [lambda name: None, _offline])
+def test_close_alias_is_the_fallback_when_search_finds_nothing(index, monkeypatch, search, capsys):
+    monkeypatch.setattr(index, "search", search)
+    assert index.resolve(["Reliance Industrie"]) == {"Reliance Industrie": "RELIANCE.NS"}
+    assert "close match" in capsys.readouterr().out
+
+def test_unknown_names_stay_unresolved(index, monkeypatch):
+    monkeypatch.setattr(index, "search", lambda name: None)
+    assert index.resolve(["Infosys"]) == {"Infosys": None}
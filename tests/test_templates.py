@@ -0,0 +1,81 @@
+# test_templates.py
+import pytest
+
+from backtest.templates import TEMPLATES, apply_template, has_rules, match_template
+
+def _intent(buy, sell, logic="and", **extra):
+    return dict({
+        "ticker": ["AAPL"], "start_date": "2022-01-01", "end_date": "2023-01-01",
+        "buy_condition": {"logic": logic, "conditions": buy},
+        "sell_condition": {"logic": logic, "conditions": sell},
+    }, **extra)
+
+def _rsi(window=21, buy_below=25, sell_above=75, logic="and"):
+    return _intent(
+        [{"indicator": "RSI", "operator": "<", "value": buy_below, "window": window}],
+        [{"indicator": "RSI", "operator": ">", "value": sell_above, "window": window}],
+        logic=logic,
+    )
+
+@pytest.mark.parametrize("logic", ["and", "or", "OR"])
+def test_rsi_rules_match_with_their_params(logic):
+    assert match_template(_rsi(logic=logic)) == ("rsi", {"window": 21, "buy_below": 25.0, "sell_above": 75.0})
+
+@pytest.mark.parametrize("logic", ["and", "or"])
+def test_macd_rules_match(logic):
+    intent = _intent(
+        [{"indicator": "MACD", "operator": ">", "value": "Signal"}],
+        [{"indicator": "MACD", "operator": "<", "value": "Signal"}],
+        logic=logic,
+    )
+    assert match_template(intent) == ("macd", {})
+
+def test_sma_crossover_matches_its_windows():
+    intent = _intent(
+        [{"indicator": "SMA_10", "operator": ">", "value": "SMA_30"}],
+        [{"indicator": "SMA_10", "operator": "<", "value": "SMA_30"}],
+        logic="or",
+    )
+    assert match_template(intent) == ("sma_crossover", {"short_window": 10, "long_window": 30})
+
+def test_bollinger_matches_its_window():
+    intent = _intent(
+        [{"indicator": "Price", "operator": "<", "value": "Lower Band", "window": 10}],
+        [{"indicator": "Price", "operator": ">", "value": "Upper Band", "window": 10}],
+    )
+    assert match_template(intent) == ("bollinger", {"window": 10})
+
+def test_name_without_rules_gets_the_defaults():
+    intent = {"ticker": ["AAPL"], "strategy": "Golden Cross"}
+    assert not has_rules(intent)
+    assert match_template(intent) == ("sma_crossover", TEMPLATES["sma_crossover"]["defaults"])
+
+@pytest.mark.parametrize("intent", [
+    # two conditions: "or" is not the template's rule
+    _intent(
+        [{"indicator": "RSI", "operator": "<", "value": 30, "window": 14},
+         {"indicator": "MACD", "operator": ">", "value": "Signal"}],
+        [{"indicator": "RSI", "operator": ">", "value": 70, "window": 14}],
+        logic="or",
+    ),
+    # mismatched windows between buy and sell
+    _intent(
+        [{"indicator": "RSI", "operator": "<", "value": 30, "window": 14}],
+        [{"indicator": "RSI", "operator": ">", "value": 70, "window": 21}],
+    ),
+    # a held-for duration is not part of any template
+    _intent(
+        [{"indicator": "RSI", "operator": "<", "value": 30, "window": 14, "duration_days": 3}],
+        [{"indicator": "RSI", "operator": ">", "value": 70, "window": 14}],
+    ),
+    {"ticker": ["AAPL"], "strategy": "Turtle breakout"},
+    dict(_rsi(), portfolio=True),
+])
+def test_other_strategies_do_not_match(intent):
+    assert match_template(intent) is None
+
+def test_apply_template_renders_rules_that_match_again():
+    name, params = match_template(_rsi(logic="or"))
+    rendered = apply_template(_rsi(logic="or"), name, params)
+    assert rendered["template"] == {"name": "rsi", "params": params}
+    assert match_template(rendered) == (name, params)
@@ -0,0 +1,226 @@
+# tracing.py
+"""
+Lightweight tracing and metrics for the query pipeline.
+
+A trace id is bound to the current context (the API request, then the Celery
+tasks it queues); every span() records its duration into a Prometheus histogram
+and writes one structured JSON log line tagged with the trace id:
+
+    {"trace_id": "9f2c...", "span": "fmp.request", "parent": "node.codegen",
+     "duration_ms": 182.4, "status": "ok", "endpoint": "historical-price-full"}
+
+Each process keeps its own counters. With METRICS_BACKEND=redis (the default)
+they are added into one Redis hash whenever flush_metrics() runs - after every
+Celery task and on every /metrics scrape - so the API exposes the totals of all
+workers. METRICS_BACKEND=local keeps them in-process only.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import redis
+
+from redis_client import get_redis
+
+METRICS_BACKEND = os.getenv("METRICS_BACKEND", "redis")
+METRICS_KEY = "pipeline-metrics"
+TRACE_LOG_ENABLED = os.getenv("TRACE_LOG_ENABLED", "1") == "1"
+TRACE_HEADER = "X-Trace-Id"
+
+# histogram buckets in seconds: from a cached SQLite read to a slow LLM completion
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# metric family -> (type, help)
+METRICS = {
+    "pipeline_span_seconds": ("histogram", "Duration of traced pipeline spans."),
+    "pipeline_span_errors_total": ("counter", "Traced spans that raised."),
+    "llm_tokens_total": ("counter", "LLM tokens by stage and kind (input, cached_input, output)."),
+}
+
+# one JSON object per line on stderr, kept out of the root logger's format
+trace_log = logging.getLogger("trace")
+if not trace_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_log.addHandler(_handler)
+    trace_log.setLevel(logging.INFO)
+    trace_log.propagate = False
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+_samples = defaultdict(float)  # everything recorded in this process (local backend)
+_unflushed = defaultdict(float)  # recorded since the last flush (redis backend)
+_samples_lock = threading.Lock()
+
+# -----------------------------
+# Trace context
+# -----------------------------
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+def current_trace_id():
+    return _trace_id.get()
+
+def bind_trace(trace_id: str = None) -> contextvars.Token:
+    """
+    Make trace_id (or a fresh one) the current trace; returns a token for unbind_trace.
+    """
+    return _trace_id.set(trace_id or new_trace_id())
+
+def unbind_trace(token: contextvars.Token):
+    _trace_id.reset(token)
+
+def propagate(fn):
+    """
+    Wrap fn so it runs under the caller's trace and span when called from a
+    worker thread (thread pools do not inherit context variables).
+    """
+    trace_id, parent = _trace_id.get(), _span.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        trace_token, span_token = _trace_id.set(trace_id), _span.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _span.reset(span_token)
+            _trace_id.reset(trace_token)
+    return run
+
+# -----------------------------
+# Spans
+# -----------------------------
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    Time the enclosed block as span `name`. attrs go into the log line only, so
+    they may be high-cardinality (tickers, paths); the metric is labelled by
+    name and status alone. Set more attrs on the yielded dict while the span runs.
+    """
+    parent = _span.get()
+    token = _span.set(name)
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _span.reset(token)
+        record_span(name, time.perf_counter() - start, status, parent=parent, **attrs)
+
+def record_span(name: str, seconds: float, status: str = "ok", parent: str = None, **attrs):
+    """
+    Record a span timed elsewhere (e.g. across Celery signal handlers).
+    """
+    observe(name, seconds, status)
+    if TRACE_LOG_ENABLED:
+        record = {"trace_id": _trace_id.get(), "span": name, "parent": parent,
+                  "duration_ms": round(seconds * 1000, 3), "status": status}
+        record.update(attrs)
+        trace_log.info(json.dumps(record, default=str))
+
+# -----------------------------
+# Metrics
+# -----------------------------
+def _labels(**labels) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped))
+
+def _add(sample: str, value: float):
+    _samples[sample] += value
+    _unflushed[sample] += value
+
+def observe(name: str, seconds: float, status: str = "ok"):
+    """
+    Record one span duration into the histogram.
+    """
+    labels = _labels(span=name, status=status)
+    with _samples_lock:
+        for le in BUCKETS:
+            if seconds <= le:
+                _add(f'pipeline_span_seconds_bucket{{{labels},le="{le}"}}', 1)
+        _add(f'pipeline_span_seconds_bucket{{{labels},le="+Inf"}}', 1)
+        _add(f"pipeline_span_seconds_sum{{{labels}}}", seconds)
+        _add(f"pipeline_span_seconds_count{{{labels}}}", 1)
+        if status == "error":
+            _add(f"pipeline_span_errors_total{{{_labels(span=name)}}}", 1)
+
+def count(family: str, value: float, **labels):
+    """
+    Add value to a counter from METRICS.
+    """
+    with _samples_lock:
+        _add(f"{family}{{{_labels(**labels)}}}", value)
+
+def flush_metrics():
+    """
+    Add this process's new samples into the shared Redis hash. On failure the
+    samples stay queued for the next flush.
+    """
+    if METRICS_BACKEND != "redis":
+        return
+    with _samples_lock:
+        pending = dict(_unflushed)
+        _unflushed.clear()
+    if not pending:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for sample, value in pending.items():
+            pipe.hincrbyfloat(METRICS_KEY, sample, value)
+        pipe.execute()
+    except redis.RedisError:
+        logging.exception("Could not flush metrics")
+        with _samples_lock:
+            for sample, value in pending.items():
+                _unflushed[sample] += value
+
+def _family(sample: str) -> str:
+    name = sample.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+            return name[: -len(suffix)]
+    return name
+
+def _bucket_order(sample: str):
+    # keep each series' buckets in ascending le order, +Inf last
+    if 'le="' not in sample:
+        return (sample, 0.0)
+    head, le = sample.rsplit('le="', 1)
+    le = le.rstrip('"}')
+    return (head, float("inf") if le == "+Inf" else float(le))
+
+def render_metrics() -> str:
+    """
+    All samples in the Prometheus text exposition format.
+    """
+    if METRICS_BACKEND == "redis":
+        flush_metrics()
+        try:
+            samples = {k.decode(): float(v) for k, v in get_redis().hgetall(METRICS_KEY).items()}
+        except redis.RedisError:
+            logging.exception("Could not read metrics")
+            samples = {}
+    else:
+        with _samples_lock:
+            samples = dict(_samples)
+
+    lines, family = [], None
+    for sample in sorted(samples, key=lambda s: (_family(s), _bucket_order(s))):
+        if _family(sample) != family:
+            family = _family(sample)
+            kind, help_text = METRICS.get(family, ("untyped", ""))
+            lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+        value = samples[sample]
+        lines.append(f"{sample} {int(value) if value.is_integer() else value}")
+    return "\n".join(lines) + "\n"
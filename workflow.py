@@ -0,0 +1,367 @@
+# workflow.py
+"""
+The LangGraph planning pipeline: interpret the query, resolve tickers, fetch data
+and generate/clean code. It runs inside the Celery task tasks.pipeline.run_query_pipeline,
+which reports each stage as a task state and then hands off to the execution task.
+
+Only the data depends on the resolved tickers, and code generation only needs the
+intent, so after the interpreter the graph forks into two branches that run in
+parallel and meet in the join node:
+
+    interpreter -+-> ticker_lookup -+-> fetch ------+-> join -> validate <-> repair
+                 +-> prefetch ------+               |
+                 +-> codegen -> code_cleaner -------+
+
+Planning therefore takes about max(lookup + fetch, codegen + cleaning) instead of
+their sum. prefetch speculatively downloads the interpreter's company names that
+the symbol index already knows while ticker_lookup searches for the rest; fetch
+waits for both and, since the price store skips ranges it already holds, only
+downloads what the prefetch did not cover. Code generated for a query whose
+tickers then fail to resolve is discarded.
+Generated code is validated before it is handed to a worker (agents.code_validator:
+static checks and a dry run on a slice of the snapshot); a failing script goes back
+to the LLM with the error, up to VALIDATION_MAX_REPAIRS times, and then fails planning.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+
+import pandas as pd
+from langgraph.graph import StateGraph, END
+
+from agents.interpreter import interpret_query
+from agents.codegen import generate_code
+from agents.code_cleaner import clean_code, repair_code
+from agents.code_validator import validate_code
+from agents.llm_cache import forget
+from agents.ticker_lookup import resolve_ticker
+from marketdata.fmp import fetch_tickers_concurrent, fetch_tickers_serial
+from marketdata.symbols import get_symbol_index
+from marketdata.store import PriceStore
+from marketdata.snapshot import create_snapshot
+from backtest.engine import is_supported
+from backtest.templates import apply_template, match_template
+from tasks.executor import run_python_code, run_engine_backtest
+from tracing import current_trace_id, propagate, span
+
+# durable (Ticker, Date) price store in market_data.db
+price_store = PriceStore()
+
+# concurrent LLM/planning calls per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# LLM repair rounds for generated code that fails validation
+VALIDATION_MAX_REPAIRS = int(os.getenv("VALIDATION_MAX_REPAIRS", "2"))
+
+# Celery task state reported while each node runs
+STAGE_STATES = {
+    "interpreter": "INTERPRETING",
+    "ticker_lookup": "RESOLVING_TICKERS",
+    "fetch": "FETCHING_DATA",
+    "codegen": "GENERATING_CODE",
+    "code_cleaner": "CLEANING_CODE",
+    "validate": "VALIDATING_CODE",
+    "repair": "REPAIRING_CODE",
+}
+
+# -----------------------------
+# Types
+# -----------------------------
+class GraphState(TypedDict):
+    input: str
+    intent: str
+    code: str
+    syntax_error: str  # first syntax error the codegen stream found, if any
+    clean_code: str
+    data_snapshot: str  # directory of this run's read-only price snapshot
+    use_engine: bool  # strategy runs on backtest.engine instead of generated code
+    template: tuple  # (name, params) of the strategy template the intent matched
+    error: str  # set by ticker_lookup when the intent could not be resolved
+    validation_error: str  # why the generated code failed validation, if it did
+    repairs: int  # LLM repair rounds so far
+    cache_keys: list  # LLM cache entries the current code came from
+
+# -----------------------------
+# Utilities
+# -----------------------------
+def get_fmp_stock_data(tickers, start_date: str, end_date: str, concurrent: bool = True) -> pd.DataFrame:
+    """
+    Fetch data for a list or comma-separated string of tickers.
+    Bars come from the persistent price store; only ranges it has not covered yet
+    are downloaded from FMP, so a repeat window does no network I/O.
+    With concurrent=True all tickers (and their suffix probes) are fetched in parallel
+    over a pooled session; concurrent=False keeps the old serial behaviour.
+    Raises RuntimeError if nothing fetched.
+    """
+    # normalize tickers
+    if isinstance(tickers, str):
+        tickers = [t.strip() for t in tickers.split(",")]
+    elif not isinstance(tickers, list):
+        raise ValueError("Tickers must be string or list")
+
+    # only download the date ranges the price store has not seen yet
+    gaps = {}
+    with span("price_store.missing_ranges", tickers=len(tickers)):
+        for tkr in tickers:
+            for gap in price_store.missing_ranges(tkr, start_date, end_date):
+                gaps.setdefault(gap, []).append(tkr)
+
+    fetch = fetch_tickers_concurrent if concurrent else fetch_tickers_serial
+    for (gap_start, gap_end), gap_tickers in gaps.items():
+        failed = set()
+        with span("fmp.fetch", tickers=len(gap_tickers), start=gap_start, end=gap_end):
+            fetched = fetch(gap_tickers, gap_start, gap_end, failed=failed)
+        if fetched:
+            with span("price_store.upsert", tickers=len(fetched)):
+                price_store.upsert(pd.concat(fetched.values(), ignore_index=True), gap_start, gap_end)
+        # tickers we already hold data for simply had no bars in this gap (weekend/holiday);
+        # a failed request proves nothing, so its gap stays open for the next fetch
+        known_empty = [t for t in gap_tickers
+                       if t not in fetched and t not in failed and price_store.covered_ranges(t)]
+        if known_empty:
+            price_store.mark_covered(known_empty, gap_start, gap_end)
+
+    with span("price_store.load", tickers=len(tickers)) as attrs:
+        final_df = price_store.load(tickers, start_date, end_date)
+        attrs["rows"] = len(final_df)
+    for tkr in tickers:
+        if tkr not in set(final_df["Ticker"]):
+            print(f"No data found for {tkr} with any suffix")
+
+    if final_df.empty:
+        raise RuntimeError("No data fetched for any ticker.")
+
+    return final_df
+
+# -----------------------------
+# LangGraph nodes
+# -----------------------------
+def node_interpreter(state):
+    user_input = state["input"]
+    return interpret_query(user_input)
+
+def node_ticker_lookup(state):
+    try:
+        intent_json = state["intent"].replace("```json\n", "").replace("\n```", "")
+        parsed = json.loads(intent_json)
+        ticker_or_company = parsed["ticker"]
+        resolved = resolve_ticker(ticker_or_company)
+        parsed["ticker"] = resolved
+        return {"intent": json.dumps(parsed)}
+    except Exception as e:
+        return {"intent": state.get("intent", ""), "error": str(e)}
+
+def snapshot_data(stock_data: pd.DataFrame) -> dict:
+    # freeze the run's data into a per-run snapshot
+    with span("snapshot.create", rows=len(stock_data)):
+        return {"data_snapshot": create_snapshot(stock_data)}
+
+def node_prefetch(state):
+    # speculative: fetch the names already in the symbol index into the price store,
+    # without waiting for ticker_lookup; writes no state, so a miss or error costs nothing
+    with span("node.prefetch") as attrs:
+        try:
+            parsed = json.loads(state["intent"].replace("```json\n", "").replace("\n```", ""))
+            names = parsed["ticker"] if isinstance(parsed["ticker"], list) else [parsed["ticker"]]
+            index = get_symbol_index()
+            known = [symbol for symbol in (index.lookup(name) for name in names) if symbol]
+            attrs["tickers"] = len(known)
+            if known:
+                get_fmp_stock_data(known, parsed["start_date"], parsed["end_date"])
+        except Exception as e:
+            print(f"Prefetch skipped: {e}")
+    return {}
+
+def node_fetch(state):
+    parsed_query = json.loads(state["intent"])
+    stock_data = get_fmp_stock_data(parsed_query["ticker"], parsed_query["start_date"], parsed_query["end_date"])
+    return snapshot_data(stock_data)
+
+def plan_execution(intent_json: str) -> dict:
+    """
+    Decide from the intent alone how a run executes: a strategy template or the
+    native engine, or else LLM-generated code (still to be cleaned).
+    """
+    # Known strategy templates and anything else the native engine can express skip
+    # LLM codegen and cleaning entirely
+    parsed_query = json.loads(intent_json)
+    template = match_template(parsed_query)
+    if template:
+        return {"use_engine": True, "template": template}
+    if is_supported(parsed_query):
+        return {"use_engine": True}
+    return generate_code(intent_json)
+
+def node_codegen(state):
+    return plan_execution(state["intent"].replace("```json\n", "").replace("\n```", ""))
+
+def node_cleaner(state):
+    cleaned = clean_code(state["code"], state.get("syntax_error"))
+    return dict(cleaned, cache_keys=state.get("cache_keys", []) + cleaned.get("cache_keys", []))
+
+def node_join(state):
+    # the resolved intent, with a matched template's rules rendered into it
+    if state.get("error") or not state.get("template"):
+        return {}
+    return {"intent": json.dumps(apply_template(json.loads(state["intent"]), *state["template"]))}
+
+def node_validate(state):
+    error = validate_code(state["clean_code"], state.get("data_snapshot"))
+    if error:
+        print(f"Generated code failed validation: {error}")
+        # don't serve the same broken code to the next identical query
+        forget(state.get("cache_keys"))
+        if state.get("repairs", 0) >= VALIDATION_MAX_REPAIRS:
+            return {"validation_error": error, "cache_keys": [], "error": f"Generated code failed validation: {error}"}
+        return {"validation_error": error, "cache_keys": []}
+    return {"validation_error": error}
+
+def node_repair(state):
+    repaired = repair_code(state["clean_code"], state["validation_error"])
+    return dict(repaired, repairs=state.get("repairs", 0) + 1)
+
+def after_validation(state) -> str:
+    # back to the LLM while the code fails validation and repairs are left
+    if state.get("validation_error") and not state.get("error"):
+        return "repair"
+    return END
+
+def execution_signature(state):
+    """
+    Celery signature of the task that executes a planned run, carrying the current trace.
+    """
+    trace_id = current_trace_id()
+    if state.get("use_engine"):
+        intent_json = state["intent"].replace("```json\n", "").replace("\n```", "")
+        return run_engine_backtest.s(intent_json, state["data_snapshot"], trace_id=trace_id)
+    # the cleaned code and the snapshot it must read
+    return run_python_code.s(state["clean_code"], state.get("data_snapshot"), trace_id=trace_id)
+
+def _staged(name, node, skip=None):
+    # call the on_stage callback passed in the run config before the node starts,
+    # and time the node as span node.<name>; skip(state) passes the node over
+    def run(state, config=None):
+        if skip and skip(state):
+            return {}
+        on_stage = ((config or {}).get("configurable") or {}).get("on_stage")
+        if on_stage:
+            on_stage(name)
+        with span(f"node.{name}"):
+            return node(state)
+    return run
+
+# -----------------------------
+# Build LangGraph
+# -----------------------------
+builder = StateGraph(GraphState)
+builder.add_node("interpreter", _staged("interpreter", node_interpreter))
+builder.add_node("ticker_lookup", _staged("ticker_lookup", node_ticker_lookup))
+builder.add_node("prefetch", node_prefetch)
+builder.add_node("fetch", _staged("fetch", node_fetch, skip=lambda s: s.get("error")))
+builder.add_node("codegen", _staged("codegen", node_codegen))
+builder.add_node("code_cleaner", _staged("code_cleaner", node_cleaner, skip=lambda s: s.get("use_engine")))
+builder.add_node("join", node_join)
+builder.add_node("validate", _staged("validate", node_validate, skip=lambda s: s.get("error") or s.get("use_engine")))
+builder.add_node("repair", _staged("repair", node_repair))
+
+builder.set_entry_point("interpreter")
+# data branch and code branch run in parallel; join waits for both
+builder.add_edge("interpreter", "ticker_lookup")
+builder.add_edge("interpreter", "prefetch")
+builder.add_edge(["ticker_lookup", "prefetch"], "fetch")
+builder.add_edge("interpreter", "codegen")
+builder.add_edge("codegen", "code_cleaner")
+builder.add_edge(["fetch", "code_cleaner"], "join")
+builder.add_edge("join", "validate")
+builder.add_conditional_edges("validate", after_validation, {"repair": "repair", END: END})
+builder.add_edge("repair", "validate")
+
+planning_app = builder.compile()
+
+def plan_query(query: str, on_stage=None) -> dict:
+    """
+    Run the planning graph for one query; on_stage(name) is called as each node starts.
+    """
+    return planning_app.invoke({"input": query}, config={"configurable": {"on_stage": on_stage}})
+
+# -----------------------------
+# Batch planning
+# -----------------------------
+def _interpret(query: str) -> dict:
+    state = {"input": query}
+    try:
+        state.update(node_interpreter(state))
+        state.update(node_ticker_lookup(state))
+        if not state.get("error"):
+            state["parsed"] = json.loads(state["intent"])
+            if not state["parsed"].get("ticker"):
+                state["error"] = "No tickers could be resolved"
+    except Exception as e:
+        state["error"] = str(e)
+    return state
+
+def fetch_ranges(intents: list) -> dict:
+    """
+    Per-ticker date range covering every intent that uses the ticker, grouped as
+    {(start, end): [tickers]} so tickers needing the same window share one fetch.
+    """
+    ranges = {}
+    for parsed in intents:
+        for tkr in parsed["ticker"]:
+            start, end = ranges.get(tkr, (parsed["start_date"], parsed["end_date"]))
+            ranges[tkr] = (min(start, parsed["start_date"]), max(end, parsed["end_date"]))
+    groups = {}
+    for tkr, window in ranges.items():
+        groups.setdefault(window, []).append(tkr)
+    return groups
+
+def _plan_one(state: dict) -> dict:
+    parsed = state["parsed"]
+    try:
+        stock_data = price_store.load(parsed["ticker"], parsed["start_date"], parsed["end_date"])
+        if stock_data.empty:
+            raise RuntimeError("No data fetched for any ticker.")
+        state.update(snapshot_data(stock_data))
+        state.update(plan_execution(state["intent"]))
+        if not state.get("use_engine"):
+            state.update(node_cleaner(state))
+        state.update(node_join(state))
+        if not state.get("use_engine"):
+            # the graph's validate <-> repair loop
+            state.update(node_validate(state))
+            while after_validation(state) == "repair":
+                state.update(node_repair(state))
+                state.update(node_validate(state))
+    except Exception as e:
+        state["error"] = str(e)
+    return state
+
+def plan_batch(queries: list, on_stage=None, max_workers: int = BATCH_CONCURRENCY) -> list:
+    """
+    Plan many queries together: interpret them concurrently, fetch the union of their
+    tickers and date ranges once into the price store, then snapshot and generate code
+    per query. Returns one planned state per query, in order; a query that could not
+    be planned has "error" set and does not stop the others.
+    on_stage(name, done, total) reports progress.
+    """
+    report = on_stage or (lambda *args: None)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        report("interpreter", 0, len(queries))
+        with span("batch.interpret", queries=len(queries)):
+            states = list(pool.map(propagate(_interpret), queries))
+
+        planned = [s for s in states if not s.get("error")]
+        groups = fetch_ranges([s["parsed"] for s in planned])
+        report("fetch", len(planned), len(queries))
+        with span("batch.fetch", tickers=sum(len(t) for t in groups.values()), windows=len(groups)):
+            for (start, end), tickers in groups.items():
+                try:
+                    get_fmp_stock_data(tickers, start, end)
+                except RuntimeError as e:
+                    # queries whose tickers got no data fail individually below
+                    print(f"Batch fetch {start}..{end} failed: {e}")
+
+        report("codegen", len(planned), len(queries))
+        with span("batch.codegen", queries=len(planned)):
+            list(pool.map(propagate(_plan_one), planned))
+    return states